@@ -0,0 +1,88 @@
+"""
+Measures what ChatAgent.chat_stream adds on top of the model: turns against
+a local fake server streaming at a fixed token rate, compared with reading
+the same stream directly with an OpenAI client. The difference (in time to
+first token and in total) is the app's overhead: saving messages, building
+context, the gateway and router, and the tool loop.
+
+Run with:
+    python -m desktop_aipet.benchmarks.bench_chat [--scale 1.0] [--turns 50] [--rate 200] [--tokens 60]
+"""
+import argparse
+import asyncio
+import json
+import time
+from openai import AsyncOpenAI
+from desktop_aipet.src.agent_core import ChatAgent
+from desktop_aipet.src.fake_llm_server import FakeLLMServer
+from desktop_aipet.benchmarks import datasets
+from desktop_aipet.benchmarks.harness import app_environment, sample_sessions, summarize
+
+async def _timed_stream(chunks):
+    """Consumes an async iterator of text; returns (time to first text, total time)."""
+    start = time.perf_counter()
+    first = None
+    async for text in chunks:
+        if first is None and text:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+async def _direct_chunks(client, message):
+    stream = await client.chat.completions.create(model="fake", messages=[{"role": "user", "content": message}],
+                                                  stream=True)
+    async for chunk in stream:
+        if chunk.choices:
+            yield chunk.choices[0].delta.content or ""
+
+async def run(dataset, turns=50, rate=200, tokens=60, sessions=10):
+    reply = " ".join(["word"] * tokens)
+    async with FakeLLMServer(tokens_per_second=rate, reply=reply) as server:
+        client = AsyncOpenAI(api_key="bench-key", base_url=server.base_url, max_retries=0)
+        direct_ttft, direct_total = [], []
+        try:
+            for i in range(turns):
+                ttft, total = await _timed_stream(_direct_chunks(client, f"direct {i}"))
+                direct_ttft.append(ttft)
+                direct_total.append(total)
+        finally:
+            await client.close()
+
+        async with app_environment(dataset, server.base_url, copy=True):
+            session_ids = await sample_sessions(sessions)
+            agent = ChatAgent()
+            agent_ttft, agent_total = [], []
+            try:
+                for i in range(turns):
+                    await agent.start_session(session_ids[i % len(session_ids)])
+                    ttft, total = await _timed_stream(agent.chat_stream(f"How was turn {i}?"))
+                    agent_ttft.append(ttft)
+                    agent_total.append(total)
+            finally:
+                agent.tool_registry.shutdown()
+
+    direct, app = summarize(direct_total), summarize(agent_total)
+    return {
+        "benchmark": "chat_stream",
+        "turns": turns,
+        "token_rate": rate,
+        "reply_tokens": tokens,
+        "direct_ttft": summarize(direct_ttft),
+        "agent_ttft": summarize(agent_ttft),
+        "direct_total": direct,
+        "agent_total": app,
+        "overhead_p50_ms": round(app["p50_ms"] - direct["p50_ms"], 3),
+        "overhead_p95_ms": round(app["p95_ms"] - direct["p95_ms"], 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0, help="Dataset size relative to the full 1M-message set")
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=200, help="Streamed tokens per second")
+    parser.add_argument("--tokens", type=int, default=60, help="Tokens per reply")
+    args = parser.parse_args()
+    dataset = datasets.ensure(datasets.sizes_for(args.scale))
+    print(json.dumps(asyncio.run(run(dataset, args.turns, args.rate, args.tokens)), indent=2))
+
+if __name__ == "__main__":
+    main()
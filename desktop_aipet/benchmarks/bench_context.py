@@ -0,0 +1,49 @@
+"""
+Measures memory_service.get_context on the synthetic dataset: the first
+build for a session (its window is read from the database) and repeated
+builds once the window is cached.
+
+Run with:
+    python -m desktop_aipet.benchmarks.bench_context [--scale 1.0] [--sessions 200]
+"""
+import argparse
+import asyncio
+import json
+import time
+from desktop_aipet.src import memory_service
+from desktop_aipet.benchmarks import datasets
+from desktop_aipet.benchmarks.harness import app_environment, sample_sessions, summarize
+
+async def run(dataset, sessions=200, repeats=3, seed=0):
+    async with app_environment(dataset):
+        picked = await sample_sessions(sessions, seed)
+
+        cold, warm, sizes = [], [], []
+        for session_id in picked:
+            start = time.perf_counter()
+            context = await memory_service.get_context(session_id)
+            cold.append(time.perf_counter() - start)
+            sizes.append(len(context))
+            for _ in range(repeats):
+                start = time.perf_counter()
+                await memory_service.get_context(session_id)
+                warm.append(time.perf_counter() - start)
+
+    return {
+        "benchmark": "get_context",
+        "sessions": len(picked),
+        "cold": summarize(cold),
+        "warm": summarize(warm),
+        "mean_context_chars": round(sum(sizes) / len(sizes)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0, help="Dataset size relative to the full 1M-message set")
+    parser.add_argument("--sessions", type=int, default=200)
+    args = parser.parse_args()
+    dataset = datasets.ensure(datasets.sizes_for(args.scale))
+    print(json.dumps(asyncio.run(run(dataset, args.sessions)), indent=2))
+
+if __name__ == "__main__":
+    main()
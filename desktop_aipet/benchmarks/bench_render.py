@@ -0,0 +1,161 @@
+"""
+Measures UI-thread time spent rendering a streamed reply in ChatOverlay,
+and, given a dataset, opening a long session and scrolling back through it.
+
+Run with:
+    python -m desktop_aipet.benchmarks.bench_render [--tokens 10000] [--rate 100] [--legacy] [--history-scale 1.0]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from PyQt6.QtWidgets import QApplication, QTextEdit
+from PyQt6.QtGui import QTextCursor
+from desktop_aipet.src.main_window import ChatMessageModel, ChatView, StreamingMessageRenderer, STREAM_FRAME_MS
+from desktop_aipet.src.memory_service import get_session_messages_page
+from desktop_aipet.src.database import get_read_connection
+from desktop_aipet.benchmarks import datasets
+from desktop_aipet.benchmarks.harness import app_environment, summarize
+
+WORDS = ["the ", "pet ", "reminds ", "you ", "about ", "lunch, ", "then ", "naps.\n"]
+
+def format_ai_html(msg):
+    # The bubble markup ChatOverlay used before it moved to a list view.
+    return f"""
+    <table width="100%" border="0" cellpadding="5">
+        <tr>
+            <td align="left">
+                <div style="background-color: #F0F0F0; color: black; padding: 10px; border-radius: 10px;">
+                    {msg}
+                </div>
+            </td>
+            <td width="20%"></td>
+        </tr>
+    </table>
+    """
+
+def token_stream(n):
+    for i in range(n):
+        yield WORDS[i % len(WORDS)]
+
+def bench_streaming(app, tokens, rate):
+    """Chunks arrive at `rate` tokens/s, so each frame flush carries rate * frame / 1000 tokens."""
+    model = ChatMessageModel()
+    view = ChatView()
+    view.setModel(model)
+    view.resize(400, 600)
+    view.show()
+    renderer = StreamingMessageRenderer(model, view)
+    per_frame = max(1, round(rate * STREAM_FRAME_MS / 1000))
+
+    start = time.perf_counter()
+    renderer.start()
+    for i, token in enumerate(token_stream(tokens), start=1):
+        renderer.append(token)
+        if i % per_frame == 0:
+            renderer.flush()
+            # Let the view lay out and paint the frame, as the event loop would.
+            app.processEvents()
+    renderer.finish()
+    app.processEvents()
+    return time.perf_counter() - start, tokens // per_frame
+
+def bench_legacy(app, tokens):
+    """The original approach: re-render the whole reply's HTML in a QTextEdit on every chunk."""
+    history = QTextEdit()
+    history.resize(400, 600)
+    history.show()
+    start = time.perf_counter()
+
+    cursor = history.textCursor()
+    cursor.movePosition(QTextCursor.MoveOperation.End)
+    start_pos = cursor.position()
+    history.append(format_ai_html("..."))
+    text = ""
+    for token in token_stream(tokens):
+        text += token
+        cursor = history.textCursor()
+        cursor.setPosition(start_pos)
+        cursor.movePosition(QTextCursor.MoveOperation.End, QTextCursor.MoveMode.KeepAnchor)
+        cursor.removeSelectedText()
+        cursor.insertHtml(format_ai_html(text))
+        history.moveCursor(QTextCursor.MoveOperation.End)
+        app.processEvents()
+    return time.perf_counter() - start
+
+async def _session_pages(dataset):
+    """The pages of the dataset's longest session, newest first, as the chat view loads them."""
+    async with app_environment(dataset):
+        async with get_read_connection() as db:
+            async with db.execute('SELECT session_id FROM chat_logs GROUP BY session_id '
+                                  'ORDER BY COUNT(*) DESC LIMIT 1') as cursor:
+                session_id = (await cursor.fetchone())[0]
+        pages = []
+        rows, has_more = await get_session_messages_page(session_id)
+        pages.append((rows, has_more))
+        while has_more:
+            rows, has_more = await get_session_messages_page(session_id, before=(rows[0][3], rows[0][0]))
+            pages.append((rows, has_more))
+    return pages
+
+def bench_history(app, pages):
+    """Opens a session at its newest page, then prepends each older page as a scroll-up would."""
+    model = ChatMessageModel()
+    view = ChatView()
+    view.setModel(model)
+    view.resize(400, 600)
+    view.show()
+    samples = []
+    for rows, has_more in pages:
+        start = time.perf_counter()
+        view.keep_position_while(lambda: model.prepend_page(rows, has_more))
+        app.processEvents()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def run_history(dataset):
+    app = QApplication.instance() or QApplication([])
+    pages = asyncio.run(_session_pages(dataset))
+    samples = bench_history(app, pages)
+    return {
+        "benchmark": "chat_overlay_history",
+        "pages": len(pages),
+        "messages": sum(len(rows) for rows, _ in pages),
+        "page": summarize(samples),
+    }
+
+def run(tokens=10000, rate=100, legacy=False):
+    app = QApplication.instance() or QApplication([])
+    elapsed, frames = bench_streaming(app, tokens, rate)
+    results = {
+        "benchmark": "chat_overlay_render",
+        "tokens": tokens,
+        "token_rate": rate,
+        "frames": frames,
+        "ui_seconds": round(elapsed, 4),
+        "ui_ms_per_10k_tokens": round(elapsed * 1000 * 10000 / tokens, 2),
+        "ui_ms_per_frame": round(elapsed * 1000 / max(1, frames), 3),
+    }
+    if legacy:
+        elapsed = bench_legacy(app, tokens)
+        results["legacy_ui_seconds"] = round(elapsed, 4)
+        results["legacy_ui_ms_per_10k_tokens"] = round(elapsed * 1000 * 10000 / tokens, 2)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=10000)
+    parser.add_argument("--rate", type=int, default=100, help="Streamed tokens per second")
+    parser.add_argument("--legacy", action="store_true", help="Also time per-chunk full re-rendering (slow)")
+    parser.add_argument("--history-scale", type=float, default=None,
+                        help="Also time paging through a session of the synthetic dataset at this scale")
+    args = parser.parse_args()
+    print(json.dumps(run(args.tokens, args.rate, args.legacy), indent=2))
+    if args.history_scale is not None:
+        dataset = datasets.ensure(datasets.sizes_for(args.history_scale))
+        print(json.dumps(run_history(dataset), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Measures scheduler startup: init_scheduler loading every pending reminder
+of the synthetic dataset into APScheduler.
+
+Run with:
+    python -m desktop_aipet.benchmarks.bench_scheduler [--scale 1.0] [--repeats 3]
+"""
+import argparse
+import asyncio
+import json
+import time
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+import desktop_aipet.src.scheduler_service as scheduler_service
+from desktop_aipet.benchmarks import datasets
+from desktop_aipet.benchmarks.harness import app_environment, summarize
+
+async def run(dataset, repeats=3):
+    samples = []
+    jobs = 0
+    original = scheduler_service.scheduler
+    async with app_environment(dataset):
+        try:
+            for _ in range(repeats):
+                scheduler_service.scheduler = AsyncIOScheduler()
+                try:
+                    start = time.perf_counter()
+                    await scheduler_service.init_scheduler()
+                    samples.append(time.perf_counter() - start)
+                    jobs = len(scheduler_service.scheduler.get_jobs())
+                finally:
+                    scheduler_service.scheduler.shutdown(wait=False)
+        finally:
+            scheduler_service.scheduler = original
+    return {
+        "benchmark": "init_scheduler",
+        "jobs": jobs,
+        "startup": summarize(samples),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0, help="Dataset size relative to the full 1M-message set")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    dataset = datasets.ensure(datasets.sizes_for(args.scale))
+    print(json.dumps(asyncio.run(run(dataset, args.repeats)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Measures memory_service.update_summaries over the last days of the
+synthetic dataset, against a local fake server answering with a fixed JSON
+summary after a configurable latency. Earlier days are marked as already
+summarized, as they would be in a long-running install.
+
+Run with:
+    python -m desktop_aipet.benchmarks.bench_summary [--scale 1.0] [--days 3] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import json
+import time
+from desktop_aipet.src import memory_service
+from desktop_aipet.src.database import get_db_connection, get_read_connection
+from desktop_aipet.src.fake_llm_server import FakeLLMServer
+from desktop_aipet.benchmarks import datasets
+from desktop_aipet.benchmarks.harness import app_environment
+
+SUMMARY_REPLY = json.dumps({"summary": "A day of chatting about plans.", "key_events": ["lunch at noon"]})
+
+async def _leave_days_pending(days):
+    """Moves the summary high-water mark to just before the last `days` days; returns their message count."""
+    async with get_read_connection() as db:
+        async with db.execute('SELECT DISTINCT day FROM chat_logs ORDER BY day DESC LIMIT ?', (days,)) as cursor:
+            first_pending = (await cursor.fetchall())[-1][0]
+        async with db.execute('SELECT MAX(id) FROM chat_logs WHERE day < ?', (first_pending,)) as cursor:
+            last_done = (await cursor.fetchone())[0] or 0
+        async with db.execute('SELECT COUNT(*) FROM chat_logs WHERE id > ?', (last_done,)) as cursor:
+            pending = (await cursor.fetchone())[0]
+    async with get_db_connection() as db:
+        await db.execute("INSERT INTO daily_summaries (date, summary_text, key_events, last_log_id) "
+                         "VALUES (date(?, '-1 day'), 'Earlier days.', '[]', ?)", (first_pending, last_done))
+        await db.commit()
+    return pending
+
+async def run(dataset, days=3, latency=0.05):
+    async with FakeLLMServer(first_token_delay=latency, reply=SUMMARY_REPLY) as server:
+        async with app_environment(dataset, server.base_url, copy=True):
+            messages = await _leave_days_pending(days)
+            start = time.perf_counter()
+            await memory_service.update_summaries(min_new_messages=1)
+            elapsed = time.perf_counter() - start
+            async with get_read_connection() as db:
+                async with db.execute('SELECT COUNT(*) FROM daily_summaries') as cursor:
+                    summaries = (await cursor.fetchone())[0] - 1
+        requests = len(server.requests)
+    return {
+        "benchmark": "update_summaries",
+        "days": days,
+        "messages": messages,
+        "llm_latency": latency,
+        "llm_requests": requests,
+        "days_summarized": summaries,
+        "seconds": round(elapsed, 4),
+        "messages_per_second": round(messages / elapsed, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0, help="Dataset size relative to the full 1M-message set")
+    parser.add_argument("--days", type=int, default=3, help="Days left to summarize")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds the fake LLM takes per request")
+    args = parser.parse_args()
+    dataset = datasets.ensure(datasets.sizes_for(args.scale))
+    print(json.dumps(asyncio.run(run(dataset, args.days, args.latency)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Synthetic, reproducible databases for the benchmarks.
+
+The full-size dataset has 1M chat_logs rows spread over 10k sessions and a
+year of days, and 100k reminders (half of them pending, in the future).
+Dates are fixed rather than relative to today, so a dataset gives the same
+results whenever it is used. Built databases are cached under
+benchmarks/data/ by size, seed and schema version, so only the first run
+pays for generation.
+"""
+import asyncio
+import datetime
+import os
+import random
+import sqlite3
+from unittest import mock
+import desktop_aipet.src.database as database
+from desktop_aipet.src.database import MIGRATIONS
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+FULL_SIZE = {"chat_logs": 1_000_000, "reminders": 100_000, "sessions": 10_000}
+# Sessions start during the HISTORY_DAYS before HISTORY_END; pending
+# reminders fall in the month after PENDING_FROM (far enough ahead to stay pending).
+HISTORY_END = datetime.datetime(2025, 1, 1)
+HISTORY_DAYS = 365
+PENDING_FROM = datetime.datetime(2099, 1, 1)
+# Rows inserted per executemany call.
+INSERT_BATCH = 20_000
+
+WORDS = ("the pet reminds you about lunch then naps while we talk about music books weather plans "
+         "tomorrow meeting garden coffee train ticket birthday project deadline walk dinner recipe "
+         "movie weekend call mom python code bug fix deploy server memory cache window summary").split()
+
+def sizes_for(scale):
+    return {name: max(1, int(count * scale)) for name, count in FULL_SIZE.items()}
+
+def dataset_path(sizes, seed=0):
+    name = f"bench_{sizes['chat_logs']}_{sizes['reminders']}_{sizes['sessions']}_v{len(MIGRATIONS)}_s{seed}.db"
+    return os.path.join(DATA_DIR, name)
+
+def _sentence(rng, low=4, high=40):
+    return " ".join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+def _session_rows(rng, count, start):
+    for i in range(count):
+        created = start + datetime.timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))
+        yield f"s{i:06d}", f"Chat about {rng.choice(WORDS)}", created.strftime('%Y-%m-%d %H:%M:%S'), 1
+
+def _chat_rows(rng, total, sessions):
+    """Messages in conversation bursts: each session gets a share, a few seconds apart."""
+    per_session = [total // len(sessions)] * len(sessions)
+    for i in range(total - sum(per_session)):
+        per_session[i] += 1
+    for (session_id, _, created, _), count in zip(sessions, per_session):
+        moment = datetime.datetime.fromisoformat(created)
+        for j in range(count):
+            moment += datetime.timedelta(seconds=rng.randint(5, 600))
+            role = 'user' if j % 2 == 0 else 'assistant'
+            yield session_id, role, _sentence(rng), moment.isoformat()
+
+def _reminder_rows(rng, count):
+    for i in range(count):
+        if i % 2 == 0:
+            run_date, status = PENDING_FROM + datetime.timedelta(seconds=rng.randrange(30 * 86400)), 'pending'
+        else:
+            run_date, status = HISTORY_END - datetime.timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400)), 'completed'
+        yield f"Remember to {_sentence(rng, 2, 8)}", run_date.isoformat(), status
+
+def _insert(conn, sql, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= INSERT_BATCH:
+            conn.executemany(sql, batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+
+def build(path, sizes, seed=0):
+    """Creates the database at `path` with the current schema and synthetic rows."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    for stale in (tmp_path, tmp_path + '-wal', tmp_path + '-shm'):
+        if os.path.exists(stale):
+            os.remove(stale)
+    with mock.patch.object(database, 'DB_PATH', tmp_path):
+        asyncio.run(database.init_db())
+
+    rng = random.Random(seed)
+    sessions = list(_session_rows(rng, sizes["sessions"], HISTORY_END - datetime.timedelta(days=HISTORY_DAYS)))
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute('PRAGMA synchronous = OFF')
+        with conn:
+            conn.executemany('INSERT INTO sessions (id, title, created_at, titled) VALUES (?, ?, ?, ?)', sessions)
+            # Chronological ids, as the app would have written them.
+            chats = sorted(_chat_rows(rng, sizes["chat_logs"], sessions), key=lambda row: row[3])
+            _insert(conn, 'INSERT INTO chat_logs (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)', chats)
+            del chats
+            _insert(conn, 'INSERT INTO reminders (message, run_date, status) VALUES (?, ?, ?)',
+                    _reminder_rows(rng, sizes["reminders"]))
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return path
+
+def ensure(sizes, seed=0, rebuild=False):
+    """Returns the path of the cached dataset for `sizes`, building it if needed."""
+    path = dataset_path(sizes, seed)
+    if rebuild or not os.path.exists(path):
+        print(f"Building benchmark dataset {os.path.basename(path)}...")
+        build(path, sizes, seed)
+    return path
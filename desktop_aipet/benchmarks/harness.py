@@ -0,0 +1,96 @@
+"""
+Shared setup for the benchmarks: the app pointed at a dataset (and at a fake
+LLM endpoint), timing statistics, and the metadata stored with results.
+"""
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+from unittest import mock
+import desktop_aipet.src.database as database
+import desktop_aipet.src.memory_service as memory_service
+from desktop_aipet.src.database import get_read_connection
+from desktop_aipet.src.context_builder import ContextBuilder
+from desktop_aipet.src.semantic_memory import SemanticMemory
+from desktop_aipet.src.tracing import percentile
+
+def summarize(samples):
+    """Timing statistics, in milliseconds, of a list of durations in seconds."""
+    return {
+        "n": len(samples),
+        "mean_ms": round(sum(samples) * 1000 / len(samples), 3),
+        "p50_ms": round(percentile(samples, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+@contextlib.asynccontextmanager
+async def app_environment(dataset, llm_base_url=None, copy=False):
+    """
+    Runs the block with the app's database at `dataset` (a scratch copy if
+    `copy`, for benchmarks that write), its config pointing the LLM at
+    llm_base_url, and fresh in-memory caches. The pool and write queue are
+    open inside the block; everything is put back afterwards.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = dataset
+        if copy:
+            db_path = os.path.join(tmp, 'aipet.db')
+            shutil.copyfile(dataset, db_path)
+        config_path = os.path.join(tmp, 'config.json')
+        with open(config_path, 'w') as f:
+            json.dump({"llm": {"api_key": "bench-key", "base_url": llm_base_url or "http://127.0.0.1:9/v1",
+                               "model": "fake", "gateway": {"requests_per_minute": None}},
+                       "pet": {"name": "BenchPet"}}, f)
+
+        patches = [
+            mock.patch.object(database, 'DB_PATH', db_path),
+            mock.patch.object(memory_service, 'CONFIG_PATH', config_path),
+            mock.patch.object(memory_service, '_config_cache', None),
+            mock.patch.object(memory_service, 'context_builder', ContextBuilder()),
+            mock.patch.object(memory_service, 'semantic_memory', SemanticMemory(memory_service.get_embedder)),
+        ]
+        for p in patches:
+            p.start()
+        try:
+            await database.init_db()
+            await database.open_pool()
+            await database.start_write_queue()
+            try:
+                yield db_path
+            finally:
+                await memory_service.title_generator.close()
+                await memory_service.close_llm_client()
+                await database.stop_write_queue()
+                await database.close_pool()
+        finally:
+            for p in reversed(patches):
+                p.stop()
+
+async def sample_sessions(count, seed=0):
+    """A reproducible sample of session ids from the open database."""
+    async with get_read_connection() as db:
+        async with db.execute('SELECT id FROM sessions ORDER BY id') as cursor:
+            session_ids = [row[0] for row in await cursor.fetchall()]
+    return random.Random(seed).sample(session_ids, min(count, len(session_ids)))
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def metadata(**extra):
+    return {
+        "commit": git_commit(),
+        "time": datetime.datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        **extra,
+    }
@@ -0,0 +1,96 @@
+"""
+Runs the benchmark suite and writes the results as JSON, tagged with the
+commit, so runs can be compared across commits.
+
+Run with:
+    python -m desktop_aipet.benchmarks.run [--scale 1.0] [--only context,chat] [--output results.json]
+                                           [--compare baseline.json]
+
+--scale shrinks the synthetic dataset (e.g. 0.01 for a quick run); results
+are only comparable between runs at the same scale.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import sys
+from desktop_aipet.benchmarks import datasets, bench_context, bench_chat, bench_scheduler, bench_summary, bench_render
+from desktop_aipet.benchmarks.harness import metadata
+
+BENCHMARKS = {
+    "context": lambda dataset: asyncio.run(bench_context.run(dataset)),
+    "chat": lambda dataset: asyncio.run(bench_chat.run(dataset)),
+    "scheduler": lambda dataset: asyncio.run(bench_scheduler.run(dataset)),
+    "summary": lambda dataset: asyncio.run(bench_summary.run(dataset)),
+    "render": lambda dataset: bench_render.run(),
+    "history": bench_render.run_history,
+}
+
+# Result fields compared between runs; lower is better for all of them.
+COMPARED_SUFFIXES = ("_ms", "seconds")
+
+def _timings(result, prefix=""):
+    """Flattens the compared numbers of a result into {"path.to.field": value}."""
+    timings = {}
+    for key, value in result.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            timings.update(_timings(value, path + "."))
+        elif isinstance(value, (int, float)) and key.endswith(COMPARED_SUFFIXES):
+            timings[path] = value
+    return timings
+
+def compare(baseline, current):
+    """Lines describing how each timing changed from the baseline run."""
+    lines = []
+    if baseline["meta"].get("dataset") != current["meta"].get("dataset"):
+        lines.append("Warning: the runs used different dataset sizes.")
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        old = _timings(baseline["results"][name])
+        for path, value in _timings(result).items():
+            if path not in old:
+                continue
+            change = (value - old[path]) / old[path] * 100 if old[path] else 0.0
+            lines.append(f"{name}.{path}: {old[path]} -> {value} ({change:+.1f}%)")
+    return lines
+
+def run(names, scale=1.0, rebuild=False):
+    sizes = datasets.sizes_for(scale)
+    results = {}
+    # Progress (ours and the app's) goes to stderr, keeping stdout to the JSON report.
+    with contextlib.redirect_stdout(sys.stderr):
+        dataset = datasets.ensure(sizes, rebuild=rebuild)
+        for name in names:
+            print(f"Running {name}...")
+            results[name] = BENCHMARKS[name](dataset)
+    return {"meta": metadata(scale=scale, dataset=sizes), "results": results}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0, help="Dataset size relative to the full 1M-message set")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help=f"Comma-separated subset of {', '.join(BENCHMARKS)}")
+    parser.add_argument("--output", help="Write the results to this file as well as stdout")
+    parser.add_argument("--compare", help="Results file of an earlier run to compare against")
+    parser.add_argument("--rebuild", action="store_true", help="Regenerate the synthetic dataset")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    report = run(names, args.scale, args.rebuild)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print("\n".join(compare(baseline, report)), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -1,101 +1,289 @@
 import json
 import asyncio
 import datetime
-from .memory_service import get_context, get_llm_client, update_session_title, get_session_messages
+import functools
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from .memory_service import get_context_messages, get_llm_client, record_message, get_config, title_generator
 from .scheduler_service import schedule_reminder
-from .database import get_db_connection
+from .database import enqueue_write
+from .context_builder import PrefixTracker
+from .tool_schema import ToolArgumentError, schema_from_function, compile_validator
+from .mcp_client import MCPClient
+from .tracing import tracer
+
+SYSTEM_PROMPT = "You are a helpful desktop pet assistant."
+
+# Seconds a tool may run before its call is abandoned with an error result.
+DEFAULT_TOOL_TIMEOUT = 30
+# Model round trips with tool results per turn before it must answer in text.
+MAX_TOOL_ITERATIONS = 5
+
+# Where a synchronous tool runs. Coroutine tools always run on the event loop.
+INLINE = "inline"    # directly on the event loop (the GUI thread); only for trivial functions
+THREAD = "thread"    # in a thread pool; the default for blocking I/O
+PROCESS = "process"  # in a process pool, for CPU-heavy work; needs a picklable module-level function
+EXECUTION_MODES = (INLINE, THREAD, PROCESS)
+
+# Worker pool sizes, overridable with the "tools" section of config.json.
+DEFAULT_THREAD_WORKERS = 4
+DEFAULT_PROCESS_WORKERS = 2
+
+class ToolStats:
+    """Call count, failures and wall-clock timing of one tool."""
+    __slots__ = ('calls', 'errors', 'timeouts', 'total_seconds', 'max_seconds')
 
-class ToolRegistry:
     def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds, error=False, timeout=False):
+        self.calls += 1
+        self.errors += error
+        self.timeouts += timeout
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    @property
+    def mean_seconds(self):
+        return self.total_seconds / self.calls if self.calls else 0.0
+
+    def as_dict(self):
+        return {"calls": self.calls, "errors": self.errors, "timeouts": self.timeouts,
+                "mean_seconds": self.mean_seconds, "max_seconds": self.max_seconds}
+
+class ToolRegistry:
+    """
+    Named tools with their schemas. Synchronous tools run in a thread or
+    process pool (per their execution mode) so they never block the event
+    loop; the pools are created on first use. Cancelling execute() cancels a
+    pool job that hasn't started yet; one already running finishes in its
+    worker and its result is dropped.
+    """
+    def __init__(self, thread_workers=DEFAULT_THREAD_WORKERS, process_workers=DEFAULT_PROCESS_WORKERS):
         self.tools = {}
+        self.stats = {}
+        # Bumped whenever the tool set changes; get_schemas() is cached per version.
+        self.schema_version = 0
+        self._schemas = None
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self._thread_pool = None
+        self._process_pool = None
+
+    def register(self, name, func, schema=None, timeout=DEFAULT_TOOL_TIMEOUT, mode=THREAD):
+        """
+        Adds a tool. Without a schema, one is derived from the function's
+        signature, type hints and docstring, and date/datetime parameters are
+        passed as parsed objects. The argument validator is compiled here, once.
+        """
+        if mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode for tool {name}: {mode}")
+        if asyncio.iscoroutinefunction(func):
+            mode = INLINE
+        derived = schema is None
+        if derived:
+            schema = schema_from_function(func, name)
+        validate = compile_validator(schema.get("function", {}).get("parameters"), convert_formats=derived)
+        self.tools[name] = {"func": func, "schema": schema, "validate": validate, "timeout": timeout, "mode": mode}
+        self.stats[name] = ToolStats()
+        self.schema_version += 1
 
-    def register(self, name, func, schema):
-        self.tools[name] = {"func": func, "schema": schema}
+    def unregister(self, name):
+        """Removes a tool; unknown names are ignored."""
+        if self.tools.pop(name, None) is not None:
+            self.stats.pop(name, None)
+            self.schema_version += 1
 
     def get_schemas(self):
-        return [t["schema"] for t in self.tools.values()]
+        if self._schemas is None or self._schemas[0] != self.schema_version:
+            self._schemas = (self.schema_version, [t["schema"] for t in self.tools.values()])
+        return self._schemas[1]
+
+    def get_stats(self):
+        return {name: stats.as_dict() for name, stats in self.stats.items()}
+
+    def _executor(self, mode):
+        if mode == THREAD:
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(self.thread_workers, thread_name_prefix="tool")
+            return self._thread_pool
+        if self._process_pool is None:
+            # spawn, not fork: a forked child would inherit the Qt application state.
+            self._process_pool = ProcessPoolExecutor(self.process_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._process_pool
+
+    async def _run(self, tool, args):
+        func = tool["func"]
+        if asyncio.iscoroutinefunction(func):
+            return await asyncio.wait_for(func(**args), tool["timeout"])
+        if tool["mode"] == INLINE:
+            return func(**args)
+        loop = asyncio.get_running_loop()
+        job = loop.run_in_executor(self._executor(tool["mode"]), functools.partial(func, **args))
+        return await asyncio.wait_for(job, tool["timeout"])
 
     async def execute(self, name, arguments_json):
         if name in self.tools:
+            tool = self.tools[name]
+            start = time.perf_counter()
+            error = timeout = False
             try:
-                # arguments_json is a string (JSON)
-                args = json.loads(arguments_json)
-                func = self.tools[name]["func"]
-                if asyncio.iscoroutinefunction(func):
-                    return await func(**args)
-                else:
-                    return func(**args)
+                args = tool["validate"](arguments_json)
+                return await self._run(tool, args)
+            except ToolArgumentError as e:
+                # Structured, so the model can correct the call.
+                error = True
+                return json.dumps({"error": "invalid_arguments", "tool": name, "details": e.errors})
+            except asyncio.TimeoutError:
+                timeout = True
+                return f"Error executing tool {name}: timed out after {tool['timeout']}s"
             except Exception as e:
+                error = True
                 return f"Error executing tool {name}: {str(e)}"
+            finally:
+                elapsed = time.perf_counter() - start
+                self.stats[name].record(elapsed, error, timeout)
+                tracer.record("tool", elapsed, tool=name, error=error, timeout=timeout)
         return f"Tool {name} not found."
 
-class MCPClient:
-    """Placeholder for MCP Client."""
-    def __init__(self):
-        self.servers = []
+    def shutdown(self):
+        """Stops the worker pools, dropping jobs that haven't started."""
+        for pool in (self._thread_pool, self._process_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._thread_pool = self._process_pool = None
+
+    async def execute_all(self, calls):
+        """
+        Runs (name, arguments_json) calls concurrently and returns their
+        results in order. Each call has its own timeout and error handling,
+        so one failing tool doesn't affect the others.
+        """
+        return await asyncio.gather(*(self.execute(name, args) for name, args in calls))
+
+async def set_reminder(message: str, time_iso: datetime.datetime):
+    """
+    Set a reminder for a specific time.
 
-    def load_config(self, config_path):
+    Args:
+        message: The reminder message.
+        time_iso: ISO 8601 format time (e.g., 2023-10-27T14:30:00).
+    """
+    if time_iso.tzinfo is not None:
+        # Reminders are scheduled in naive local time.
+        time_iso = time_iso.astimezone().replace(tzinfo=None)
+    return await schedule_reminder(message, time_iso.isoformat())
+
+async def _close_stream(stream):
+    """Closes a response stream (and its HTTP connection), ignoring errors."""
+    close = getattr(stream, "close", None) or getattr(stream, "aclose", None)
+    if close is None:
+        return
+    try:
+        await close()
+    except Exception:
         pass
 
 class ChatAgent:
     def __init__(self):
-        self.tool_registry = ToolRegistry()
+        tools_config = get_config().get('tools', {})
+        self.tool_registry = ToolRegistry(
+            thread_workers=tools_config.get('thread_workers', DEFAULT_THREAD_WORKERS),
+            process_workers=tools_config.get('process_workers', DEFAULT_PROCESS_WORKERS)
+        )
         self.mcp_client = MCPClient()
+        self.mcp_client.load_servers(get_config().get('mcpServers', {}))
         self.session_id = None
+        # Running turn task per session; see start_turn
+        self.turns = {}
+        # How much of each prompt repeats the session's previous one (provider cache hits)
+        self.prompt_prefix = {}
         self._register_native_tools()
 
     def _register_native_tools(self):
-        self.tool_registry.register(
-            "set_reminder",
-            schedule_reminder,
-            {
-                "type": "function",
-                "function": {
-                    "name": "set_reminder",
-                    "description": "Set a reminder for a specific time.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "message": {"type": "string", "description": "The reminder message."},
-                            "time_iso": {"type": "string", "description": "ISO 8601 format time (e.g., 2023-10-27T14:30:00)."}
-                        },
-                        "required": ["message", "time_iso"]
-                    }
-                }
-            }
-        )
+        self.tool_registry.register("set_reminder", set_reminder)
 
     async def start_session(self, session_id):
+        # A reply still streaming into the old session is stopped, not left running unseen.
+        if self.session_id is not None and session_id != self.session_id:
+            await self.cancel_turn(self.session_id)
         self.session_id = session_id
 
-    async def chat_stream(self, user_message: str):
-        if not self.session_id:
+    def start_turn(self, user_message, on_chunk=None, on_start=None):
+        """
+        Runs a turn in the current session as a task and returns it; its
+        result is the reply text. A turn already running in the session is
+        cancelled, and the new one starts once that has saved its partial
+        reply. on_start() is called before the first chunk and on_chunk(text)
+        for each one.
+        """
+        session_id = self.session_id
+        previous = self.turns.get(session_id)
+        if previous is not None:
+            previous.cancel()
+        task = asyncio.create_task(self._run_turn(session_id, user_message, on_chunk, on_start, previous))
+        self.turns[session_id] = task
+        task.add_done_callback(functools.partial(self._turn_done, session_id))
+        return task
+
+    def _turn_done(self, session_id, task):
+        if self.turns.get(session_id) is task:
+            del self.turns[session_id]
+
+    async def _run_turn(self, session_id, user_message, on_chunk, on_start, previous):
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        with tracer.turn(session=session_id):
+            if on_start:
+                on_start()
+            reply = ""
+            async for chunk in self.chat_stream(user_message, session_id):
+                reply += chunk
+                if on_chunk:
+                    on_chunk(chunk)
+            return reply
+
+    async def cancel_turn(self, session_id=None):
+        """
+        Cancels the running turn of a session (the current one by default)
+        and waits until its partial reply is saved. Returns whether there
+        was one.
+        """
+        task = self.turns.get(session_id or self.session_id)
+        if task is None:
+            return False
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return True
+
+    async def chat_stream(self, user_message: str, session_id=None):
+        session_id = session_id or self.session_id
+        if not session_id:
             yield "Error: No active session."
             return
 
         # 1. Save User Message
         timestamp = datetime.datetime.now().isoformat()
-        async with get_db_connection() as db:
-            await db.execute('INSERT INTO chat_logs (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)',
-                             (self.session_id, 'user', user_message, timestamp))
-            await db.commit()
+        await enqueue_write('INSERT INTO chat_logs (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)',
+                            (session_id, 'user', user_message, timestamp))
+        record_message(session_id, 'user', user_message, timestamp)
 
-        # 2. Get Context
-        context = await get_context(self.session_id)
+        # 2. Get Context (system prefix + history, ending with the user message)
+        messages = await get_context_messages(session_id, SYSTEM_PROMPT)
 
         # 3. Call LLM
         client, model = await get_llm_client()
 
-        messages = [
-            {"role": "system", "content": f"You are a helpful desktop pet assistant. Context:\n{context}"},
-            {"role": "user", "content": user_message}
-        ]
-
         tool_schemas = self.tool_registry.get_schemas()
 
         response_text = ""
-        tool_calls_accumulated = []
-        tool_calls_data = None
+        tool_calls_list = []  # every tool call of the turn, with its result
+        stream = None
 
         try:
              # Check if key is valid
@@ -103,82 +291,114 @@ class ChatAgent:
                  response_text = "I'm sorry, but I haven't been configured with a valid API key yet."
                  yield response_text
             else:
-                stream = await client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    tools=tool_schemas,
-                    tool_choice="auto",
-                    stream=True
-                )
-
-                async for chunk in stream:
-                    delta = chunk.choices[0].delta
-
-                    # Handle Content
-                    if delta.content:
-                        response_text += delta.content
-                        yield delta.content
-
-                    # Handle Tool Calls (Accumulate)
-                    if delta.tool_calls:
-                        for tc in delta.tool_calls:
-                            if len(tool_calls_accumulated) <= tc.index:
-                                tool_calls_accumulated.append({"name": "", "args": "", "id": ""})
-
-                            if tc.function:
-                                if tc.function.name:
-                                    tool_calls_accumulated[tc.index]["name"] += tc.function.name
-                                if tc.function.arguments:
-                                    tool_calls_accumulated[tc.index]["args"] += tc.function.arguments
-                            if tc.id:
-                                tool_calls_accumulated[tc.index]["id"] = tc.id
-
-                # Process Tool Calls after stream
-                if tool_calls_accumulated:
-                    tool_calls_list = []
-                    for tc in tool_calls_accumulated:
-                         fname = tc["name"]
-                         args = tc["args"]
-
-                         yield f"\n[Executing tool: {fname}...]"
-                         result = await self.tool_registry.execute(fname, args)
-                         yield f" Done]\nResult: {result}\n"
-
-                         tool_calls_list.append({
-                             "name": fname,
-                             "args": args,
-                             "result": str(result)
-                         })
-
-                         response_text += f"\n[Tool {fname} executed: {result}]"
-
-                    tool_calls_data = json.dumps(tool_calls_list)
+                for iteration in range(MAX_TOOL_ITERATIONS + 1):
+                    prefix = self.prompt_prefix.setdefault(session_id, PrefixTracker())
+                    shared, total = prefix.record(messages)
+                    requested = time.perf_counter()
+                    with tracer.span("llm.request", model=model, iteration=iteration, prefix_tokens=shared,
+                                     reuse_ratio=round(shared / total, 3) if total else 0.0):
+                        stream = await client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            tools=tool_schemas,
+                            # Out of iterations: the model has to answer with what it has.
+                            tool_choice="auto" if iteration < MAX_TOOL_ITERATIONS else "none",
+                            stream=True
+                        )
+
+                    step_text = ""
+                    tool_calls_accumulated = []
+                    first_chunk = None
+                    chunk_count = 0  # one token per chunk, near enough
+                    async for chunk in stream:
+                        if not chunk.choices:
+                            continue
+                        if first_chunk is None:
+                            first_chunk = time.perf_counter()
+                            tracer.record("llm.ttft", first_chunk - requested, model=model)
+                        chunk_count += 1
+                        delta = chunk.choices[0].delta
+
+                        # Handle Content
+                        if delta.content:
+                            step_text += delta.content
+                            response_text += delta.content
+                            yield delta.content
+
+                        # Handle Tool Calls (Accumulate)
+                        if delta.tool_calls:
+                            for tc in delta.tool_calls:
+                                while len(tool_calls_accumulated) <= tc.index:
+                                    tool_calls_accumulated.append({"name": "", "args": "", "id": ""})
+
+                                if tc.function:
+                                    if tc.function.name:
+                                        tool_calls_accumulated[tc.index]["name"] += tc.function.name
+                                    if tc.function.arguments:
+                                        tool_calls_accumulated[tc.index]["args"] += tc.function.arguments
+                                if tc.id:
+                                    tool_calls_accumulated[tc.index]["id"] = tc.id
+                    stream = None
+                    if first_chunk is not None:
+                        generating = time.perf_counter() - first_chunk
+                        tracer.record("llm.stream", generating, model=model, chunks=chunk_count,
+                                      tokens_per_second=chunk_count / generating if generating else None)
 
+                    if not tool_calls_accumulated:
+                        break
+
+                    # Run this step's tool calls concurrently and feed the results back.
+                    for i, tc in enumerate(tool_calls_accumulated):
+                        if not tc["id"]:
+                            tc["id"] = f"call_{iteration}_{i}"
+                    names = ", ".join(tc["name"] for tc in tool_calls_accumulated)
+                    status = f"\n[Executing tools: {names}...]\n"
+                    response_text += status
+                    yield status
+
+                    results = await self.tool_registry.execute_all(
+                        [(tc["name"], tc["args"]) for tc in tool_calls_accumulated])
+
+                    messages.append({
+                        "role": "assistant",
+                        "content": step_text or None,
+                        "tool_calls": [
+                            {"id": tc["id"], "type": "function",
+                             "function": {"name": tc["name"], "arguments": tc["args"]}}
+                            for tc in tool_calls_accumulated
+                        ]
+                    })
+                    for tc, result in zip(tool_calls_accumulated, results):
+                        messages.append({"role": "tool", "tool_call_id": tc["id"], "content": str(result)})
+                        tool_calls_list.append({
+                            "name": tc["name"],
+                            "args": tc["args"],
+                            "result": str(result)
+                        })
+
+        except asyncio.CancelledError:
+            # Stopped: drop the upstream stream now so no more tokens are
+            # generated, and keep what was said, marked as cut short.
+            if stream is not None:
+                await _close_stream(stream)
+            if response_text or tool_calls_list:
+                await self._save_reply(session_id, response_text, tool_calls_list, truncated=True)
+            raise
         except Exception as e:
             err_msg = f"Error communicating with LLM: {str(e)}"
             response_text += err_msg
             yield err_msg
 
         # 4. Save Assistant Message
+        await self._save_reply(session_id, response_text, tool_calls_list)
+
+        # 5. Title new sessions in the background so the turn ends with the stream
+        title_generator.request(session_id, user_message)
+
+    async def _save_reply(self, session_id, response_text, tool_calls_list, truncated=False):
+        tool_calls_data = json.dumps(tool_calls_list) if tool_calls_list else None
         timestamp = datetime.datetime.now().isoformat()
-        async with get_db_connection() as db:
-            await db.execute('INSERT INTO chat_logs (session_id, role, content, timestamp, tool_calls) VALUES (?, ?, ?, ?, ?)',
-                             (self.session_id, 'assistant', response_text, timestamp, tool_calls_data))
-            await db.commit()
-
-        # 5. Generate Title if needed (Simple heuristic: if session has 2 messages)
-        msgs = await get_session_messages(self.session_id)
-        if len(msgs) <= 2:
-            # Generate title
-            try:
-                if client.api_key and client.api_key != "YOUR_API_KEY_HERE":
-                    title_response = await client.chat.completions.create(
-                        model=model,
-                        messages=[
-                            {"role": "user", "content": f"Generate a short (3-5 words) title for this conversation based on this message: {user_message}"}
-                        ]
-                    )
-                    title = title_response.choices[0].message.content.strip().strip('"')
-                    await update_session_title(self.session_id, title)
-            except Exception:
-                pass # Ignore title generation errors
+        await enqueue_write('INSERT INTO chat_logs (session_id, role, content, timestamp, tool_calls, truncated) '
+                            'VALUES (?, ?, ?, ?, ?, ?)',
+                            (session_id, 'assistant', response_text, timestamp, tool_calls_data, int(truncated)))
+        record_message(session_id, 'assistant', response_text, timestamp)
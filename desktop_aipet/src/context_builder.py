@@ -0,0 +1,216 @@
+import os
+from collections import OrderedDict, deque
+from .database import get_read_connection, flush_writes
+
+# Token budgets for the two parts of the context.
+HISTORY_TOKEN_BUDGET = 2000
+SUMMARY_TOKEN_BUDGET = 800
+SUMMARY_COUNT = 5
+# When the window overflows it is cut down to this fraction of the budget, so
+# the oldest messages are dropped in chunks and the prompt prefix stays the
+# same for several turns instead of shifting by one message every turn.
+TRIM_TARGET = 0.75
+# Upper bound on rows read when a session's window is first loaded.
+MAX_WINDOW_MESSAGES = 200
+# Number of session windows kept in memory.
+MAX_CACHED_SESSIONS = 8
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap local token estimate: roughly four ASCII characters per token, and
+    one token per non-ASCII character (CJK text tokenizes close to that).
+    """
+    if not text:
+        return 0
+    non_ascii = sum(1 for c in text if ord(c) > 127)
+    return (len(text) - non_ascii + 3) // 4 + non_ascii
+
+class SessionWindow:
+    """The most recent messages of one session that fit in the token budget."""
+    def __init__(self, budget):
+        self.budget = budget
+        self.messages = deque()  # (role, content, timestamp, rendered, tokens)
+        self.tokens = 0
+
+    def append(self, role, content, timestamp, tokenizer):
+        rendered = f"[{timestamp}] {role}: {content}\n"
+        tokens = tokenizer(rendered)
+        self.messages.append((role, content, timestamp, rendered, tokens))
+        self.tokens += tokens
+        self._trim()
+
+    def prepend(self, role, content, timestamp, tokenizer):
+        """Adds an older message in front; returns False once the budget is full."""
+        rendered = f"[{timestamp}] {role}: {content}\n"
+        tokens = tokenizer(rendered)
+        if self.messages and self.tokens + tokens > self.budget:
+            return False
+        self.messages.appendleft((role, content, timestamp, rendered, tokens))
+        self.tokens += tokens
+        return True
+
+    def _trim(self):
+        if self.tokens <= self.budget:
+            return
+        # Always keep the newest message, even if it alone exceeds the budget.
+        target = self.budget * TRIM_TARGET
+        while len(self.messages) > 1 and self.tokens > target:
+            self.tokens -= self.messages.popleft()[4]
+
+    def render(self):
+        return "".join(m[3] for m in self.messages)
+
+class ContextBuilder:
+    """
+    Builds the system context from an in-memory rolling window per session.
+    The database is only read when a session is first seen; after that each
+    turn appends its messages via add_message(). The rendered summaries
+    block is cached until invalidate_summaries() is called.
+    """
+    def __init__(self, tokenizer=estimate_tokens, history_budget=HISTORY_TOKEN_BUDGET,
+                 summary_budget=SUMMARY_TOKEN_BUDGET):
+        self.tokenizer = tokenizer
+        self.history_budget = history_budget
+        self.summary_budget = summary_budget
+        self._windows = OrderedDict()
+        self._summaries_block = None
+
+    def invalidate_summaries(self):
+        self._summaries_block = None
+
+    def forget_session(self, session_id):
+        self._windows.pop(session_id, None)
+
+    def add_message(self, session_id, role, content, timestamp):
+        """Appends a new message to the session's window if it is loaded."""
+        window = self._windows.get(session_id)
+        if window is not None:
+            window.append(role, content, timestamp, self.tokenizer)
+
+    async def get_window(self, session_id):
+        window = self._windows.get(session_id)
+        if window is None:
+            window = await self._load_window(session_id)
+            self._windows[session_id] = window
+            while len(self._windows) > MAX_CACHED_SESSIONS:
+                self._windows.popitem(last=False)
+        else:
+            self._windows.move_to_end(session_id)
+        return window
+
+    async def get_summaries_block(self):
+        if self._summaries_block is None:
+            self._summaries_block = await self._load_summaries_block()
+        return self._summaries_block
+
+    async def build(self, session_id, memories=""):
+        summaries_block = await self.get_summaries_block()
+        window = await self.get_window(session_id)
+
+        parts = ["=== System Context ===\n"]
+        if summaries_block:
+            parts.append("--- Previous Days Summaries ---\n")
+            parts.append(summaries_block)
+        if memories:
+            parts.append("--- Relevant Memories ---\n")
+            parts.append(memories)
+        if window.messages:
+            parts.append("--- Recent Chat History ---\n")
+            parts.append(window.render())
+        return "".join(parts)
+
+    async def build_messages(self, session_id, system_prompt, memories=""):
+        """
+        Returns the chat messages for a request: one system message with the
+        persona and summaries, then the session history as role-tagged turns.
+        Nothing in the system message changes per turn and history is only
+        appended to, so consecutive requests share a long common prefix.
+        Per-turn `memories` go in a second system message just before the
+        latest turn, so they don't break that prefix.
+        """
+        summaries_block = await self.get_summaries_block()
+        window = await self.get_window(session_id)
+
+        system = system_prompt
+        if summaries_block:
+            system += "\n\n--- Previous Days Summaries ---\n" + summaries_block.rstrip("\n")
+        messages = [{"role": "system", "content": system}]
+        messages.extend({"role": role, "content": content} for role, content, _, _, _ in window.messages)
+        if memories:
+            messages.insert(max(len(messages) - 1, 1),
+                            {"role": "system", "content": "--- Relevant Memories ---\n" + memories.rstrip("\n")})
+        return messages
+
+    async def _load_window(self, session_id):
+        window = SessionWindow(self.history_budget)
+        await flush_writes()
+        async with get_read_connection() as db:
+            # Newest first, stopping as soon as the budget is full.
+            async with db.execute('SELECT role, content, timestamp FROM chat_logs WHERE session_id = ? ORDER BY timestamp DESC LIMIT ?',
+                                  (session_id, MAX_WINDOW_MESSAGES)) as cursor:
+                async for role, content, timestamp in cursor:
+                    if not window.prepend(role, content, timestamp, self.tokenizer):
+                        break
+        return window
+
+    async def _load_summaries_block(self):
+        await flush_writes()
+        async with get_read_connection() as db:
+            async with db.execute('SELECT date, summary_text, key_events FROM daily_summaries ORDER BY date DESC LIMIT ?',
+                                  (SUMMARY_COUNT,)) as cursor:
+                summaries = await cursor.fetchall()
+
+        entries = []
+        tokens = 0
+        for date, summary_text, key_events in summaries:
+            entry = f"Date: {date}\nSummary: {summary_text}\nKey Events: {key_events}\n\n"
+            entry_tokens = self.tokenizer(entry)
+            if entries and tokens + entry_tokens > self.summary_budget:
+                break
+            entries.append(entry)
+            tokens += entry_tokens
+        return "".join(entries)
+
+class PrefixTracker:
+    """
+    Measures how many prompt tokens of each request repeat the previous
+    request, i.e. the part provider-side prompt caching is able to reuse.
+    """
+    def __init__(self, tokenizer=estimate_tokens):
+        self.tokenizer = tokenizer
+        self._previous = []
+        self.last_shared_tokens = 0
+        self.last_total_tokens = 0
+        self.shared_tokens = 0
+        self.total_tokens = 0
+
+    def record(self, messages):
+        """Compares messages with the previous request; returns (shared, total) tokens."""
+        current = [(m["role"], m.get("content") or "") for m in messages]
+        shared = 0
+        total = 0
+        diverged = False
+        for i, (role, content) in enumerate(current):
+            tokens = self.tokenizer(content)
+            total += tokens
+            if diverged:
+                continue
+            previous = self._previous[i] if i < len(self._previous) else None
+            if previous == (role, content):
+                shared += tokens
+                continue
+            diverged = True
+            if previous is not None and previous[0] == role:
+                shared += self.tokenizer(os.path.commonprefix([previous[1], content]))
+
+        self._previous = current
+        self.last_shared_tokens = shared
+        self.last_total_tokens = total
+        self.shared_tokens += shared
+        self.total_tokens += total
+        return shared, total
+
+    @property
+    def reuse_ratio(self):
+        """Fraction of all prompt tokens sent so far that repeated the previous request."""
+        return self.shared_tokens / self.total_tokens if self.total_tokens else 0.0
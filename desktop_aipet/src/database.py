@@ -1,54 +1,438 @@
 import aiosqlite
 import os
 import asyncio
+import time
+from contextlib import asynccontextmanager
+from .tracing import tracer
 
 # Define the database path relative to this file
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DB_PATH = os.path.join(BASE_DIR, 'data', 'aipet.db')
 
+# Number of long-lived reader connections kept open next to the writer
+DEFAULT_READERS = 3
+# Write-behind queue bounds: pending statements before producers wait, and
+# statements grouped into a single transaction.
+DEFAULT_WRITE_QUEUE_SIZE = 1000
+DEFAULT_WRITE_BATCH = 200
+
+_pool = None
+_write_queue = None
+
+# Per-connection settings. WAL lets readers (history, reminder manager) proceed
+# while the writer commits, and synchronous=NORMAL is durable enough under WAL.
+CONNECTION_PRAGMAS = [
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -20000",      # ~20 MB page cache
+    "PRAGMA mmap_size = 268435456",    # 256 MB memory-mapped I/O
+    "PRAGMA temp_store = MEMORY",
+]
+
+# Ordered schema migrations. Applying entry N brings the database to
+# PRAGMA user_version N + 1. Each entry is a list of SQL statements or an
+# async callable taking the connection. Only ever append new entries.
+MIGRATIONS = [
+    # 1: initial schema
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS chat_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT,
+            role TEXT,
+            content TEXT,
+            timestamp DATETIME,
+            tool_calls TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS daily_summaries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT UNIQUE,
+            summary_text TEXT,
+            key_events TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message TEXT,
+            run_date DATETIME,
+            status TEXT DEFAULT 'pending',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            title TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ],
+    # 2: indexes for the hot queries. `day` is a generated column so the
+    # daily-summary lookup can use an index instead of date(timestamp).
+    [
+        'CREATE INDEX IF NOT EXISTS idx_chat_logs_session_time ON chat_logs (session_id, timestamp)',
+        'ALTER TABLE chat_logs ADD COLUMN day TEXT GENERATED ALWAYS AS (date(timestamp)) VIRTUAL',
+        'CREATE INDEX IF NOT EXISTS idx_chat_logs_day ON chat_logs (day)',
+        "CREATE INDEX IF NOT EXISTS idx_reminders_pending ON reminders (run_date) WHERE status = 'pending'",
+        'CREATE INDEX IF NOT EXISTS idx_sessions_created_at ON sessions (created_at)',
+    ],
+    # 3: keyset pagination for the session and reminder dialogs
+    [
+        'DROP INDEX IF EXISTS idx_sessions_created_at',
+        'CREATE INDEX IF NOT EXISTS idx_sessions_created_id ON sessions (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_reminders_run_date ON reminders (run_date)',
+        'CREATE INDEX IF NOT EXISTS idx_reminders_status_run_date ON reminders (status, run_date)',
+    ],
+    # 4: high-water mark of the chat_logs rows folded into each day's rolling
+    # summary. Summaries written before this covered their whole day.
+    [
+        'ALTER TABLE daily_summaries ADD COLUMN last_log_id INTEGER NOT NULL DEFAULT 0',
+        'UPDATE daily_summaries SET last_log_id = COALESCE((SELECT MAX(id) FROM chat_logs WHERE chat_logs.day = daily_summaries.date), 0)',
+    ],
+    # 5: full-text search over chat_logs.content, kept in sync by triggers.
+    # Rows that existed before this migration are indexed later in batches
+    # (see backfill_search_index); search_backfill holds the id range still
+    # to do, and the triggers leave rows in that range to the backfill.
+    [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS chat_logs_fts USING fts5(content, content='chat_logs', content_rowid='id')",
+        'CREATE TABLE IF NOT EXISTS search_backfill (indexed_through INTEGER NOT NULL, last_id INTEGER NOT NULL)',
+        'INSERT INTO search_backfill (indexed_through, last_id) SELECT 0, MAX(id) FROM chat_logs HAVING MAX(id) IS NOT NULL',
+        '''
+        CREATE TRIGGER IF NOT EXISTS chat_logs_fts_insert AFTER INSERT ON chat_logs BEGIN
+            INSERT INTO chat_logs_fts (rowid, content) VALUES (new.id, new.content);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS chat_logs_fts_delete AFTER DELETE ON chat_logs
+        WHEN NOT EXISTS (SELECT 1 FROM search_backfill WHERE old.id > indexed_through AND old.id <= last_id)
+        BEGIN
+            INSERT INTO chat_logs_fts (chat_logs_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS chat_logs_fts_update AFTER UPDATE OF content ON chat_logs
+        WHEN NOT EXISTS (SELECT 1 FROM search_backfill WHERE old.id > indexed_through AND old.id <= last_id)
+        BEGIN
+            INSERT INTO chat_logs_fts (chat_logs_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO chat_logs_fts (rowid, content) VALUES (new.id, new.content);
+        END
+        ''',
+    ],
+    # 6: embeddings for semantic memory, as float32 blobs per embedding model
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS message_embeddings (
+            model TEXT NOT NULL,
+            log_id INTEGER NOT NULL,
+            vector BLOB NOT NULL,
+            PRIMARY KEY (model, log_id)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS event_embeddings (
+            model TEXT NOT NULL,
+            event_hash TEXT NOT NULL,
+            date TEXT,
+            event TEXT,
+            vector BLOB NOT NULL,
+            PRIMARY KEY (model, event_hash)
+        ) WITHOUT ROWID
+        ''',
+    ],
+    # 7: content-addressed cache of deterministic LLM responses
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            response BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed_at ON llm_cache (accessed_at)',
+    ],
+    # 8: whether a session has its title, so turns don't count messages to decide
+    [
+        'ALTER TABLE sessions ADD COLUMN titled INTEGER NOT NULL DEFAULT 0',
+        'UPDATE sessions SET titled = 1 WHERE title IS NOT NULL',
+    ],
+    # 9: assistant replies that were stopped before they finished
+    [
+        'ALTER TABLE chat_logs ADD COLUMN truncated INTEGER NOT NULL DEFAULT 0',
+    ],
+]
+
+async def apply_pragmas(db):
+    for pragma in CONNECTION_PRAGMAS:
+        await db.execute(pragma)
+
+async def get_schema_version(db):
+    async with db.execute('PRAGMA user_version') as cursor:
+        row = await cursor.fetchone()
+    return row[0]
+
+async def migrate(db):
+    """
+    Applies every migration newer than the database's user_version, each in
+    its own transaction. Returns the resulting schema version.
+    """
+    version = await get_schema_version(db)
+    for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        await db.execute('BEGIN')
+        try:
+            if callable(migration):
+                await migration(db)
+            else:
+                for statement in migration:
+                    await db.execute(statement)
+            # PRAGMA does not accept bound parameters; target is always an int here.
+            await db.execute(f'PRAGMA user_version = {int(target)}')
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        version = target
+    return version
+
 async def init_db():
-    """Initializes the database with the required tables."""
+    """Initializes the database: enables WAL and brings the schema up to date."""
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
     async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS chat_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT,
-                role TEXT,
-                content TEXT,
-                timestamp DATETIME,
-                tool_calls TEXT
-            )
-        ''')
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS daily_summaries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT UNIQUE,
-                summary_text TEXT,
-                key_events TEXT
-            )
-        ''')
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS reminders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                message TEXT,
-                run_date DATETIME,
-                status TEXT DEFAULT 'pending',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS sessions (
-                id TEXT PRIMARY KEY,
-                title TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        # journal_mode is persistent, so setting it once here covers every connection.
+        await db.execute('PRAGMA journal_mode = WAL')
+        await apply_pragmas(db)
+        await migrate(db)
+
+class ConnectionPool:
+    """
+    Long-lived connections owned by the application: a single writer plus a
+    small set of readers. SQLite only allows one writer at a time, so writes
+    are serialized behind a lock while reads are spread over the readers.
+    """
+    def __init__(self, db_path, readers=DEFAULT_READERS):
+        self.db_path = db_path
+        self.size = readers
+        self._writer = None
+        self._write_lock = None
+        self._idle_readers = None
+        self._readers = []
+
+    async def open(self):
+        self._write_lock = asyncio.Lock()
+        self._idle_readers = asyncio.Queue()
+        self._writer = await aiosqlite.connect(self.db_path)
+        await apply_pragmas(self._writer)
+        for _ in range(self.size):
+            conn = await aiosqlite.connect(self.db_path)
+            await apply_pragmas(conn)
+            self._readers.append(conn)
+            self._idle_readers.put_nowait(conn)
+
+    async def close(self):
+        """Closes every connection, waiting for in-flight writes to finish."""
+        if self._writer is not None:
+            async with self._write_lock:
+                await self._writer.close()
+                self._writer = None
+        for conn in self._readers:
+            await conn.close()
+        self._readers = []
+
+    def terminate(self):
+        """
+        Stops the connection threads without awaiting them. Used when the event
+        loop is no longer running, so the worker threads don't keep the process alive.
+        """
+        for conn in [self._writer] + self._readers:
+            if conn is not None:
+                conn.stop()
+        self._writer = None
+        self._readers = []
+
+    @asynccontextmanager
+    async def writer(self):
+        async with self._write_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+            # A per-call connection would have discarded uncommitted work on close;
+            # keep that behaviour so it doesn't leak into the next writer.
+            if self._writer.in_transaction:
+                await self._writer.rollback()
+
+    @asynccontextmanager
+    async def reader(self):
+        conn = await self._idle_readers.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                await conn.rollback()
+            self._idle_readers.put_nowait(conn)
+
+async def open_pool(readers=DEFAULT_READERS):
+    """Opens the shared connection pool used by get_db_connection/get_read_connection."""
+    global _pool
+    if _pool is None:
+        pool = ConnectionPool(DB_PATH, readers)
+        with tracer.span("db.open", readers=readers):
+            await pool.open()
+        _pool = pool
+    return _pool
+
+async def close_pool():
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        await pool.close()
+
+def terminate_pool():
+    """Synchronous counterpart of close_pool for use after the event loop has stopped."""
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        pool.terminate()
+
+class WriteBehindQueue:
+    """
+    Background writer that groups small INSERT/UPDATE statements into shared
+    transactions, so callers don't wait for a commit per statement. Whatever
+    is queued while a batch commits goes into the next one.
+    """
+    def __init__(self, max_size=DEFAULT_WRITE_QUEUE_SIZE, max_batch=DEFAULT_WRITE_BATCH):
+        self.max_batch = max_batch
+        self._queue = asyncio.Queue(max_size)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Commits everything still queued, then stops the writer task."""
+        await self.flush()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def put(self, sql, params=()):
+        # Waits when the queue is full, pushing back on producers.
+        await self._queue.put((sql, params))
+
+    async def flush(self):
+        """Read barrier: returns once every statement queued before the call is committed."""
+        barrier = asyncio.get_running_loop().create_future()
+        await self._queue.put(barrier)
+        await barrier
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._write(batch)
+
+    async def _write(self, batch):
+        statements = [item for item in batch if not isinstance(item, asyncio.Future)]
+        try:
+            if statements:
+                try:
+                    async with get_db_connection() as db:
+                        for sql, params in statements:
+                            await db.execute(sql, params)
+                        with tracer.span("db.commit", statements=len(statements)):
+                            await db.commit()
+                except Exception as e:
+                    print(f"Error writing batch, retrying statements individually: {e}")
+                    await self._write_each(statements)
+        finally:
+            for item in batch:
+                if isinstance(item, asyncio.Future) and not item.done():
+                    item.set_result(None)
+
+    async def _write_each(self, statements):
+        for sql, params in statements:
+            try:
+                async with get_db_connection() as db:
+                    await db.execute(sql, params)
+                    await db.commit()
+            except Exception as e:
+                print(f"Error writing statement {sql!r}: {e}")
+
+async def start_write_queue(max_size=DEFAULT_WRITE_QUEUE_SIZE, max_batch=DEFAULT_WRITE_BATCH):
+    global _write_queue
+    if _write_queue is None:
+        _write_queue = WriteBehindQueue(max_size, max_batch)
+        _write_queue.start()
+    return _write_queue
+
+async def stop_write_queue():
+    global _write_queue
+    queue, _write_queue = _write_queue, None
+    if queue is not None:
+        await queue.stop()
+
+async def enqueue_write(sql, params=()):
+    """
+    Queues a write for the background writer. Without a running queue the
+    statement is executed and committed immediately.
+    """
+    if _write_queue is not None:
+        await _write_queue.put(sql, params)
+        return
+    async with get_db_connection() as db:
+        await db.execute(sql, params)
         await db.commit()
 
+async def flush_writes():
+    """Waits until queued writes are committed; call before reading data they touch."""
+    if _write_queue is not None:
+        await _write_queue.flush()
+
+@asynccontextmanager
+async def _connect_once():
+    start = time.perf_counter()
+    async with aiosqlite.connect(DB_PATH) as db:
+        await apply_pragmas(db)
+        tracer.record("db.open", time.perf_counter() - start)
+        yield db
+
+@asynccontextmanager
+async def _traced(connection, name):
+    """
+    Records the wait for a connection as db.acquire and the time it is held
+    (the queries run on it) as `name`.
+    """
+    start = time.perf_counter()
+    async with connection as db:
+        acquired = time.perf_counter()
+        tracer.record("db.acquire", acquired - start, use=name)
+        try:
+            yield db
+        finally:
+            tracer.record(name, time.perf_counter() - acquired)
+
 def get_db_path():
     return DB_PATH
 
 def get_db_connection():
-    """Returns a connection context manager to the database."""
-    return aiosqlite.connect(DB_PATH)
+    """
+    Returns a connection context manager for writing to the database.
+    Uses the pooled writer when the pool is open, otherwise a one-off connection.
+    """
+    if _pool is not None:
+        return _traced(_pool.writer(), "db.write")
+    return _traced(_connect_once(), "db.write")
+
+def get_read_connection():
+    """Returns a connection context manager for read-only queries."""
+    if _pool is not None:
+        return _traced(_pool.reader(), "db.read")
+    return _traced(_connect_once(), "db.read")
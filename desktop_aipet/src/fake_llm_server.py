@@ -0,0 +1,172 @@
+"""
+Local stand-in for an OpenAI-compatible endpoint, for tests and benchmarks:
+`python -m desktop_aipet.src.fake_llm_server --port 8765 --tokens-per-second 50`.
+
+Serves POST /v1/chat/completions (streaming or not) and /v1/embeddings.
+Replies echo the last user message unless a fixed reply is set. Latency,
+token rate and failures (e.g. a burst of 429s, or a stream cut short) can
+be scripted.
+"""
+import argparse
+import asyncio
+import json
+import time
+import zlib
+
+def _status_line(status):
+    reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+               500: "Internal Server Error", 503: "Service Unavailable"}
+    return f"HTTP/1.1 {status} {reasons.get(status, 'Error')}\r\n"
+
+class FakeLLMServer:
+    def __init__(self, host="127.0.0.1", port=0, tokens_per_second=None, first_token_delay=0.0, reply=None,
+                 embedding_dim=8):
+        self.host = host
+        self.port = port
+        self.tokens_per_second = tokens_per_second
+        self.first_token_delay = first_token_delay
+        self.reply = reply
+        self.embedding_dim = embedding_dim
+        # Scripted per-request behaviour, consumed in order: extra seconds
+        # before responding, (status, retry_after) failures, and the number
+        # of tokens after which a stream's connection is dropped.
+        self.delays = []
+        self.failures = []
+        self.cuts = []
+        self.requests = []
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def fail_next(self, status, count=1, retry_after=None):
+        self.failures.extend([(status, retry_after)] * count)
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, path, _ = request_line.decode().split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode().partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            payload = json.loads(body) if body else {}
+            self.requests.append((path, payload))
+
+            delay = self.delays.pop(0) if self.delays else 0
+            if delay:
+                await asyncio.sleep(delay)
+            if self.failures:
+                status, retry_after = self.failures.pop(0)
+                extra = {"retry-after": str(retry_after)} if retry_after is not None else {}
+                await self._send_json(writer, {"error": {"message": f"scripted {status}", "type": "fake"}}, status, extra)
+            elif method == "POST" and path.endswith("/chat/completions"):
+                await self._chat(writer, payload)
+            elif method == "POST" and path.endswith("/embeddings"):
+                await self._embeddings(writer, payload)
+            else:
+                await self._send_json(writer, {"error": {"message": f"no route for {path}"}}, 404)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send_json(self, writer, data, status=200, headers=None):
+        body = json.dumps(data).encode()
+        head = _status_line(status) + "Content-Type: application/json\r\nConnection: close\r\n"
+        head += "".join(f"{k}: {v}\r\n" for k, v in (headers or {}).items())
+        writer.write(f"{head}Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    def _reply_tokens(self, payload):
+        text = self.reply
+        if text is None:
+            users = [m.get("content") or "" for m in payload.get("messages", []) if m.get("role") == "user"]
+            text = f"echo: {users[-1] if users else ''}"
+        words = text.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    async def _chat(self, writer, payload):
+        tokens = self._reply_tokens(payload)
+        model = payload.get("model", "fake")
+        if self.first_token_delay:
+            await asyncio.sleep(self.first_token_delay)
+        if not payload.get("stream"):
+            await self._send_json(writer, {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(tokens)}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)}
+            })
+            return
+
+        cut = self.cuts.pop(0) if self.cuts else None
+        writer.write((_status_line(200) + "Content-Type: text/event-stream\r\nConnection: close\r\n\r\n").encode())
+        interval = 1 / self.tokens_per_second if self.tokens_per_second else 0
+        for i, token in enumerate(tokens):
+            if i == cut:
+                return
+            if interval and i:
+                await asyncio.sleep(interval)
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            writer.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await writer.drain()
+        done = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        writer.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode())
+        await writer.drain()
+
+    async def _embeddings(self, writer, payload):
+        inputs = payload.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        data = []
+        for i, text in enumerate(inputs):
+            seed = zlib.crc32(str(text).encode())
+            vector = [((seed >> (j % 24)) & 0xFF) / 255 - 0.5 for j in range(self.embedding_dim)]
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        await self._send_json(writer, {"object": "list", "data": data, "model": payload.get("model", "fake"),
+                                       "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+
+async def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tokens-per-second", type=float, default=None)
+    parser.add_argument("--first-token-delay", type=float, default=0.0)
+    parser.add_argument("--reply", default=None)
+    args = parser.parse_args()
+    server = await FakeLLMServer(args.host, args.port, args.tokens_per_second, args.first_token_delay, args.reply).start()
+    print(f"Fake LLM server listening on {server.base_url}")
+    await asyncio.Future()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
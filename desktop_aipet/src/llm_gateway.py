@@ -0,0 +1,278 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from types import SimpleNamespace
+import openai
+
+# Priority classes; lower values are admitted first.
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Requests in flight at once (streams count until they end), and how many of
+# those slots only interactive requests may use.
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_RESERVED_INTERACTIVE = 1
+# Token bucket: sustained request rate and burst size. None disables it.
+DEFAULT_REQUESTS_PER_MINUTE = 120
+DEFAULT_BURST = 10
+# Retries of 429/5xx/connection errors, with full-jitter exponential backoff.
+DEFAULT_MAX_RETRIES = 4
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 20
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# Seconds a request may take overall, retries included (for a stream: until it starts).
+DEFAULT_DEADLINES = {INTERACTIVE: 60, BACKGROUND: 300}
+
+# Keys of the llm.gateway config section passed to LLMGateway.
+CONFIG_KEYS = ("max_concurrency", "reserved_interactive", "requests_per_minute", "burst",
+               "max_retries", "hedge_after")
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """A request (with its retries) didn't finish within its deadline."""
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, with bursts of up to `capacity`."""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Takes a token and returns 0, or returns the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class Admission:
+    """
+    Hands out request slots in priority order (FIFO within a class), subject
+    to the concurrency limit and the token bucket. The last `reserved` slots
+    are kept for interactive requests.
+    """
+    def __init__(self, max_concurrency, reserved=0, bucket=None):
+        self.max_concurrency = max_concurrency
+        self.reserved = min(reserved, max_concurrency - 1)
+        self.bucket = bucket
+        self.active = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._timer = None
+
+    async def acquire(self, priority):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                self._dispatch()
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            limit = self.max_concurrency if priority == INTERACTIVE else self.max_concurrency - self.reserved
+            if self.active >= limit:
+                return
+            wait = self.bucket.take() if self.bucket else 0
+            if wait:
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(wait, self._on_timer)
+                return
+            heapq.heappop(self._waiters)
+            self.active += 1
+            future.set_result(None)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+class GatewayStream:
+    """A response stream that gives its slot back when it ends or is closed."""
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def _done(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        finally:
+            self._done()
+
+    async def close(self):
+        try:
+            await self._stream.close()
+        finally:
+            self._done()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+class GatewayClient:
+    """
+    Client-shaped view of the gateway for one priority class, usable where an
+    AsyncOpenAI client is (chat.completions.create, embeddings.create). The
+    create calls also accept `deadline` (seconds) and `hedge` overrides.
+    """
+    def __init__(self, gateway, priority):
+        self.gateway = gateway
+        self.priority = priority
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+        self.embeddings = SimpleNamespace(create=self._create_embedding)
+
+    @property
+    def api_key(self):
+        return self.gateway.client.api_key
+
+    async def _create_completion(self, *, deadline=None, hedge=None, **params):
+        client = self.gateway.client
+        return await self.gateway.request(lambda: client.chat.completions.create(**params),
+                                          self.priority, deadline, hedge)
+
+    async def _create_embedding(self, *, deadline=None, **params):
+        client = self.gateway.client
+        return await self.gateway.request(lambda: client.embeddings.create(**params), self.priority, deadline, False)
+
+class LLMGateway:
+    """
+    Sits in front of the LLM client: admits requests by priority class
+    under a concurrency limit and a token-bucket rate limit, retries 429s,
+    5xx and connection errors with exponential backoff and jitter (honouring
+    Retry-After), and enforces a deadline per request. With hedge_after set,
+    an interactive request that hasn't answered by then is sent a second
+    time and the first response wins.
+    """
+    def __init__(self, client, max_concurrency=DEFAULT_MAX_CONCURRENCY, reserved_interactive=DEFAULT_RESERVED_INTERACTIVE,
+                 requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, burst=DEFAULT_BURST, max_retries=DEFAULT_MAX_RETRIES,
+                 hedge_after=None, deadlines=None):
+        self.client = client
+        bucket = TokenBucket(requests_per_minute / 60, burst) if requests_per_minute else None
+        self.admission = Admission(max_concurrency, reserved_interactive, bucket)
+        self.max_retries = max_retries
+        self.hedge_after = hedge_after
+        self.deadlines = {**DEFAULT_DEADLINES, **(deadlines or {})}
+        self.stats = {"requests": 0, "retries": 0, "hedges": 0, "failures": 0}
+        self._views = {}
+
+    def view(self, priority=INTERACTIVE):
+        if priority not in self._views:
+            self._views[priority] = GatewayClient(self, priority)
+        return self._views[priority]
+
+    async def request(self, call, priority=INTERACTIVE, deadline=None, hedge=None):
+        """Runs call() (one API request) under the gateway's policies and returns its result."""
+        if hedge is None:
+            hedge = priority == INTERACTIVE
+        deadline = deadline or self.deadlines[priority]
+        self.stats["requests"] += 1
+        try:
+            return await asyncio.wait_for(self._with_retries(call, priority, hedge), deadline)
+        except asyncio.TimeoutError:
+            self.stats["failures"] += 1
+            raise DeadlineExceeded(f"LLM request exceeded its {deadline}s deadline")
+        except Exception:
+            self.stats["failures"] += 1
+            raise
+
+    async def _with_retries(self, call, priority, hedge):
+        for attempt in itertools.count():
+            try:
+                return await self._attempt(call, priority, hedge)
+            except Exception as e:
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+
+    def retry_delay(self, error, attempt):
+        """Seconds to wait before retrying after `error`, or None if it shouldn't be retried."""
+        if attempt >= self.max_retries:
+            return None
+        if isinstance(error, openai.APIStatusError):
+            if error.status_code not in RETRYABLE_STATUS:
+                return None
+            try:
+                return min(float(error.response.headers.get("retry-after")), BACKOFF_MAX_SECONDS)
+            except (TypeError, ValueError):
+                pass
+        elif not isinstance(error, openai.APIConnectionError):
+            return None
+        return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+    async def _attempt(self, call, priority, hedge):
+        if not hedge or self.hedge_after is None:
+            return await self._single(call, priority)
+        first = asyncio.create_task(self._single(call, priority))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        if done:
+            return first.result()
+        self.stats["hedges"] += 1
+        tasks = [first, asyncio.create_task(self._single(call, priority))]
+        winner = None
+        try:
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in tasks:
+                    if task in done and task.exception() is None:
+                        winner = task
+                        return task.result()
+                    if task in done:
+                        error = error or task.exception()
+            raise error
+        finally:
+            # Stop the losing request; close its stream if it got one.
+            for task in tasks:
+                if task is not winner:
+                    task.cancel()
+            for task in tasks:
+                if task is winner:
+                    continue
+                try:
+                    result = await task
+                except BaseException:
+                    continue
+                if isinstance(result, GatewayStream):
+                    await result.close()
+
+    async def _single(self, call, priority):
+        await self.admission.acquire(priority)
+        try:
+            result = await call()
+        except BaseException:
+            self.admission.release()
+            raise
+        if hasattr(result, "__aiter__"):
+            return GatewayStream(result, self.admission.release)
+        self.admission.release()
+        return result
+
+def gateway_options(llm_config):
+    """LLMGateway keyword arguments from the llm config's "gateway" section."""
+    section = llm_config.get("gateway") or {}
+    return {key: section[key] for key in CONFIG_KEYS if key in section}
@@ -0,0 +1,296 @@
+import collections
+import time
+from types import SimpleNamespace
+import openai
+from openai import AsyncOpenAI
+from .llm_gateway import LLMGateway, DeadlineExceeded, INTERACTIVE
+
+# Time-to-first-token samples kept per endpoint.
+LATENCY_WINDOW = 50
+# Consecutive failures after which an endpoint is skipped for EJECT_SECONDS.
+FAILURES_TO_EJECT = 2
+EJECT_SECONDS = 30
+# Gateway retries per endpoint when there are others to fail over to.
+FAILOVER_RETRIES = 1
+
+CONTINUE_PROMPT = "Continue your previous reply exactly where it stopped, without repeating any of it."
+
+def _usable_key(api_key):
+    return bool(api_key) and api_key != "YOUR_API_KEY_HERE"
+
+def endpoint_configs(llm_config):
+    """
+    The endpoints in the llm config: the "endpoints" list, or the single
+    base_url/api_key/model. Each may set a cheap_model for background
+    tasks; the top-level cheap_model is the default.
+    """
+    defaults = {key: llm_config.get(key) for key in ("api_key", "base_url")}
+    defaults["model"] = llm_config.get("model", "gpt-3.5-turbo")
+    defaults["cheap_model"] = llm_config.get("cheap_model")
+    configs = []
+    for i, endpoint in enumerate(llm_config.get("endpoints") or [{}]):
+        config = {**defaults, **endpoint}
+        config.setdefault("name", config.get("base_url") or f"endpoint-{i}")
+        configs.append(config)
+    return configs
+
+class StreamInterrupted(Exception):
+    """A stream ended without a finish reason, e.g. the connection dropped."""
+
+def is_endpoint_failure(error):
+    """Errors that say something about the endpoint rather than the request."""
+    if isinstance(error, (openai.APIConnectionError, DeadlineExceeded)):
+        return True
+    return isinstance(error, openai.APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+class Endpoint:
+    """One OpenAI-compatible endpoint with its own client, gateway and health."""
+    def __init__(self, name, client, gateway, model, cheap_model=None):
+        self.name = name
+        self.client = client
+        self.gateway = gateway
+        self.model = model
+        self.cheap_model = cheap_model
+        self.ttft = collections.deque(maxlen=LATENCY_WINDOW)
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    def model_for(self, cheap):
+        return (self.cheap_model or self.model) if cheap else self.model
+
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.ejected_until
+
+    def percentile(self, q):
+        if not self.ttft:
+            return None
+        ordered = sorted(self.ttft)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def p50(self):
+        return self.percentile(0.5)
+
+    @property
+    def p95(self):
+        return self.percentile(0.95)
+
+    def record_success(self, ttft=None):
+        self.failures = 0
+        if ttft is not None:
+            self.ttft.append(ttft)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= FAILURES_TO_EJECT:
+            self.ejected_until = time.monotonic() + EJECT_SECONDS
+
+    def stats(self):
+        return {"model": self.model, "cheap_model": self.cheap_model, "healthy": self.healthy,
+                "p50_ttft": self.p50, "p95_ttft": self.p95, "samples": len(self.ttft), **self.gateway.stats}
+
+class RoutedStream:
+    """
+    A chat completion stream that fails over to the next endpoint. A failure
+    before any output just re-sends the request; one after some text asks
+    the next endpoint to continue the reply, so the turn isn't lost. A
+    failure after tool-call output can't be resumed and is raised.
+    """
+    def __init__(self, router, candidates, params, priority, cheap):
+        self.router = router
+        self.candidates = list(candidates)
+        self.params = params
+        self.priority = priority
+        self.cheap = cheap
+        self.endpoint = None
+        self._stream = None
+        self._started = 0.0
+
+    async def open(self, params=None):
+        params = params or self.params
+        error = None
+        while self.candidates:
+            endpoint = self.candidates.pop(0)
+            self._started = time.monotonic()
+            try:
+                self._stream = await endpoint.gateway.view(self.priority).chat.completions.create(
+                    **{**params, "model": endpoint.model_for(self.cheap)})
+            except Exception as e:
+                if not is_endpoint_failure(e):
+                    raise
+                endpoint.record_failure()
+                print(f"LLM endpoint {endpoint.name} failed, trying the next one: {e}")
+                error = e
+                continue
+            self.endpoint = endpoint
+            return self
+        raise error
+
+    async def __aiter__(self):
+        text = ""
+        first = True
+        saw_tool_calls = False
+        while True:
+            finished = False
+            try:
+                async for chunk in self._stream:
+                    if first:
+                        first = False
+                        self.endpoint.record_success(time.monotonic() - self._started)
+                    if chunk.choices:
+                        delta = chunk.choices[0].delta
+                        text += delta.content or ""
+                        saw_tool_calls = saw_tool_calls or bool(delta.tool_calls)
+                        finished = finished or chunk.choices[0].finish_reason is not None
+                    yield chunk
+                if not finished and self.candidates:
+                    raise StreamInterrupted(f"stream from {self.endpoint.name} ended without a finish reason")
+                if first:
+                    self.endpoint.record_success()
+                return
+            except Exception as e:
+                if saw_tool_calls or not self.candidates:
+                    raise
+                self.endpoint.record_failure()
+                print(f"LLM endpoint {self.endpoint.name} failed mid-stream, continuing on the next one: {e}")
+                await self._close_current()
+                params = self.params
+                if text:
+                    params = {**params, "messages": list(params["messages"]) + [
+                        {"role": "assistant", "content": text},
+                        {"role": "user", "content": CONTINUE_PROMPT}]}
+                await self.open(params)
+                first = True
+
+    async def _close_current(self):
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            try:
+                await stream.close()
+            except Exception:
+                pass
+
+    async def close(self):
+        await self._close_current()
+
+class RouterClient:
+    """
+    Client-shaped view of the router for one priority class, usable where
+    an AsyncOpenAI client is. The `model` argument is replaced by the chosen
+    endpoint's model (its cheap model for cheap views).
+    """
+    def __init__(self, router, priority, cheap):
+        self.router = router
+        self.priority = priority
+        self.cheap = cheap
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+        self.embeddings = SimpleNamespace(create=self._create_embedding)
+
+    @property
+    def api_key(self):
+        return self.router.api_key
+
+    @property
+    def embedding_api_key(self):
+        return self.router.embedding_endpoint.client.api_key
+
+    async def _create_completion(self, **params):
+        return await self.router.complete(params, self.priority, self.cheap)
+
+    async def _create_embedding(self, **params):
+        # Vectors from different endpoints aren't comparable, so embeddings
+        # come from one endpoint and don't fail over.
+        return await self.router.embedding_endpoint.gateway.view(self.priority).embeddings.create(**params)
+
+class LLMRouter:
+    """
+    Routes requests across the configured endpoints. Interactive traffic
+    goes to the healthy endpoint with the lowest median time to first token
+    (endpoints without samples yet are tried first, in config order); cheap
+    background tasks go to the first healthy endpoint with a cheap model.
+    Failing endpoints are skipped for a while and requests fail over to the
+    next one.
+    """
+    def __init__(self, endpoints, embedding_endpoint=None):
+        self.endpoints = endpoints
+        # Name of the endpoint serving embeddings; see embedding_endpoint.
+        self.embedding_name = embedding_endpoint
+        self._views = {}
+
+    @classmethod
+    def from_configs(cls, configs, gateway_options=None):
+        options = dict(gateway_options or {})
+        if len(configs) > 1:
+            # Fail over quickly rather than retrying one endpoint at length.
+            options.setdefault("max_retries", FAILOVER_RETRIES)
+        endpoints = []
+        for config in configs:
+            client = AsyncOpenAI(api_key=config.get("api_key"), base_url=config.get("base_url"),
+                                 max_retries=0)  # the gateway retries
+            endpoints.append(Endpoint(config["name"], client, LLMGateway(client, **options),
+                                      config["model"], config.get("cheap_model")))
+        return cls(endpoints)
+
+    def update_models(self, configs):
+        by_name = {config["name"]: config for config in configs}
+        for endpoint in self.endpoints:
+            if endpoint.name in by_name:
+                endpoint.model = by_name[endpoint.name]["model"]
+                endpoint.cheap_model = by_name[endpoint.name].get("cheap_model")
+
+    @property
+    def api_key(self):
+        keys = [e.client.api_key for e in self.endpoints]
+        return next((key for key in keys if _usable_key(key)), keys[0])
+
+    @property
+    def embedding_endpoint(self):
+        """The endpoint named by embedding_name, else the first one with an API key, else the first one."""
+        for endpoint in self.endpoints:
+            if endpoint.name == self.embedding_name:
+                return endpoint
+        return next((e for e in self.endpoints if _usable_key(e.client.api_key)), self.endpoints[0])
+
+    def view(self, priority=INTERACTIVE, cheap=False):
+        if (priority, cheap) not in self._views:
+            self._views[priority, cheap] = RouterClient(self, priority, cheap)
+        return self._views[priority, cheap]
+
+    def ranked(self, cheap=False):
+        """Endpoints in the order to try them; ejected ones, then ones without an API key, go last."""
+        if cheap:
+            order = sorted(self.endpoints, key=lambda e: e.cheap_model is None)
+        else:
+            order = sorted(self.endpoints, key=lambda e: e.p50 or 0.0)
+        return sorted(order, key=lambda e: (not _usable_key(e.client.api_key), not e.healthy))
+
+    def model_for(self, cheap=False):
+        return self.ranked(cheap)[0].model_for(cheap)
+
+    async def complete(self, params, priority=INTERACTIVE, cheap=False):
+        candidates = self.ranked(cheap)
+        if params.get("stream"):
+            return await RoutedStream(self, candidates, params, priority, cheap).open()
+        error = None
+        for endpoint in candidates:
+            try:
+                response = await endpoint.gateway.view(priority).chat.completions.create(
+                    **{**params, "model": endpoint.model_for(cheap)})
+            except Exception as e:
+                if not is_endpoint_failure(e):
+                    raise
+                endpoint.record_failure()
+                print(f"LLM endpoint {endpoint.name} failed, trying the next one: {e}")
+                error = e
+                continue
+            endpoint.record_success()
+            return response
+        raise error
+
+    def stats(self):
+        return {e.name: e.stats() for e in self.endpoints}
+
+    async def close(self):
+        for endpoint in self.endpoints:
+            await endpoint.client.close()
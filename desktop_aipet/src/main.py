@@ -2,22 +2,35 @@ import sys
 import asyncio
 from PyQt6.QtWidgets import QApplication
 from qasync import QEventLoop
-from .database import init_db
+from .database import init_db, open_pool, close_pool, terminate_pool, start_write_queue, stop_write_queue
 from .scheduler_service import start_scheduler
 from .agent_core import ChatAgent
+from .memory_service import close_llm_client, backfill_search_index, semantic_memory, title_generator, get_config
+from .tracing import tracer
 from .main_window import MainWindow
 
 async def main_async():
+    tracer.configure(get_config().get('tracing', {}))
+
     # Initialize DB
     await init_db()
+    await open_pool()
+    await start_write_queue()
 
     # Initialize Scheduler
     start_scheduler()
 
+    # Index messages from before full-text search existed
+    backfill = asyncio.create_task(backfill_search_index())
+    # Embed messages logged since the last run
+    semantic_memory.schedule_indexing()
+
     # Initialize Agent
     agent = ChatAgent()
     # Start a default session
     await agent.start_session(session_id="default_session")
+    # Launch MCP servers in the background; their tools appear once registered
+    mcp_startup = asyncio.create_task(agent.mcp_client.start(agent.tool_registry))
 
     # Initialize GUI
     window = MainWindow(agent)
@@ -28,6 +41,17 @@ async def main_async():
         await asyncio.Future()
     except asyncio.CancelledError:
         pass
+    finally:
+        backfill.cancel()
+        await asyncio.gather(mcp_startup, return_exceptions=True)
+        await agent.mcp_client.close()
+        agent.tool_registry.shutdown()
+        await semantic_memory.close()
+        await title_generator.close()
+        await close_llm_client()
+        await stop_write_queue()
+        await close_pool()
+        tracer.flush()
 
 def main():
     app = QApplication(sys.argv)
@@ -39,6 +63,10 @@ def main():
             loop.run_until_complete(main_async())
         except KeyboardInterrupt:
             pass
+        finally:
+            # The loop may stop before main_async unwinds; make sure the
+            # pooled connection threads don't keep the process alive.
+            terminate_pool()
 
 if __name__ == "__main__":
     main()
@@ -1,24 +1,303 @@
-import sys
 import os
 import asyncio
+import bisect
+import math
 import datetime
 import uuid
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
-                             QHBoxLayout, QTextEdit, QLineEdit, QPushButton,
+                             QHBoxLayout, QLineEdit, QPushButton,
                              QLabel, QDialog, QMessageBox, QTableWidget, QTableWidgetItem, QHeaderView, QDateTimeEdit,
-                             QMenu, QFileDialog, QSizeGrip, QFormLayout)
-from PyQt6.QtCore import Qt, QTimer, pyqtSignal, QObject
-from PyQt6.QtGui import QColor, QPalette, QPainter, QBrush, QPen, QAction, QPixmap, QTextCursor
+                             QMenu, QFileDialog, QSizeGrip, QFormLayout, QListView, QStyledItemDelegate,
+                             QTableView, QComboBox)
+from PyQt6.QtCore import (Qt, QTimer, pyqtSignal, QObject, QAbstractListModel, QAbstractTableModel, QModelIndex,
+                          QPersistentModelIndex, QRect, QSize)
+from PyQt6.QtGui import (QColor, QPainter, QBrush, QAction, QPixmap, QStaticText, QTransform,
+                         QShortcut, QKeySequence)
 
 from .agent_core import ChatAgent
-from .scheduler_service import set_alert_callback, get_all_reminders, delete_reminder, update_reminder
-from .memory_service import load_config, save_config, get_all_sessions, create_session, get_session_messages
+from .scheduler_service import set_alert_callback, get_reminders_page, count_reminders, delete_reminder, update_reminder
+from .memory_service import (get_config, load_config, save_config, get_sessions_page, count_sessions, create_session,
+                             get_session_messages_page, search_messages, get_llm_stats)
+from .tracing import tracer, percentile
+
+# Streamed chunks are coalesced and drawn at most once per this interval.
+STREAM_FRAME_MS = 25
+# Delay after the last keystroke before the history search runs.
+SEARCH_DEBOUNCE_MS = 250
+# Appended to a reply the user stopped (or that a new message replaced).
+STOPPED_MARKER = " [stopped]"
+# Toggles the (otherwise hidden) diagnostics panel, and its refresh interval.
+DIAGNOSTICS_SHORTCUT = "Ctrl+Shift+D"
+DIAGNOSTICS_REFRESH_MS = 1000
+
+# Item data role returning the ChatMessage object behind a row
+MessageRole = Qt.ItemDataRole.UserRole + 1
+
+class ChatMessage:
+    """One row of the chat view, plus the delegate's cached text layout for it."""
+    __slots__ = ('role', 'content', 'layout_width', 'layout_content', 'paragraphs', 'offsets', 'widths', 'text_size')
+
+    def __init__(self, role, content):
+        self.role = role
+        self.content = content
+        self.layout_width = None
+        self.layout_content = None
+        # Per paragraph, laid out at layout_width: (text, height, QStaticText), top offset and width
+        self.paragraphs = []
+        self.offsets = []
+        self.widths = []
+        self.text_size = QSize()
+
+class ChatMessageModel(QAbstractListModel):
+    """
+    The loaded part of a session's history. Pages of older messages are
+    prepended as the user scrolls up; `oldest_key` is the keyset cursor
+    (timestamp, id) of the first loaded row.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._messages = []
+        self.has_more = False
+        self.oldest_key = None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._messages)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        message = self._messages[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return message.content
+        if role == MessageRole:
+            return message
+        return None
+
+    def clear(self):
+        self.beginResetModel()
+        self._messages = []
+        self.has_more = False
+        self.oldest_key = None
+        self.endResetModel()
+
+    def append_message(self, role, content):
+        row = len(self._messages)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._messages.append(ChatMessage(role, content))
+        self.endInsertRows()
+        return row
+
+    def prepend_page(self, rows, has_more):
+        """Inserts (id, role, content, timestamp) rows, oldest first, above the loaded ones."""
+        self.has_more = has_more
+        if not rows:
+            return
+        self.beginInsertRows(QModelIndex(), 0, len(rows) - 1)
+        self._messages[0:0] = [ChatMessage(role, content) for _, role, content, _ in rows]
+        self.endInsertRows()
+        self.oldest_key = (rows[0][3], rows[0][0])
+
+    def set_content(self, row, content):
+        self._messages[row].content = content
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+class ChatBubbleDelegate(QStyledItemDelegate):
+    """
+    Paints messages as rounded bubbles: user on the right, assistant on the
+    left. Text is measured per paragraph and cached on the ChatMessage, so a
+    streaming reply only re-measures its last paragraph, and painting skips
+    paragraphs outside the viewport.
+    """
+    MARGIN = 5
+    PADDING = 10
+    RADIUS = 10
+    # Fraction of the row kept free on the opposite side of the bubble
+    SIDE_GAP = 0.2
+    COLORS = {'user': QColor("#DCF8C6"), 'assistant': QColor("#F0F0F0")}
+
+    def __init__(self, view):
+        super().__init__(view)
+        self.view = view
+
+    def _layout(self, option, message):
+        width = max(1, int(self.view.viewport().width() * (1 - self.SIDE_GAP)) - 2 * (self.MARGIN + self.PADDING))
+        content = message.content
+        if message.layout_width == width and message.layout_content is content:
+            return message
+
+        if (message.layout_width == width and message.paragraphs
+                and content.startswith(message.layout_content)):
+            # Streaming append: only the last paragraph and anything after it changed.
+            last = len(message.paragraphs) - 1
+            tail = content[len(message.layout_content) - len(message.paragraphs[last][0]):]
+        else:
+            last = 0
+            tail = content
+        del message.paragraphs[last:]
+        del message.offsets[last:]
+        del message.widths[last:]
+
+        top = message.offsets[-1] + message.paragraphs[-1][1] if message.paragraphs else 0
+        for text in tail.split("\n"):
+            # QStaticText keeps the wrapped layout, so repaints don't redo it.
+            static_text = QStaticText(text or " ")
+            static_text.setTextFormat(Qt.TextFormat.PlainText)
+            static_text.setTextWidth(width)
+            static_text.prepare(QTransform(), option.font)
+            size = static_text.size()
+            height = math.ceil(size.height())
+            message.paragraphs.append((text, height, static_text))
+            message.offsets.append(top)
+            message.widths.append(math.ceil(size.width()))
+            top += height
+
+        message.layout_width = width
+        message.layout_content = content
+        message.text_size = QSize(max(message.widths), top)
+        return message
+
+    def sizeHint(self, option, index):
+        message = self._layout(option, index.data(MessageRole))
+        return QSize(self.view.viewport().width(), message.text_size.height() + 2 * (self.MARGIN + self.PADDING))
+
+    def paint(self, painter, option, index):
+        message = self._layout(option, index.data(MessageRole))
+        bubble_width = message.text_size.width() + 2 * self.PADDING
+        bubble_height = message.text_size.height() + 2 * self.PADDING
+        if message.role == 'user':
+            x = option.rect.right() - self.MARGIN - bubble_width
+        else:
+            x = option.rect.left() + self.MARGIN
+        bubble = QRect(x, option.rect.top() + self.MARGIN, bubble_width, bubble_height)
+
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(QBrush(self.COLORS.get(message.role, self.COLORS['assistant'])))
+        painter.drawRoundedRect(bubble, self.RADIUS, self.RADIUS)
+        painter.setPen(QColor("black"))
+
+        # Only draw the paragraphs that intersect the viewport.
+        text_top = bubble.top() + self.PADDING
+        visible = self.view.viewport().rect()
+        first = max(0, bisect.bisect_right(message.offsets, visible.top() - text_top) - 1)
+        for i in range(first, len(message.paragraphs)):
+            y = text_top + message.offsets[i]
+            if y > visible.bottom():
+                break
+            painter.drawStaticText(bubble.left() + self.PADDING, y, message.paragraphs[i][2])
+        painter.restore()
+
+class ChatView(QListView):
+    """List view over a ChatMessageModel that asks for older pages at the top."""
+    older_requested = pyqtSignal()
 
-class WorkerSignals(QObject):
-    response_received = pyqtSignal(str) # Deprecated
-    response_start = pyqtSignal()
-    response_chunk = pyqtSignal(str)
-    response_finished = pyqtSignal()
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setItemDelegate(ChatBubbleDelegate(self))
+        self.setVerticalScrollMode(QListView.ScrollMode.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setResizeMode(QListView.ResizeMode.Adjust)
+        self.setSelectionMode(QListView.SelectionMode.NoSelection)
+        self.setWordWrap(True)
+        self.verticalScrollBar().valueChanged.connect(self._on_scroll)
+
+    def dataChanged(self, top_left, bottom_right, roles=()):
+        super().dataChanged(top_left, bottom_right, roles)
+        # A streamed row grows; lay items out again (cheap, sizes are cached).
+        self.scheduleDelayedItemsLayout()
+
+    def wheelEvent(self, event):
+        super().wheelEvent(event)
+        # Already at the top, so the scroll bar won't report a change.
+        if event.angleDelta().y() > 0:
+            self._on_scroll(self.verticalScrollBar().value())
+
+    def _on_scroll(self, value):
+        if value == self.verticalScrollBar().minimum() and self.model() is not None and self.model().has_more:
+            self.older_requested.emit()
+
+    def is_at_bottom(self):
+        bar = self.verticalScrollBar()
+        return bar.value() >= bar.maximum() - 4
+
+    def keep_position_while(self, change):
+        """Applies `change` (which inserts rows above) without moving the visible rows."""
+        bar = self.verticalScrollBar()
+        from_bottom = bar.maximum() - bar.value()
+        change()
+        self.doItemsLayout()
+        bar.setValue(bar.maximum() - from_bottom)
+
+class StreamingMessageRenderer(QObject):
+    """
+    Streams a reply into a row it appends to a ChatMessageModel. Chunks are
+    buffered and applied at most once per frame, so a fast stream updates the
+    row (and re-lays out one item) per frame rather than per token. The row
+    is tracked with a persistent index, so pages prepended above it while it
+    streams don't redirect the reply; clearing the model detaches the renderer.
+    """
+    PLACEHOLDER = "..."
+
+    def __init__(self, model, view=None, interval_ms=STREAM_FRAME_MS, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.view = view
+        self.chunks = []
+        self._pending = False
+        self._index = None
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(interval_ms)
+        self._timer.timeout.connect(self.flush)
+        model.modelReset.connect(self._detach)
+
+    @property
+    def active(self):
+        return self._index is not None and self._index.isValid()
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+    def start(self):
+        self.chunks = []
+        self._pending = False
+        row = self.model.append_message('assistant', self.PLACEHOLDER)
+        self._index = QPersistentModelIndex(self.model.index(row))
+        self._scroll_to_bottom()
+
+    def append(self, chunk):
+        self.chunks.append(chunk)
+        self._pending = True
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        self._timer.stop()
+        if not self._pending or not self.active:
+            return
+        with tracer.span("ui.render"):
+            follow = self.view is not None and self.view.is_at_bottom()
+            self.model.set_content(self._index.row(), self.text)
+            self._pending = False
+            if follow:
+                self._scroll_to_bottom()
+
+    def finish(self):
+        self.flush()
+        self._index = None
+
+    def _detach(self):
+        self._timer.stop()
+        self._pending = False
+        self._index = None
+
+    def _scroll_to_bottom(self):
+        if self.view is not None:
+            self.view.scrollToBottom()
 
 class PetLabel(QLabel):
     clicked = pyqtSignal()
@@ -114,6 +393,17 @@ class SettingsDialog(QDialog):
         layout.addRow("Base URL:", self.base_url_edit)
         layout.addRow("Model:", self.model_edit)
 
+        # Values set by llm.endpoints entries win over these top-level ones.
+        endpoints = llm_config.get('endpoints') or []
+        self.fields = {'api_key': self.api_key_edit, 'base_url': self.base_url_edit, 'model': self.model_edit}
+        if endpoints:
+            layout.addRow(QLabel("Several endpoints are configured in config.json. These values only apply\n"
+                                 "to endpoints that don't set their own; fields every endpoint sets are disabled."))
+            for name, edit in self.fields.items():
+                if all(name in endpoint for endpoint in endpoints):
+                    edit.setEnabled(False)
+                    edit.setToolTip("Set per endpoint under llm.endpoints in config.json")
+
         btns = QHBoxLayout()
         save_btn = QPushButton("Save")
         save_btn.clicked.connect(self.save_settings)
@@ -129,9 +419,9 @@ class SettingsDialog(QDialog):
         if 'llm' not in self.config:
             self.config['llm'] = {}
 
-        self.config['llm']['api_key'] = self.api_key_edit.text()
-        self.config['llm']['base_url'] = self.base_url_edit.text()
-        self.config['llm']['model'] = self.model_edit.text()
+        for name, edit in self.fields.items():
+            if edit.isEnabled():
+                self.config['llm'][name] = edit.text()
 
         save_config(self.config)
         QMessageBox.information(self, "Success", "Settings saved successfully.")
@@ -173,16 +463,136 @@ class EditReminderDialog(QDialog):
         # Return ISO string
         return self.msg_edit.text(), self.time_edit.dateTime().toPyDateTime().isoformat()
 
+class PagedTableModel(QAbstractTableModel):
+    """
+    Table model that loads rows a page at a time as the view scrolls, via
+    canFetchMore/fetchMore. `fetch_page(after)` is an async callable returning
+    (rows, has_more), `key(row)` gives the keyset cursor a following page
+    starts after, and `count()` optionally returns the total number of rows.
+    """
+    loaded = pyqtSignal()
+
+    def __init__(self, headers, columns, fetch_page, key, count=None, parent=None):
+        super().__init__(parent)
+        self.headers = headers
+        self.columns = columns
+        self.fetch_page = fetch_page
+        self.key = key
+        self.count = count
+        self.total = None
+        self._rows = []
+        self._has_more = True
+        self._loading = False
+        # Bumped on reload so pages requested before it are dropped.
+        self._generation = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        return self.columns[index.column()](self._rows[index.row()])
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.headers[section]
+        return None
+
+    def row_data(self, row):
+        return self._rows[row]
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._has_more and not self._loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self._loading = True
+        asyncio.create_task(self._fetch(self._generation))
+
+    def reload(self):
+        self.beginResetModel()
+        self._generation += 1
+        self._rows = []
+        self._has_more = True
+        self._loading = False
+        self.total = None
+        self.endResetModel()
+        if self.count is not None:
+            asyncio.create_task(self._count(self._generation))
+        self.fetchMore()
+
+    async def _fetch(self, generation):
+        after = self.key(self._rows[-1]) if self._rows else None
+        try:
+            rows, has_more = await self.fetch_page(after)
+        except Exception as e:
+            print(f"Error fetching page: {e}")
+            rows, has_more = [], self._has_more
+        if generation != self._generation:
+            return
+        self._loading = False
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(rows) - 1)
+            self._rows.extend(rows)
+            self.endInsertRows()
+        self._has_more = has_more
+        self.loaded.emit()
+
+    async def _count(self, generation):
+        try:
+            total = await self.count()
+        except Exception as e:
+            # Without a total the status just shows the loaded rows.
+            print(f"Error counting rows: {e}")
+            total = None
+        if generation == self._generation:
+            self.total = total
+            self.loaded.emit()
+
+    def status_text(self):
+        if self.total is None:
+            return f"Showing {len(self._rows)}"
+        return f"Showing {len(self._rows)} of {self.total}"
+
 class ReminderManager(QDialog):
+    STATUS_FILTERS = [("All", None), ("Pending", "pending"), ("Completed", "completed")]
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Manage Reminders")
         self.resize(500, 300)
         self.layout = QVBoxLayout()
 
-        self.table = QTableWidget()
-        self.table.setColumnCount(3)
-        self.table.setHorizontalHeaderLabels(["Time", "Message", "Status"])
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("Status:"))
+        self.status_filter = QComboBox()
+        for label, status in self.STATUS_FILTERS:
+            self.status_filter.addItem(label, status)
+        self.status_filter.currentIndexChanged.connect(self.refresh_reminders)
+        filter_layout.addWidget(self.status_filter)
+        filter_layout.addStretch()
+        self.count_label = QLabel()
+        filter_layout.addWidget(self.count_label)
+        self.layout.addLayout(filter_layout)
+
+        self.model = PagedTableModel(
+            ["Time", "Message", "Status"],
+            [lambda r: str(r['run_date']), lambda r: r['message'], lambda r: r['status']],
+            lambda after: get_reminders_page(after, status=self.status_filter.currentData()),
+            lambda r: (r['run_date'], r['id']),
+            count=lambda: count_reminders(status=self.status_filter.currentData()),
+            parent=self
+        )
+        self.model.loaded.connect(lambda: self.count_label.setText(self.model.status_text()))
+
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
         self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
         self.layout.addWidget(self.table)
 
@@ -205,56 +615,40 @@ class ReminderManager(QDialog):
         self.refresh_reminders()
 
     def refresh_reminders(self):
-        asyncio.create_task(self._load_reminders())
-
-    async def _load_reminders(self):
-        reminders = await get_all_reminders()
-        self.table.setRowCount(0)
-        for r in reminders:
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            self.table.setItem(row, 0, QTableWidgetItem(str(r['run_date'])))
-            self.table.setItem(row, 1, QTableWidgetItem(r['message']))
-            self.table.setItem(row, 2, QTableWidgetItem(r['status']))
-            # Store ID in the first item's user data
-            self.table.item(row, 0).setData(Qt.ItemDataRole.UserRole, r['id'])
+        self.model.reload()
 
-    def delete_selected(self):
-        rows = set(index.row() for index in self.table.selectedIndexes())
-        if not rows: return
+    def selected_reminders(self):
+        rows = sorted(set(index.row() for index in self.table.selectionModel().selectedIndexes()))
+        return [self.model.row_data(row) for row in rows]
 
-        ids = []
-        for row in rows:
-            item = self.table.item(row, 0)
-            ids.append(item.data(Qt.ItemDataRole.UserRole))
+    def delete_selected(self):
+        reminders = self.selected_reminders()
+        if not reminders: return
 
+        ids = [r['id'] for r in reminders]
         asyncio.create_task(self._delete_reminders(ids))
 
     async def _delete_reminders(self, ids):
         for r_id in ids:
             await delete_reminder(r_id)
-        await self._load_reminders()
+        self.refresh_reminders()
 
     def edit_selected(self):
-        rows = set(index.row() for index in self.table.selectedIndexes())
-        if len(rows) != 1:
+        reminders = self.selected_reminders()
+        if len(reminders) != 1:
             QMessageBox.warning(self, "Edit", "Please select exactly one reminder to edit.")
             return
 
-        row = list(rows)[0]
-        r_id = self.table.item(row, 0).data(Qt.ItemDataRole.UserRole)
-        current_time = self.table.item(row, 0).text()
-        current_msg = self.table.item(row, 1).text()
-
-        dialog = EditReminderDialog(current_msg, current_time, self)
+        reminder = reminders[0]
+        dialog = EditReminderDialog(reminder['message'], str(reminder['run_date']), self)
         if dialog.exec():
             new_msg, new_time = dialog.get_data()
-            asyncio.create_task(self._update_reminder(r_id, new_msg, new_time))
+            asyncio.create_task(self._update_reminder(reminder['id'], new_msg, new_time))
 
     async def _update_reminder(self, r_id, msg, time):
         success = await update_reminder(r_id, msg, time)
         if success:
-            await self._load_reminders()
+            self.refresh_reminders()
         else:
             QMessageBox.critical(self, "Error", "Failed to update reminder. Check if time is in the future.")
 
@@ -299,14 +693,50 @@ class SessionManagerDialog(QDialog):
         self.resize(400, 300)
         self.layout = QVBoxLayout()
 
-        self.table = QTableWidget()
-        self.table.setColumnCount(2)
-        self.table.setHorizontalHeaderLabels(["Title", "Date"])
-        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
-        self.table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
-        self.table.setSelectionMode(QTableWidget.SelectionMode.SingleSelection)
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search messages...")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.textChanged.connect(self.on_search_changed)
+        self.layout.addWidget(self.search_input)
+
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.run_search)
+
+        self.model = PagedTableModel(
+            ["Title", "Date"],
+            # s: id, title, created_at
+            [lambda s: s[1] if s[1] else "New Chat", lambda s: s[2]],
+            lambda after: get_sessions_page(after),
+            lambda s: (s[2], s[0]),
+            count=count_sessions,
+            parent=self
+        )
+
+        # Search results are ranked, so they come as a single page.
+        self.search_model = PagedTableModel(
+            ["Title", "Message", "Date"],
+            # r: id, session_id, title, role, snippet, timestamp
+            [lambda r: r[2] if r[2] else "New Chat", lambda r: f"{r[3]}: {r[4]}", lambda r: r[5]],
+            self._search_page,
+            lambda r: r[0],
+            parent=self
+        )
+
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QTableView.SelectionMode.SingleSelection)
+        self.table.doubleClicked.connect(self.open_session)
         self.layout.addWidget(self.table)
 
+        self.count_label = QLabel()
+        self.model.loaded.connect(self.update_count_label)
+        self.search_model.loaded.connect(self.update_count_label)
+        self.layout.addWidget(self.count_label)
+        self.show_model(self.model)
+
         btn_layout = QHBoxLayout()
         open_btn = QPushButton("Open")
         open_btn.clicked.connect(self.open_session)
@@ -323,29 +753,136 @@ class SessionManagerDialog(QDialog):
         self.refresh_sessions()
 
     def refresh_sessions(self):
-        asyncio.create_task(self._load_sessions())
+        self.model.reload()
+
+    def show_model(self, model):
+        if self.table.model() is not model:
+            self.table.setModel(model)
+        # Stretch the title column for sessions, the message for search results.
+        stretch = 0 if model is self.model else 1
+        header = self.table.horizontalHeader()
+        for column in range(model.columnCount()):
+            mode = QHeaderView.ResizeMode.Stretch if column == stretch else QHeaderView.ResizeMode.ResizeToContents
+            header.setSectionResizeMode(column, mode)
+        self.update_count_label()
+
+    def update_count_label(self):
+        model = self.table.model()
+        if model is self.search_model:
+            self.count_label.setText(f"{model.rowCount()} matching messages")
+        else:
+            self.count_label.setText(model.status_text())
 
-    async def _load_sessions(self):
-        sessions = await get_all_sessions()
-        self.table.setRowCount(0)
-        for s in sessions:
-            # s: id, title, created_at
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            self.table.setItem(row, 0, QTableWidgetItem(s[1] if s[1] else "New Chat"))
-            self.table.setItem(row, 1, QTableWidgetItem(s[2]))
-            self.table.item(row, 0).setData(Qt.ItemDataRole.UserRole, s[0])
+    def on_search_changed(self, text):
+        if text.strip():
+            self.search_timer.start()
+        else:
+            self.search_timer.stop()
+            self.show_model(self.model)
+
+    def run_search(self):
+        self.search_model.reload()
+        self.show_model(self.search_model)
+
+    async def _search_page(self, after):
+        return await search_messages(self.search_input.text()), False
 
     def open_session(self):
-        rows = self.table.selectedIndexes()
+        rows = self.table.selectionModel().selectedRows()
         if not rows:
             return
 
-        # Get ID from first column of selected row
-        row_idx = rows[0].row()
-        self.selected_session_id = self.table.item(row_idx, 0).data(Qt.ItemDataRole.UserRole)
+        model = self.table.model()
+        row = model.row_data(rows[0].row())
+        # Session rows start with the session id, search results with the message id.
+        self.selected_session_id = row[1] if model is self.search_model else row[0]
         self.accept()
 
+def _ms(seconds):
+    return "" if seconds is None else f"{seconds * 1000:.1f}"
+
+def _span_details(span):
+    return ", ".join(f"{k}={v}" for k, v in span.items() if k not in ("name", "at", "duration", "turn"))
+
+class DiagnosticsPanel(QDialog):
+    """
+    Latency percentiles per span kind, prompt prefix reuse, the breakdown of
+    the last turn, and the LLM endpoint and tool counters. Refreshes itself while visible.
+    """
+    def __init__(self, agent, parent=None):
+        super().__init__(parent)
+        self.agent = agent
+        self.setWindowTitle("Diagnostics")
+        self.resize(560, 620)
+        layout = QVBoxLayout(self)
+
+        layout.addWidget(QLabel("Spans (ms)"))
+        self.spans_table = self._table(["Span", "Count", "p50", "p95", "Max"])
+        layout.addWidget(self.spans_table)
+        self.rate_label = QLabel("LLM output: no streams yet")
+        layout.addWidget(self.rate_label)
+        self.prefix_label = QLabel("Prompt prefix reuse: no requests yet")
+        layout.addWidget(self.prefix_label)
+
+        self.last_turn_label = QLabel("Last turn")
+        layout.addWidget(self.last_turn_label)
+        self.turn_table = self._table(["Span", "ms", "Details"])
+        layout.addWidget(self.turn_table)
+
+        layout.addWidget(QLabel("LLM endpoints and tools"))
+        self.counters_table = self._table(["Name", "Stats"])
+        layout.addWidget(self.counters_table)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(DIAGNOSTICS_REFRESH_MS)
+        self.timer.timeout.connect(self.refresh)
+
+    def _table(self, headers):
+        table = QTableWidget(0, len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        table.verticalHeader().setVisible(False)
+        table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        return table
+
+    def _fill(self, table, rows):
+        table.setRowCount(len(rows))
+        for r, row in enumerate(rows):
+            for c, value in enumerate(row):
+                table.setItem(r, c, QTableWidgetItem(str(value)))
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        rows = [(name, s["count"], _ms(s["p50"]), _ms(s["p95"]), _ms(s["max"])) for name, s in tracer.summary().items()]
+        self._fill(self.spans_table, rows)
+        rates = tracer.values("llm.stream", "tokens_per_second")
+        if rates:
+            # For a rate the slow tail is the low end.
+            self.rate_label.setText(f"LLM output: p50 {percentile(rates, 0.5):.1f} tokens/s, "
+                                    f"slowest 5% under {percentile(rates, 0.05):.1f} tokens/s")
+        ratios = tracer.values("llm.request", "reuse_ratio")
+        if ratios:
+            prefix_tokens = tracer.values("llm.request", "prefix_tokens")
+            self.prefix_label.setText(f"Prompt prefix reuse: p50 {percentile(ratios, 0.5):.0%}, "
+                                      f"last request {ratios[-1]:.0%} ({prefix_tokens[-1]} tokens)")
+
+        spans = tracer.turn_spans()
+        turn = spans[-1] if spans else None
+        self.last_turn_label.setText(f"Last turn: {_ms(turn['duration'])} ms" if turn else "Last turn")
+        self._fill(self.turn_table, [(span["name"], _ms(span["duration"]), _span_details(span)) for span in spans[:-1]])
+
+        counters = [(f"llm {name}", stats) for name, stats in get_llm_stats().items()]
+        counters += [(f"tool {name}", stats) for name, stats in self.agent.tool_registry.get_stats().items()]
+        self._fill(self.counters_table, counters)
+
 class ChatOverlay(QWidget):
     def __init__(self, agent: ChatAgent, parent=None):
         super().__init__(parent)
@@ -358,7 +895,7 @@ class ChatOverlay(QWidget):
                 border-radius: 15px;
                 border: 1px solid #ccc;
             }
-            QTextEdit {
+            QListView {
                 background-color: transparent;
                 border: none;
                 font-family: Arial;
@@ -398,9 +935,12 @@ class ChatOverlay(QWidget):
         top_bar.addStretch()
         self.layout.addLayout(top_bar)
 
-        self.history = QTextEdit()
-        self.history.setReadOnly(True)
+        self.messages = ChatMessageModel(self)
+        self.history = ChatView()
+        self.history.setModel(self.messages)
+        self.history.older_requested.connect(self.load_older_messages)
         self.layout.addWidget(self.history)
+        self.loading_older = False
 
         input_layout = QHBoxLayout()
         self.input_field = QLineEdit()
@@ -411,6 +951,12 @@ class ChatOverlay(QWidget):
         send_btn.clicked.connect(self.send_message)
         input_layout.addWidget(send_btn)
 
+        self.stop_btn = QPushButton("⏹")
+        self.stop_btn.setToolTip("Stop the reply")
+        self.stop_btn.setEnabled(False)
+        self.stop_btn.clicked.connect(self.stop_response)
+        input_layout.addWidget(self.stop_btn)
+
         reminders_btn = QPushButton("⏰")
         reminders_btn.clicked.connect(self.open_reminders)
         input_layout.addWidget(reminders_btn)
@@ -428,17 +974,6 @@ class ChatOverlay(QWidget):
 
         self.setLayout(self.layout)
 
-        # Signals for async handling
-        self.signals = WorkerSignals()
-        self.signals.response_start.connect(self.on_response_start)
-        self.signals.response_chunk.connect(self.on_response_chunk)
-        self.signals.response_finished.connect(self.on_response_finished)
-
-        # State for streaming
-        self.current_ai_text = ""
-        self.ai_message_anchor_pos = 0
-        self.ai_message_start_pos = 0
-
         # Start default session
         self.new_chat()
 
@@ -449,7 +984,7 @@ class ChatOverlay(QWidget):
     async def _init_session(self, session_id):
         await create_session(session_id, None) # Title will be generated later
         await self.agent.start_session(session_id)
-        self.history.clear()
+        self.messages.clear()
 
     def open_history(self):
         dialog = SessionManagerDialog(self)
@@ -459,95 +994,61 @@ class ChatOverlay(QWidget):
                 asyncio.create_task(self.load_session(session_id))
 
     async def load_session(self, session_id):
+        """Shows the newest page of the session; older pages load on scroll-up."""
         await self.agent.start_session(session_id)
-        msgs = await get_session_messages(session_id)
-        self.history.clear()
-        for role, content, _ in msgs:
-            if role == 'user':
-                self.append_user_message_html(content)
-            elif role == 'assistant':
-                self.append_ai_message_html(content)
-
-    def format_user_html(self, msg):
-        return f"""
-        <table width="100%" border="0" cellpadding="5">
-            <tr>
-                <td width="20%"></td>
-                <td align="right">
-                    <div style="background-color: #DCF8C6; color: black; padding: 10px; border-radius: 10px;">
-                        {msg}
-                    </div>
-                </td>
-            </tr>
-        </table>
-        """
-
-    def format_ai_html(self, msg):
-        return f"""
-        <table width="100%" border="0" cellpadding="5">
-            <tr>
-                <td align="left">
-                    <div style="background-color: #F0F0F0; color: black; padding: 10px; border-radius: 10px;">
-                        {msg}
-                    </div>
-                </td>
-                <td width="20%"></td>
-            </tr>
-        </table>
-        """
-
-    def append_user_message_html(self, msg):
-        self.history.append(self.format_user_html(msg))
-
-    def append_ai_message_html(self, msg):
-        self.history.append(self.format_ai_html(msg))
+        rows, has_more = await get_session_messages_page(session_id)
+        self.messages.clear()
+        self.messages.prepend_page(rows, has_more)
+        self.history.scrollToBottom()
+
+    def load_older_messages(self):
+        if self.loading_older or not self.messages.has_more:
+            return
+        self.loading_older = True
+        asyncio.create_task(self._load_older_messages(self.agent.session_id, self.messages.oldest_key))
+
+    async def _load_older_messages(self, session_id, before):
+        try:
+            rows, has_more = await get_session_messages_page(session_id, before=before)
+            # Drop the page if the user switched sessions while it loaded.
+            if session_id == self.agent.session_id and before == self.messages.oldest_key:
+                self.history.keep_position_while(lambda: self.messages.prepend_page(rows, has_more))
+        finally:
+            self.loading_older = False
 
     def send_message(self):
         msg = self.input_field.text()
         if not msg: return
 
-        self.append_user_message_html(msg)
+        self.messages.append_message('user', msg)
+        self.history.scrollToBottom()
         self.input_field.clear()
 
-        # Async call to agent
+        # Async call to agent; a reply still streaming is stopped first
         asyncio.create_task(self.process_message(msg))
 
     async def process_message(self, msg):
-        self.signals.response_start.emit()
-        async for chunk in self.agent.chat_stream(msg):
-            self.signals.response_chunk.emit(chunk)
-        self.signals.response_finished.emit()
-
-    def on_response_start(self):
-        self.current_ai_text = "..."
-
-        # Capture start position before appending
-        cursor = self.history.textCursor()
-        cursor.movePosition(QTextCursor.MoveOperation.End)
-        self.ai_message_start_pos = cursor.position()
-
-        # Append placeholder
-        self.history.append(self.format_ai_html(self.current_ai_text))
-
-    def on_response_chunk(self, chunk):
-        if self.current_ai_text == "...":
-            self.current_ai_text = ""
-
-        self.current_ai_text += chunk
-        self._update_last_message(self.format_ai_html(self.current_ai_text))
-
-    def on_response_finished(self):
-        # Final update to ensure everything is correct
-        self._update_last_message(self.format_ai_html(self.current_ai_text))
-
-    def _update_last_message(self, html):
-        cursor = self.history.textCursor()
-        cursor.setPosition(self.ai_message_start_pos)
-        cursor.movePosition(QTextCursor.MoveOperation.End, QTextCursor.MoveMode.KeepAnchor)
-        cursor.removeSelectedText()
-        cursor.insertHtml(html)
-        # Move cursor to end again to be safe
-        self.history.moveCursor(QTextCursor.MoveOperation.End)
+        # Each turn streams into its own row, so a stopped reply and the next never mix.
+        renderer = StreamingMessageRenderer(self.messages, self.history, parent=self)
+        turn = self.agent.start_turn(msg, on_chunk=renderer.append, on_start=renderer.start)
+        self.update_stop_button()
+        try:
+            await turn
+        except asyncio.CancelledError:
+            if not turn.cancelled():
+                raise
+            if renderer.active:
+                renderer.append(STOPPED_MARKER)
+        finally:
+            renderer.finish()
+            renderer.deleteLater()
+            self.update_stop_button()
+
+    def stop_response(self):
+        asyncio.create_task(self.agent.cancel_turn())
+
+    def update_stop_button(self):
+        self.stop_btn.setEnabled(self.agent.session_id in self.agent.turns)
 
     def open_reminders(self):
         manager = ReminderManager(self)
@@ -583,6 +1084,11 @@ class MainWindow(QMainWindow):
         self.alert_signal.connect(self.show_alert)
         set_alert_callback(self.alert_signal.emit)
 
+        self.diagnostics = None
+        shortcut = QShortcut(QKeySequence(DIAGNOSTICS_SHORTCUT), self)
+        shortcut.setContext(Qt.ShortcutContext.ApplicationShortcut)
+        shortcut.activated.connect(self.toggle_diagnostics)
+
         self.update_pet_avatar()
 
     def toggle_chat(self):
@@ -591,6 +1097,11 @@ class MainWindow(QMainWindow):
         else:
             self.chat_overlay.show()
 
+    def toggle_diagnostics(self):
+        if self.diagnostics is None:
+            self.diagnostics = DiagnosticsPanel(self.agent, self)
+        self.diagnostics.setVisible(not self.diagnostics.isVisible())
+
     def show_alert(self, message):
         dialog = AlertDialog(message, self)
         dialog.show()
@@ -618,7 +1129,7 @@ class MainWindow(QMainWindow):
             self.update_pet_avatar()
 
     def update_pet_avatar(self):
-        config = load_config()
+        config = get_config()
         avatar_path = config.get('pet', {}).get('avatar_path')
 
         if avatar_path:
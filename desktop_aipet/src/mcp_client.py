@@ -0,0 +1,268 @@
+import asyncio
+import itertools
+import json
+import os
+import sys
+
+# MCP revision spoken by the client.
+PROTOCOL_VERSION = "2024-11-05"
+CLIENT_INFO = {"name": "desktop_aipet", "version": "1.0"}
+# Seconds to wait for a server to answer initialize, and for any other request.
+STARTUP_TIMEOUT = 20
+REQUEST_TIMEOUT = 60
+# Largest single JSON-RPC line read from a server.
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+class MCPError(Exception):
+    """A JSON-RPC error response, or a server that went away mid-request."""
+
+class MCPServerConnection:
+    """
+    A persistent session with one stdio MCP server. Requests are written as
+    newline-delimited JSON-RPC and matched to responses by id, so any number
+    of calls can be in flight on the one process. The server is (re)started
+    on demand if it isn't running.
+    """
+    def __init__(self, name, command, args=(), env=None, cwd=None, timeout=REQUEST_TIMEOUT):
+        self.name = name
+        self.command = command
+        self.args = list(args)
+        self.env = env
+        self.cwd = cwd
+        # Per-call timeout for this server's tools.
+        self.timeout = timeout
+        self.process = None
+        self.server_info = None
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._reader = None
+        self._write_lock = asyncio.Lock()
+        self._start_lock = asyncio.Lock()
+        self._tools = None
+        # Called (synchronously, from the reader) when the server reports its tool list changed.
+        self.on_tools_changed = None
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.returncode is None and self._reader is not None and not self._reader.done()
+
+    async def start(self):
+        async with self._start_lock:
+            if self.running:
+                return
+            env = None
+            if self.env:
+                env = {**os.environ, **self.env}
+            self.process = await asyncio.create_subprocess_exec(
+                self.command, *self.args,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                env=env, cwd=self.cwd, limit=MAX_MESSAGE_BYTES
+            )
+            self._reader = asyncio.create_task(self._read_loop(self.process))
+            self._tools = None
+            try:
+                result = await self._request("initialize", {
+                    "protocolVersion": PROTOCOL_VERSION,
+                    "capabilities": {},
+                    "clientInfo": CLIENT_INFO
+                }, STARTUP_TIMEOUT)
+                self.server_info = result.get("serverInfo")
+                await self._send({"jsonrpc": "2.0", "method": "notifications/initialized"})
+            except BaseException:
+                await self._stop_process()
+                raise
+
+    async def _send(self, message):
+        data = (json.dumps(message) + "\n").encode()
+        async with self._write_lock:
+            self.process.stdin.write(data)
+            await self.process.stdin.drain()
+
+    async def _request(self, method, params, timeout):
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self._send({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params})
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def request(self, method, params=None, timeout=REQUEST_TIMEOUT):
+        """Sends a request, starting the server first if needed, and returns its result."""
+        if not self.running:
+            await self.start()
+        return await self._request(method, params or {}, timeout)
+
+    async def _read_loop(self, process):
+        try:
+            while True:
+                line = await process.stdout.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    print(f"MCP server {self.name} sent invalid JSON: {line[:200]!r}")
+                    continue
+                if "id" in message and ("result" in message or "error" in message):
+                    future = self._pending.get(message["id"])
+                    if future is None or future.done():
+                        continue
+                    if "error" in message:
+                        error = message["error"]
+                        future.set_exception(MCPError(f"{error.get('message', 'error')} (code {error.get('code')})"))
+                    else:
+                        future.set_result(message["result"])
+                elif message.get("method") == "notifications/tools/list_changed":
+                    self._tools = None
+                    if self.on_tools_changed is not None:
+                        self.on_tools_changed(self)
+                elif "id" in message and "method" in message:
+                    # Server-to-client requests (sampling, roots) aren't supported.
+                    await self._send({"jsonrpc": "2.0", "id": message["id"],
+                                      "error": {"code": -32601, "message": "Method not found"}})
+        except Exception as e:
+            print(f"MCP server {self.name} connection error: {e}")
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(MCPError(f"MCP server {self.name} exited"))
+
+    async def list_tools(self):
+        """Returns the server's tools, cached until it reports a change or restarts."""
+        if self._tools is None or not self.running:
+            tools = []
+            cursor = None
+            while True:
+                result = await self.request("tools/list", {"cursor": cursor} if cursor else {})
+                tools.extend(result.get("tools", []))
+                cursor = result.get("nextCursor")
+                if not cursor:
+                    break
+            self._tools = tools
+        return self._tools
+
+    async def call_tool(self, name, arguments):
+        """Calls a tool and returns its text content; a tool-level error raises MCPError."""
+        result = await self.request("tools/call", {"name": name, "arguments": arguments}, self.timeout)
+        text = "\n".join(item.get("text", "") for item in result.get("content", []) if item.get("type") == "text")
+        if result.get("isError"):
+            raise MCPError(text or f"Tool {name} failed")
+        return text
+
+    async def _stop_process(self):
+        process, self.process = self.process, None
+        if process is None:
+            return
+        if process.returncode is None:
+            try:
+                process.stdin.close()
+                await asyncio.wait_for(process.wait(), 2)
+            except (asyncio.TimeoutError, ProcessLookupError, BrokenPipeError, ConnectionResetError):
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    pass
+                await process.wait()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+
+    async def close(self):
+        async with self._start_lock:
+            await self._stop_process()
+
+class MCPClient:
+    """
+    Keeps one persistent connection per stdio MCP server declared in the
+    config's "mcpServers" section and exposes their tools through the
+    agent's ToolRegistry as "<server>__<tool>". When a server reports that
+    its tool list changed, the list is fetched again and the registry synced.
+    """
+    def __init__(self):
+        self.servers = []
+        # Registry names registered per server, for removing tools that went away.
+        self._registered = {}
+        self._refreshes = set()
+
+    def load_config(self, config_path):
+        try:
+            with open(config_path, 'r') as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading MCP config: {e}")
+            return
+        self.load_servers(config.get("mcpServers", {}))
+
+    def load_servers(self, servers):
+        """Adds servers from a {"name": {"command", "args", "env", "cwd", "timeout"}} mapping."""
+        for name, spec in servers.items():
+            command = spec.get("command")
+            if not command:
+                print(f"MCP server {name} has no command; skipping.")
+                continue
+            if command == "python":
+                # Run bundled Python servers with this interpreter.
+                command = sys.executable
+            self.servers.append(MCPServerConnection(name, command, spec.get("args", []), spec.get("env"), spec.get("cwd"),
+                                                    spec.get("timeout", REQUEST_TIMEOUT)))
+
+    async def start(self, registry):
+        """Starts every server concurrently and registers their tools; returns the count registered."""
+        results = await asyncio.gather(*(self._register_server(server, registry) for server in self.servers),
+                                       return_exceptions=True)
+        count = 0
+        for server, result in zip(self.servers, results):
+            if isinstance(result, BaseException):
+                print(f"Error starting MCP server {server.name}: {result}")
+            else:
+                count += result
+        return count
+
+    async def _register_server(self, server, registry):
+        server.on_tools_changed = lambda changed: self._schedule_refresh(changed, registry)
+        await server.start()
+        return await self._sync_tools(server, registry)
+
+    async def _sync_tools(self, server, registry):
+        """Registers the server's current tools and unregisters ones it no longer lists."""
+        tools = await server.list_tools()
+        names = {f"{server.name}__{tool['name']}" for tool in tools}
+        for name in self._registered.get(server.name, set()) - names:
+            registry.unregister(name)
+        self._registered[server.name] = names
+        for tool in tools:
+            registry.register(f"{server.name}__{tool['name']}", self._tool_caller(server, tool["name"]), {
+                "type": "function",
+                "function": {
+                    "name": f"{server.name}__{tool['name']}",
+                    "description": tool.get("description", ""),
+                    "parameters": tool.get("inputSchema", {"type": "object", "properties": {}})
+                }
+            }, timeout=server.timeout)
+        return len(tools)
+
+    def _schedule_refresh(self, server, registry):
+        task = asyncio.create_task(self._refresh(server, registry))
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+
+    async def _refresh(self, server, registry):
+        try:
+            await self._sync_tools(server, registry)
+        except Exception as e:
+            print(f"Error refreshing tools of MCP server {server.name}: {e}")
+
+    @staticmethod
+    def _tool_caller(server, tool_name):
+        async def call(**arguments):
+            return await server.call_tool(tool_name, arguments)
+        return call
+
+    async def close(self):
+        for task in list(self._refreshes):
+            task.cancel()
+        await asyncio.gather(*self._refreshes, return_exceptions=True)
+        await asyncio.gather(*(server.close() for server in self.servers), return_exceptions=True)
@@ -0,0 +1,122 @@
+"""
+Minimal stdio MCP server used as a local stand-in for tests and for trying
+out the MCP client: `python -m desktop_aipet.src.mcp_echo_server`.
+
+Tools:
+    echo: returns its text argument.
+    sleep_echo: waits `seconds`, then returns its text, so concurrent calls
+        can be seen overlapping on one connection.
+    fail: always returns a tool error.
+    add_tool / remove_tool: add or remove an echo tool under the given name
+        and send notifications/tools/list_changed, to exercise tool refresh.
+"""
+import asyncio
+import json
+import os
+import sys
+
+TOOLS = [
+    {
+        "name": "echo",
+        "description": "Echo the given text back.",
+        "inputSchema": {"type": "object", "properties": {"text": {"type": "string"}}, "required": ["text"]}
+    },
+    {
+        "name": "sleep_echo",
+        "description": "Wait for a number of seconds, then echo the text.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {"text": {"type": "string"}, "seconds": {"type": "number"}},
+            "required": ["text", "seconds"]
+        }
+    },
+    {
+        "name": "fail",
+        "description": "Always fails.",
+        "inputSchema": {"type": "object", "properties": {}}
+    },
+    {
+        "name": "add_tool",
+        "description": "Add an echo tool with the given name.",
+        "inputSchema": {"type": "object", "properties": {"name": {"type": "string"}}, "required": ["name"]}
+    },
+    {
+        "name": "remove_tool",
+        "description": "Remove a tool added with add_tool.",
+        "inputSchema": {"type": "object", "properties": {"name": {"type": "string"}}, "required": ["name"]}
+    },
+]
+LIST_CHANGED = {"jsonrpc": "2.0", "method": "notifications/tools/list_changed"}
+# Tools added at runtime with add_tool; they echo like `echo`.
+added_tools = {}
+
+def _text(text, is_error=False):
+    return {"content": [{"type": "text", "text": text}], "isError": is_error}
+
+async def handle(request, notify):
+    method = request.get("method")
+    params = request.get("params") or {}
+    if method == "initialize":
+        return {"protocolVersion": params.get("protocolVersion", "2024-11-05"),
+                "capabilities": {"tools": {"listChanged": True}},
+                "serverInfo": {"name": "echo", "version": "1.0", "pid": os.getpid()}}
+    if method == "tools/list":
+        return {"tools": TOOLS + list(added_tools.values())}
+    if method == "tools/call":
+        name = params.get("name")
+        arguments = params.get("arguments") or {}
+        if name == "echo" or name in added_tools:
+            return _text(arguments.get("text", ""))
+        if name == "sleep_echo":
+            await asyncio.sleep(float(arguments.get("seconds", 0)))
+            return _text(arguments.get("text", ""))
+        if name == "fail":
+            return _text("this tool always fails", is_error=True)
+        if name == "add_tool":
+            added_tools[arguments["name"]] = {**TOOLS[0], "name": arguments["name"]}
+            await notify(LIST_CHANGED)
+            return _text("added")
+        if name == "remove_tool":
+            added_tools.pop(arguments["name"], None)
+            await notify(LIST_CHANGED)
+            return _text("removed")
+        raise LookupError(f"Unknown tool: {name}")
+    raise NotImplementedError(method)
+
+async def main():
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    write_lock = asyncio.Lock()
+
+    async def send(message):
+        async with write_lock:
+            sys.stdout.write(json.dumps(message) + "\n")
+            sys.stdout.flush()
+
+    async def respond(request):
+        try:
+            message = {"jsonrpc": "2.0", "id": request["id"], "result": await handle(request, send)}
+        except NotImplementedError as e:
+            message = {"jsonrpc": "2.0", "id": request["id"], "error": {"code": -32601, "message": f"Method not found: {e}"}}
+        except Exception as e:
+            message = {"jsonrpc": "2.0", "id": request["id"], "error": {"code": -32602, "message": str(e)}}
+        await send(message)
+
+    tasks = set()
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        request = json.loads(line)
+        if "id" not in request:
+            continue  # notification
+        # Each request is handled concurrently; responses go out as they finish.
+        task = asyncio.create_task(respond(request))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,137 +1,423 @@
 import json
 import os
+import copy
 import datetime
-from .database import get_db_connection
-from openai import AsyncOpenAI
+import time
+import asyncio
+import functools
+from .database import get_db_connection, get_read_connection, flush_writes
+from .context_builder import ContextBuilder
+from .summarizer import ChunkedSummarizer
+from .semantic_memory import SemanticMemory, LocalEmbedder, ApiEmbedder, render_memories
+from .response_cache import ResponseCache
+from .title_generator import TitleGenerator
+from .llm_gateway import INTERACTIVE, BACKGROUND, gateway_options
+from .llm_router import LLMRouter, endpoint_configs
+from .tracing import tracer
 
 CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'config.json')
 
-def load_config():
-    if not os.path.exists(CONFIG_PATH):
+# Messages per page when browsing a session's history
+CHAT_PAGE_SIZE = 50
+# Sessions per page in the history dialog
+SESSION_PAGE_SIZE = 100
+# Search results returned by default, and messages indexed per transaction
+# when backfilling the search index of an existing database.
+SEARCH_LIMIT = 50
+SEARCH_BACKFILL_BATCH = 500
+
+# Parsed config and the file mtime it was read at; reloaded when the file changes.
+_config_cache = None
+_config_mtime = None
+
+# Rolling per-session context windows and the cached summaries block.
+context_builder = ContextBuilder()
+
+# Embedders for semantic memory, one per request priority.
+_embedders = {}
+
+# Cached responses of deterministic LLM requests (titles, summaries, embeddings).
+response_cache = ResponseCache()
+
+# Rolling summaries: today's summary is refreshed once this many messages are
+# pending and nothing was said for IDLE_SECONDS. Past days are always completed.
+SUMMARY_MIN_NEW_MESSAGES = 20
+IDLE_SECONDS = 120
+
+# time.monotonic() of the last logged message, for idle detection.
+_last_activity = 0.0
+# Keeps the idle job and the startup catch-up from folding the same rows twice.
+_summary_lock = asyncio.Lock()
+# Whether the missing-API-key notice for summaries has been printed.
+_summary_key_warned = False
+
+# Shared router over the configured endpoints (each with its client and
+# gateway), and the endpoint connection settings it was built for.
+_llm_router = None
+_llm_router_key = None
+
+def get_config():
+    """
+    Returns the cached config, re-reading the file only when its mtime changes.
+    The returned dict is shared; use load_config() for a copy to edit.
+    """
+    global _config_cache, _config_mtime
+    try:
+        mtime = os.stat(CONFIG_PATH).st_mtime_ns
+    except FileNotFoundError:
         raise FileNotFoundError(f"Config file not found at {CONFIG_PATH}")
-    with open(CONFIG_PATH, 'r') as f:
-        return json.load(f)
+    if _config_cache is None or mtime != _config_mtime:
+        with open(CONFIG_PATH, 'r') as f:
+            _config_cache = json.load(f)
+        _config_mtime = mtime
+    return _config_cache
+
+def load_config():
+    return copy.deepcopy(get_config())
 
 def save_config(new_config):
     """Saves the configuration dictionary to the JSON file."""
+    global _config_cache, _config_mtime
     with open(CONFIG_PATH, 'w') as f:
         json.dump(new_config, f, indent=4)
+    _config_cache = copy.deepcopy(new_config)
+    _config_mtime = os.stat(CONFIG_PATH).st_mtime_ns
+
+async def get_llm_client(priority=INTERACTIVE, cheap=False):
+    """
+    Returns a client for the priority class and the model it will use. The
+    client is a view of the shared LLMRouter, which picks an endpoint per
+    request (a cheap model for cheap tasks) and fails over between them;
+    each endpoint's gateway rate-limits, retries and prioritizes. Clients
+    and connection pools are only rebuilt when endpoint URLs, keys or the
+    gateway settings change; model changes apply in place.
+    """
+    global _llm_router, _llm_router_key
+    llm_config = get_config()['llm']
+    configs = endpoint_configs(llm_config)
+    options = gateway_options(llm_config)
 
-async def get_llm_client():
-    config = load_config()
-    api_key = config['llm'].get('api_key')
-    base_url = config['llm'].get('base_url')
-    model = config['llm'].get('model', 'gpt-3.5-turbo')
+    key = json.dumps([[(c.get('name'), c.get('api_key'), c.get('base_url')) for c in configs], options], sort_keys=True)
+    if _llm_router is None or key != _llm_router_key:
+        # The previous clients are left to the garbage collector rather than
+        # closed, as a streaming turn may still be reading from them.
+        _llm_router = LLMRouter.from_configs(configs, options)
+        _llm_router_key = key
+    else:
+        _llm_router.update_models(configs)
+    _llm_router.embedding_name = llm_config.get('embedding_endpoint')
+    return _llm_router.view(priority, cheap), _llm_router.model_for(cheap)
 
-    if not api_key or api_key == "YOUR_API_KEY_HERE":
-        pass
+async def close_llm_client():
+    global _llm_router, _llm_router_key
+    router, _llm_router, _llm_router_key = _llm_router, None, None
+    if router is not None:
+        await router.close()
 
-    return AsyncOpenAI(
-        api_key=api_key,
-        base_url=base_url
-    ), model
+def get_llm_stats():
+    """Per-endpoint latency, health and gateway counters."""
+    return _llm_router.stats() if _llm_router is not None else {}
+
+async def get_embedder(priority=BACKGROUND):
+    """
+    Returns the embedder for semantic memory: the embedding endpoint when
+    llm.embedding_model is set and that endpoint has an API key, else the
+    local stand-in. Its requests go through the gateway at `priority`, so recall
+    on the chat path isn't queued behind background indexing. Rebuilt only
+    when the model or client changes.
+    """
+    client, _ = await get_llm_client(priority)
+    model = get_config()['llm'].get('embedding_model')
+    embedder = _embedders.get(priority)
+    api_key = client.embedding_api_key
+    if not model or not api_key or api_key == "YOUR_API_KEY_HERE":
+        if not isinstance(embedder, LocalEmbedder):
+            embedder = _embedders[priority] = LocalEmbedder()
+    elif not isinstance(embedder, ApiEmbedder) or embedder.name != model or embedder.client is not client:
+        embedder = _embedders[priority] = ApiEmbedder(client, model, cache=response_cache)
+    return embedder
+
+# Embedding-backed recall over all past messages and key events.
+semantic_memory = SemanticMemory(get_embedder)
+
+# Background titling of new sessions.
+title_generator = TitleGenerator(functools.partial(get_llm_client, BACKGROUND, cheap=True), response_cache)
 
 async def create_session(session_id: str, title: str):
     async with get_db_connection() as db:
-        await db.execute('INSERT INTO sessions (id, title) VALUES (?, ?)', (session_id, title))
+        await db.execute('INSERT INTO sessions (id, title, titled) VALUES (?, ?, ?)', (session_id, title, title is not None))
         await db.commit()
 
 async def get_all_sessions():
-    async with get_db_connection() as db:
+    async with get_read_connection() as db:
         async with db.execute('SELECT id, title, created_at FROM sessions ORDER BY created_at DESC') as cursor:
             return await cursor.fetchall()
 
+def _session_filters(since=None, until=None):
+    conditions, params = [], []
+    if since is not None:
+        conditions.append('created_at >= ?')
+        params.append(since)
+    if until is not None:
+        conditions.append('created_at < ?')
+        params.append(until)
+    return conditions, params
+
+async def get_sessions_page(after=None, limit: int = SESSION_PAGE_SIZE, since=None, until=None):
+    """
+    Keyset-paginated sessions, newest first, optionally limited to
+    since <= created_at < until. Returns (rows, has_more) with rows as
+    (id, title, created_at); pass the last row's (created_at, id) as `after`
+    to fetch the next page.
+    """
+    conditions, params = _session_filters(since, until)
+    if after is not None:
+        conditions.append('(created_at, id) < (?, ?)')
+        params.extend(after)
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    async with get_read_connection() as db:
+        async with db.execute(f'SELECT id, title, created_at FROM sessions {where}ORDER BY created_at DESC, id DESC LIMIT ?',
+                              (*params, limit + 1)) as cursor:
+            rows = await cursor.fetchall()
+    return rows[:limit], len(rows) > limit
+
+async def count_sessions(since=None, until=None):
+    conditions, params = _session_filters(since, until)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    async with get_read_connection() as db:
+        async with db.execute(f'SELECT COUNT(*) FROM sessions{where}', params) as cursor:
+            row = await cursor.fetchone()
+    return row[0]
+
 async def get_session_messages(session_id: str):
-    async with get_db_connection() as db:
+    await flush_writes()
+    async with get_read_connection() as db:
         async with db.execute('SELECT role, content, timestamp FROM chat_logs WHERE session_id = ? ORDER BY timestamp ASC', (session_id,)) as cursor:
             return await cursor.fetchall()
 
+async def get_session_messages_page(session_id: str, before=None, limit: int = CHAT_PAGE_SIZE):
+    """
+    Keyset-paginated session history, newest page first. Returns (rows, has_more)
+    where rows are (id, role, content, timestamp) in chronological order. Pass
+    the first row's (timestamp, id) as `before` to fetch the page preceding it.
+    """
+    await flush_writes()
+    async with get_read_connection() as db:
+        if before is None:
+            query = 'SELECT id, role, content, timestamp FROM chat_logs WHERE session_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?'
+            params = (session_id, limit + 1)
+        else:
+            query = 'SELECT id, role, content, timestamp FROM chat_logs WHERE session_id = ? AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT ?'
+            params = (session_id, before[0], before[1], limit + 1)
+        async with db.execute(query, params) as cursor:
+            rows = await cursor.fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    return rows, has_more
+
+def make_fts_query(text: str):
+    """
+    Turns free text into an FTS5 query that matches messages containing every
+    word, the last one as a prefix so results update while typing. Returns
+    None if there is nothing to search for.
+    """
+    terms = text.split()
+    if not terms:
+        return None
+    # Quoting each word keeps FTS5 operators and punctuation literal.
+    quoted = ['"' + term.replace('"', '""') + '"' for term in terms]
+    quoted[-1] += '*'
+    return " ".join(quoted)
+
+async def search_messages(query: str, limit: int = SEARCH_LIMIT, session_id=None):
+    """
+    Full-text search over chat history, best matches first (bm25). Returns rows
+    of (id, session_id, session title, role, snippet, timestamp); the snippet
+    marks matched words with [ ].
+    """
+    fts_query = make_fts_query(query)
+    if fts_query is None:
+        return []
+    params = [fts_query]
+    session_filter = ''
+    if session_id is not None:
+        session_filter = ' AND c.session_id = ?'
+        params.append(session_id)
+    params.append(limit)
+
+    await flush_writes()
+    async with get_read_connection() as db:
+        async with db.execute(
+            "SELECT c.id, c.session_id, s.title, c.role, snippet(chat_logs_fts, 0, '[', ']', '...', 12), c.timestamp "
+            "FROM chat_logs_fts JOIN chat_logs c ON c.id = chat_logs_fts.rowid "
+            "LEFT JOIN sessions s ON s.id = c.session_id "
+            f"WHERE chat_logs_fts MATCH ?{session_filter} ORDER BY bm25(chat_logs_fts) LIMIT ?",
+            params) as cursor:
+            return await cursor.fetchall()
+
+async def backfill_search_index(batch_size: int = SEARCH_BACKFILL_BATCH):
+    """
+    Adds messages logged before the search index existed, one short
+    transaction per batch so chat writes can interleave. A no-op once done.
+    """
+    try:
+        while True:
+            async with get_db_connection() as db:
+                async with db.execute('SELECT indexed_through, last_id FROM search_backfill') as cursor:
+                    row = await cursor.fetchone()
+                if row is None:
+                    return
+                indexed_through, last_id = row
+                upper = min(indexed_through + batch_size, last_id)
+                await db.execute('INSERT INTO chat_logs_fts (rowid, content) SELECT id, content FROM chat_logs WHERE id > ? AND id <= ?',
+                                 (indexed_through, upper))
+                if upper >= last_id:
+                    await db.execute('DELETE FROM search_backfill')
+                else:
+                    await db.execute('UPDATE search_backfill SET indexed_through = ?', (upper,))
+                await db.commit()
+            if upper >= last_id:
+                print("Search index backfill complete.")
+                return
+            # Let the UI and queued writes run between batches.
+            await asyncio.sleep(0)
+    except Exception as e:
+        print(f"Error backfilling search index: {e}")
+
 async def update_session_title(session_id: str, title: str):
     async with get_db_connection() as db:
-        await db.execute('UPDATE sessions SET title = ? WHERE id = ?', (title, session_id))
+        await db.execute('UPDATE sessions SET title = ?, titled = 1 WHERE id = ?', (title, session_id))
         await db.commit()
 
+def record_message(session_id: str, role: str, content: str, timestamp: str):
+    """Appends a message that was just logged to the session's context window."""
+    global _last_activity
+    _last_activity = time.monotonic()
+    context_builder.add_message(session_id, role, content, timestamp)
+
+async def recall_memories(session_id: str):
+    """
+    Returns the rendered past messages and key events most relevant to the
+    session's latest user message, leaving out what is already in its window.
+    """
+    window = await context_builder.get_window(session_id)
+    query = next((content for role, content, _, _, _ in reversed(window.messages) if role == 'user'), None)
+    if not query:
+        return ""
+    try:
+        memories = await semantic_memory.recall(query, exclude={m[:3] for m in window.messages})
+    except Exception as e:
+        print(f"Error recalling memories: {e}")
+        return ""
+    # Embed the new turns after this request has gone out.
+    semantic_memory.schedule_indexing()
+    return render_memories(memories)
+
 async def get_context(session_id: str):
     """
-    1. Fetch the last 5 daily_summaries (descending by date).
-    2. Fetch the last 20 messages from chat_logs for the current session.
-    3. Combine them into a formatted System Prompt context.
+    Returns the formatted System Prompt context: the latest daily summaries,
+    relevant older memories, then as much recent chat history as fits the
+    token budget.
     """
-    async with get_db_connection() as db:
-        # Fetch last 5 daily summaries
-        async with db.execute('SELECT date, summary_text, key_events FROM daily_summaries ORDER BY date DESC LIMIT 5') as cursor:
-            summaries = await cursor.fetchall()
+    return await context_builder.build(session_id, await recall_memories(session_id))
 
-        # Fetch last 20 messages
-        async with db.execute('SELECT role, content, timestamp FROM chat_logs WHERE session_id = ? ORDER BY timestamp DESC LIMIT 20', (session_id,)) as cursor:
-            logs = await cursor.fetchall()
-            logs.reverse() # We want chronological order (oldest first)
+async def get_context_messages(session_id: str, system_prompt: str):
+    """Returns the request messages: a stable system prefix followed by the session's turns."""
+    with tracer.span("context.recall"):
+        memories = await recall_memories(session_id)
+    with tracer.span("context.build") as span:
+        messages = await context_builder.build_messages(session_id, system_prompt, memories)
+        span["messages"] = len(messages)
+    return messages
 
-    context = "=== System Context ===\n"
+def is_idle():
+    return time.monotonic() - _last_activity >= IDLE_SECONDS
 
-    if summaries:
-        context += "--- Previous Days Summaries ---\n"
-        for s in summaries:
-            context += f"Date: {s[0]}\nSummary: {s[1]}\nKey Events: {s[2]}\n\n"
+async def _iter_day_logs(day, after_id=0, last_id=None):
+    """Streams (role, content) rows of a day with after_id < id <= last_id, in insertion order."""
+    if last_id is None:
+        last_id = 2 ** 63 - 1  # largest rowid
+    async with get_read_connection() as db:
+        # `day` is the indexed date(timestamp) column.
+        async with db.execute("SELECT role, content FROM chat_logs WHERE day = ? AND id > ? AND id <= ? ORDER BY id",
+                              (day, after_id, last_id)) as cursor:
+            async for row in cursor:
+                yield row
 
-    if logs:
-        context += "--- Recent Chat History ---\n"
-        for log in logs:
-            # log[2] is timestamp
-            context += f"[{log[2]}] {log[0]}: {log[1]}\n"
+async def _fold_day(summarizer, day, after_id, last_id):
+    """Folds a day's rows after after_id into its stored summary."""
+    async with get_read_connection() as db:
+        async with db.execute('SELECT summary_text, key_events FROM daily_summaries WHERE date = ?', (day,)) as cursor:
+            row = await cursor.fetchone()
+    summary, key_events = '', []
+    if row:
+        summary = row[0] or ''
+        try:
+            key_events = json.loads(row[1] or '[]')
+        except ValueError:
+            key_events = []
 
-    return context
+    result = await summarizer.extend(summary, key_events, _iter_day_logs(day, after_id, last_id))
+    if result is None:
+        return
+    summary, key_events = result
+    async with get_db_connection() as db:
+        await db.execute(
+            'INSERT INTO daily_summaries (date, summary_text, key_events, last_log_id) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(date) DO UPDATE SET summary_text = excluded.summary_text, '
+            'key_events = excluded.key_events, last_log_id = excluded.last_log_id',
+            (day, summary, json.dumps(key_events), last_id))
+        await db.commit()
 
-async def perform_daily_summary():
+async def update_summaries(min_new_messages: int = SUMMARY_MIN_NEW_MESSAGES):
     """
-    1. Query chat_logs where timestamp is today.
-    2. If logs exist, call LLM to summarize and extract key events.
-    3. Insert into daily_summaries.
+    Folds chat_logs rows past the high-water mark (the last summarized id)
+    into each day's running summary. Days before today are always brought up
+    to date, which also catches up days missed while the app was closed;
+    today is only updated once min_new_messages rows are pending.
+    Returns the number of days updated, or None when no API key is set.
     """
-    today = datetime.date.today().isoformat()
-
-    async with get_db_connection() as db:
-        # Check if summary already exists for today
-        async with db.execute('SELECT id FROM daily_summaries WHERE date = ?', (today,)) as cursor:
-            if await cursor.fetchone():
-                print(f"Summary for {today} already exists.")
-                return
-
-        # Fetch logs for today. Assumes timestamp is ISO format YYYY-MM-DD...
-        # SQLite function date() works on such strings.
-        async with db.execute("SELECT role, content FROM chat_logs WHERE date(timestamp) = ?", (today,)) as cursor:
-            logs = await cursor.fetchall()
+    global _summary_key_warned
+    async with _summary_lock:
+        client, model = await get_llm_client(BACKGROUND, cheap=True)
+        if not client.api_key or client.api_key == "YOUR_API_KEY_HERE":
+            # Reported once; the idle job keeps retrying quietly until a key is set.
+            if not _summary_key_warned:
+                print("Skipping LLM summary due to missing API Key.")
+                _summary_key_warned = True
+            return None
+        _summary_key_warned = False
 
-    if not logs:
-        print("No logs for today to summarize.")
-        return
+        await flush_writes()
+        today = datetime.date.today().isoformat()
+        async with get_read_connection() as db:
+            async with db.execute('SELECT COALESCE(MAX(last_log_id), 0) FROM daily_summaries') as cursor:
+                high_water_mark = (await cursor.fetchone())[0]
+            async with db.execute('SELECT day, COUNT(*), MAX(id) FROM chat_logs WHERE id > ? GROUP BY day ORDER BY day',
+                                  (high_water_mark,)) as cursor:
+                pending = await cursor.fetchall()
 
-    log_text = "\n".join([f"{role}: {content}" for role, content in logs])
+        summarizer = ChunkedSummarizer(client, model, cache=response_cache)
+        updated = 0
+        for day, count, last_id in pending:
+            if day is None or (day >= today and count < min_new_messages):
+                continue
+            try:
+                await _fold_day(summarizer, day, high_water_mark, last_id)
+            except Exception as e:
+                # Later days would move the high-water mark past this one.
+                print(f"Error generating summary for {day}: {e}")
+                break
+            print(f"Daily summary for {day} updated.")
+            updated += 1
 
-    # Call LLM
-    try:
-        client, model = await get_llm_client()
-        if not client.api_key or client.api_key == "YOUR_API_KEY_HERE":
-             print("Skipping LLM summary due to missing API Key.")
-             return
-
-        response = await client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant. Summarize the following chat logs and extract key events (facts/todos) as a JSON list."},
-                {"role": "user", "content": f"Chat Logs:\n{log_text}\n\nProvide response in JSON format: {{'summary': 'text', 'key_events': ['event1', 'event2']}}"}
-            ],
-            response_format={"type": "json_object"}
-        )
-        content = response.choices[0].message.content
-        data = json.loads(content)
-        summary_text = data.get('summary', '')
-        key_events = json.dumps(data.get('key_events', []))
-
-        async with get_db_connection() as db:
-            await db.execute('INSERT INTO daily_summaries (date, summary_text, key_events) VALUES (?, ?, ?)', (today, summary_text, key_events))
-            await db.commit()
-            print(f"Daily summary for {today} created.")
+        if updated:
+            context_builder.invalidate_summaries()
+        return updated
 
-    except Exception as e:
-        print(f"Error generating summary: {e}")
+async def summarize_when_idle():
+    """Scheduler job: refreshes the rolling summaries while the user is not chatting."""
+    if is_idle():
+        await update_summaries()
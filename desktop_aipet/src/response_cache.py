@@ -0,0 +1,101 @@
+import hashlib
+import json
+import time
+from .database import get_read_connection, enqueue_write
+
+# How long a cached response stays valid.
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+# Total size of cached responses kept; least recently used entries go first.
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024
+# Eviction runs after this many new entries.
+EVICT_EVERY = 50
+# SQLite's default limit on bound parameters is 999.
+_MAX_KEYS_PER_QUERY = 500
+
+def cache_key(kind, model, payload):
+    """Content address of a request: a hash of its kind, model and parameters."""
+    data = json.dumps({"kind": kind, "model": model, "payload": payload}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+class ResponseCache:
+    """
+    On-disk cache of LLM responses in the llm_cache table, keyed by
+    cache_key(). Entries expire after ttl seconds and the least recently
+    used ones are evicted once the total size passes max_bytes. Writes go
+    through the write-behind queue, so a response stored a moment ago may
+    still miss; that only costs a repeated request.
+    """
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, max_bytes=DEFAULT_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+
+    async def get(self, key):
+        return (await self.get_many([key])).get(key)
+
+    async def get_many(self, keys):
+        """Returns {key: response} for the keys that are cached and fresh."""
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        found = {}
+        async with get_read_connection() as db:
+            for start in range(0, len(keys), _MAX_KEYS_PER_QUERY):
+                batch = keys[start:start + _MAX_KEYS_PER_QUERY]
+                placeholders = ",".join("?" * len(batch))
+                async with db.execute(f'SELECT key, response FROM llm_cache WHERE key IN ({placeholders}) AND created_at > ?',
+                                      (*batch, now - self.ttl)) as cursor:
+                    found.update(await cursor.fetchall())
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        if found:
+            hit_keys = list(found)
+            for start in range(0, len(hit_keys), _MAX_KEYS_PER_QUERY):
+                batch = hit_keys[start:start + _MAX_KEYS_PER_QUERY]
+                placeholders = ",".join("?" * len(batch))
+                await enqueue_write(f'UPDATE llm_cache SET accessed_at = ? WHERE key IN ({placeholders})', (now, *batch))
+        return found
+
+    async def put(self, key, response):
+        """Stores a response (str or bytes)."""
+        now = time.time()
+        size = len(response.encode() if isinstance(response, str) else response)
+        await enqueue_write('INSERT OR REPLACE INTO llm_cache (key, response, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                            (key, response, size, now, now))
+        self._puts += 1
+        if self._puts % EVICT_EVERY == 0:
+            await self.evict()
+
+    async def evict(self):
+        """Drops expired entries, then the least recently used ones beyond max_bytes."""
+        await enqueue_write('DELETE FROM llm_cache WHERE created_at <= ?', (time.time() - self.ttl,))
+        await enqueue_write('''
+            DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS kept FROM llm_cache
+                ) WHERE kept > ?
+            )
+        ''', (self.max_bytes,))
+
+    async def clear(self):
+        await enqueue_write('DELETE FROM llm_cache')
+
+async def cached_completion(client, cache, **params):
+    """
+    Returns the message content of a non-streaming chat completion. With a
+    cache, an identical earlier request (same model, messages and
+    parameters) is answered from it; pass cache=None for calls that
+    shouldn't be cached.
+    """
+    key = None
+    if cache is not None:
+        key = cache_key("chat", params.get("model"), params)
+        content = await cache.get(key)
+        if content is not None:
+            return content
+    response = await client.chat.completions.create(**params)
+    content = response.choices[0].message.content
+    if cache is not None and content is not None:
+        await cache.put(key, content)
+    return content
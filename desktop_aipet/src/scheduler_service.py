@@ -1,14 +1,21 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
-from .memory_service import perform_daily_summary
-from .database import get_db_connection
+from apscheduler.triggers.interval import IntervalTrigger
+from .memory_service import summarize_when_idle, update_summaries
+from .database import get_db_connection, get_read_connection, enqueue_write, flush_writes
 import datetime
 import asyncio
 
 scheduler = AsyncIOScheduler()
 _alert_callback = None
 
+# Reminders per page in the reminder manager
+REMINDER_PAGE_SIZE = 100
+# How often the rolling summaries are refreshed (if the user is idle), and the
+# delay before the startup catch-up so it doesn't compete with app launch.
+SUMMARY_INTERVAL_MINUTES = 10
+SUMMARY_STARTUP_DELAY_SECONDS = 30
+
 def set_alert_callback(callback):
     """Sets the callback function to be called when a reminder triggers."""
     global _alert_callback
@@ -17,11 +24,9 @@ def set_alert_callback(callback):
 async def trigger_alert(reminder_id: int, message: str):
     print(f"ALERT TRIGGERED: {message} (ID: {reminder_id})")
 
-    # Update status in DB
+    # Update status in DB (committed by the background writer)
     try:
-        async with get_db_connection() as db:
-            await db.execute("UPDATE reminders SET status = 'completed' WHERE id = ?", (reminder_id,))
-            await db.commit()
+        await enqueue_write("UPDATE reminders SET status = 'completed' WHERE id = ?", (reminder_id,))
     except Exception as e:
         print(f"Error updating reminder status: {e}")
 
@@ -41,18 +46,25 @@ async def init_scheduler():
     if not scheduler.running:
         scheduler.start()
 
-        # Schedule daily summary
+        # Keep the daily summaries rolling during idle periods
         scheduler.add_job(
-            perform_daily_summary,
-            CronTrigger(hour=0, minute=0),
+            summarize_when_idle,
+            IntervalTrigger(minutes=SUMMARY_INTERVAL_MINUTES),
             id='daily_summary',
             replace_existing=True
         )
+        # Summarize days that ended while the app was closed
+        scheduler.add_job(
+            update_summaries,
+            DateTrigger(run_date=datetime.datetime.now() + datetime.timedelta(seconds=SUMMARY_STARTUP_DELAY_SECONDS)),
+            id='summary_catch_up',
+            replace_existing=True
+        )
 
         # Load pending reminders
         try:
-            async with get_db_connection() as db:
-                async with db.execute("SELECT id, message, run_date FROM reminders WHERE status = 'pending'") as cursor:
+            async with get_read_connection() as db:
+                async with db.execute("SELECT id, message, run_date FROM reminders WHERE status = 'pending' ORDER BY run_date") as cursor:
                     async for row in cursor:
                         r_id, message, run_date_str = row
                         try:
@@ -143,6 +155,8 @@ async def update_reminder(reminder_id: int, message: str, time_iso: str):
         if run_date < datetime.datetime.now():
             return False
 
+        # A queued 'completed' update must not land after this one.
+        await flush_writes()
         async with get_db_connection() as db:
             await db.execute(
                 "UPDATE reminders SET message = ?, run_date = ?, status = 'pending' WHERE id = ?",
@@ -172,7 +186,8 @@ async def update_reminder(reminder_id: int, message: str, time_iso: str):
 async def get_all_reminders():
     reminders = []
     try:
-        async with get_db_connection() as db:
+        await flush_writes()
+        async with get_read_connection() as db:
             async with db.execute("SELECT id, message, run_date, status FROM reminders ORDER BY run_date ASC") as cursor:
                 async for row in cursor:
                     reminders.append({
@@ -184,3 +199,58 @@ async def get_all_reminders():
     except Exception as e:
         print(f"Error fetching reminders: {e}")
     return reminders
+
+def _reminder_filters(status=None, since=None, until=None):
+    conditions, params = [], []
+    if status is not None:
+        conditions.append('status = ?')
+        params.append(status)
+    if since is not None:
+        conditions.append('run_date >= ?')
+        params.append(since)
+    if until is not None:
+        conditions.append('run_date < ?')
+        params.append(until)
+    return conditions, params
+
+async def get_reminders_page(after=None, limit: int = REMINDER_PAGE_SIZE, status=None, since=None, until=None):
+    """
+    Keyset-paginated reminders ordered by run_date, optionally filtered by
+    status and since <= run_date < until. Returns (reminders, has_more); pass
+    the last reminder's (run_date, id) as `after` to fetch the next page.
+    """
+    conditions, params = _reminder_filters(status, since, until)
+    if after is not None:
+        conditions.append('(run_date, id) > (?, ?)')
+        params.extend(after)
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+
+    reminders = []
+    try:
+        await flush_writes()
+        async with get_read_connection() as db:
+            async with db.execute(f"SELECT id, message, run_date, status FROM reminders {where}ORDER BY run_date, id LIMIT ?",
+                                  (*params, limit + 1)) as cursor:
+                async for row in cursor:
+                    reminders.append({
+                        "id": row[0],
+                        "message": row[1],
+                        "run_date": row[2],
+                        "status": row[3]
+                    })
+    except Exception as e:
+        print(f"Error fetching reminders: {e}")
+    return reminders[:limit], len(reminders) > limit
+
+async def count_reminders(status=None, since=None, until=None):
+    conditions, params = _reminder_filters(status, since, until)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    try:
+        await flush_writes()
+        async with get_read_connection() as db:
+            async with db.execute(f"SELECT COUNT(*) FROM reminders{where}", params) as cursor:
+                row = await cursor.fetchone()
+        return row[0]
+    except Exception as e:
+        print(f"Error counting reminders: {e}")
+        return 0
@@ -0,0 +1,351 @@
+import asyncio
+import hashlib
+import json
+import re
+import zlib
+import numpy as np
+from .database import get_db_connection, get_read_connection, flush_writes
+from .response_cache import cache_key
+from .llm_gateway import INTERACTIVE, BACKGROUND
+
+try:
+    import hnswlib  # Optional approximate nearest-neighbour index
+except ImportError:
+    hnswlib = None
+
+# Memories injected into the context per turn, and the minimum cosine
+# similarity for a memory to count as relevant.
+RECALL_COUNT = 5
+MIN_SIMILARITY = 0.35
+# Texts sent per embeddings request while indexing.
+EMBED_BATCH = 64
+# Dimension of the local stand-in embeddings.
+LOCAL_EMBEDDING_DIM = 256
+# Above this many vectors the ANN index is used when hnswlib is installed.
+ANN_MIN_ITEMS = 50000
+
+_WORD_RE = re.compile(r"\w+")
+
+def to_blob(vector):
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+def from_blob(blob):
+    return np.frombuffer(blob, dtype=np.float32)
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def event_hash(event):
+    return hashlib.sha1(" ".join(event.split()).casefold().encode()).hexdigest()
+
+class LocalEmbedder:
+    """
+    Offline stand-in for an embeddings endpoint: hashes words (and the
+    characters and character bigrams of non-ASCII words, for CJK) into a
+    fixed-size vector. Only captures word overlap, but needs no network or
+    model files.
+    """
+    def __init__(self, dim=LOCAL_EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"local-hash-{dim}"
+
+    def _features(self, text):
+        for word in _WORD_RE.findall(text.lower()):
+            yield word
+            if not word.isascii() and len(word) > 1:
+                yield from word
+                for i in range(len(word) - 1):
+                    yield word[i:i + 2]
+
+    async def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode())
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return normalize(vectors)
+
+class ApiEmbedder:
+    """
+    Embeddings from the configured OpenAI-compatible endpoint. With a
+    ResponseCache, texts embedded before aren't sent again.
+    """
+    def __init__(self, client, model, cache=None):
+        self.client = client
+        self.name = model
+        self.cache = cache
+
+    async def embed(self, texts):
+        texts = list(texts)
+        if self.cache is None:
+            return await self._request(texts)
+        keys = [cache_key("embedding", self.name, text) for text in texts]
+        cached = await self.cache.get_many(keys)
+        missing = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in cached))
+        if missing:
+            for text, vector in zip(missing, await self._request(missing)):
+                key = cache_key("embedding", self.name, text)
+                cached[key] = to_blob(vector)
+                await self.cache.put(key, cached[key])
+        return np.stack([from_blob(cached[key]) for key in keys])
+
+    async def _request(self, texts):
+        response = await self.client.embeddings.create(model=self.name, input=texts)
+        return normalize([item.embedding for item in sorted(response.data, key=lambda d: d.index)])
+
+class VectorIndex:
+    """
+    In-memory cosine-similarity index over normalized vectors. Search is a
+    brute-force NumPy dot product, or hnswlib's ANN index for large indexes
+    when that package is installed.
+    """
+    def __init__(self):
+        self.keys = []
+        self._vectors = None
+        self._ann = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, keys, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(keys):
+            return
+        start = len(self.keys)
+        if self._vectors is None:
+            self._vectors = np.empty((max(len(keys), 1024), vectors.shape[1]), dtype=np.float32)
+        elif start + len(keys) > len(self._vectors):
+            # Grow geometrically so appends stay amortized O(1).
+            grown = np.empty((max(2 * len(self._vectors), start + len(keys)), self._vectors.shape[1]), dtype=np.float32)
+            grown[:start] = self._vectors[:start]
+            self._vectors = grown
+        self._vectors[start:start + len(keys)] = vectors
+        self.keys.extend(keys)
+        if self._ann is not None:
+            self._ann_add(start, vectors)
+
+    def _ann_add(self, start, vectors):
+        capacity = self._ann.get_max_elements()
+        if start + len(vectors) > capacity:
+            self._ann.resize_index(max(2 * capacity, start + len(vectors)))
+        self._ann.add_items(vectors, np.arange(start, start + len(vectors)))
+
+    def _build_ann(self):
+        self._ann = hnswlib.Index(space='ip', dim=self._vectors.shape[1])
+        self._ann.init_index(max_elements=2 * len(self.keys), ef_construction=200, M=16)
+        self._ann_add(0, self._vectors[:len(self.keys)])
+
+    def search(self, query, k):
+        """Returns up to k (key, similarity) pairs, most similar first."""
+        n = len(self.keys)
+        if n == 0 or k <= 0:
+            return []
+        k = min(k, n)
+        if hnswlib is not None and n >= ANN_MIN_ITEMS:
+            if self._ann is None:
+                self._build_ann()
+            self._ann.set_ef(max(50, 2 * k))
+            labels, distances = self._ann.knn_query(query, k=k)
+            return [(self.keys[i], 1.0 - float(d)) for i, d in zip(labels[0], distances[0])]
+
+        scores = self._vectors[:n] @ query
+        top = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+        top = top[np.argsort(-scores[top])]
+        return [(self.keys[i], float(scores[i])) for i in top]
+
+class SemanticMemory:
+    """
+    Embedding-backed long-term memory over chat messages and summary key
+    events. Vectors are stored in SQLite per embedding model and loaded into
+    a VectorIndex once; new messages are indexed past a high-water mark so
+    every message is embedded exactly once. `get_embedder(priority)` is an
+    async callable returning the embedder to use at that request priority.
+    """
+    def __init__(self, get_embedder):
+        self.get_embedder = get_embedder
+        self._model = None
+        self._index = VectorIndex()
+        self._indexed_through = 0
+        self._event_hashes = set()
+        # Embeddings of recent queries, reused when their message is indexed.
+        self._query_vectors = {}
+        # Held while indexing; _load_lock only while (re)loading the index.
+        self._lock = asyncio.Lock()
+        self._load_lock = asyncio.Lock()
+        self._indexing = None
+        self._stopping = False
+
+    async def _load(self, embedder):
+        """Loads the stored vectors for the embedder's model, once per model."""
+        if self._model == embedder.name:
+            return
+        async with self._load_lock:
+            if self._model != embedder.name:
+                await self._load_vectors(embedder)
+
+    async def _load_vectors(self, embedder):
+        index = VectorIndex()
+        indexed_through = 0
+        event_hashes = set()
+        async with get_read_connection() as db:
+            async with db.execute('SELECT log_id, vector FROM message_embeddings WHERE model = ? ORDER BY log_id',
+                                  (embedder.name,)) as cursor:
+                keys, vectors = [], []
+                async for log_id, blob in cursor:
+                    keys.append(('message', log_id))
+                    vectors.append(from_blob(blob))
+                    indexed_through = log_id
+                index.add(keys, vectors)
+            async with db.execute('SELECT event_hash, date, event, vector FROM event_embeddings WHERE model = ?',
+                                  (embedder.name,)) as cursor:
+                keys, vectors = [], []
+                async for h, date, event, blob in cursor:
+                    keys.append(('event', date, event))
+                    vectors.append(from_blob(blob))
+                    event_hashes.add(h)
+                index.add(keys, vectors)
+        self._model = embedder.name
+        self._index = index
+        self._indexed_through = indexed_through
+        self._event_hashes = event_hashes
+        self._query_vectors.clear()
+
+    async def _embed(self, embedder, texts):
+        vectors = [self._query_vectors.pop(text, None) for text in texts]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            embedded = await embedder.embed([texts[i] for i in missing])
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+        return vectors
+
+    async def index_pending(self, batch_size=EMBED_BATCH):
+        """Embeds and stores messages and key events that have no vector yet."""
+        async with self._lock:
+            embedder = await self.get_embedder(BACKGROUND)
+            await self._load(embedder)
+            await flush_writes()
+            while not self._stopping:
+                async with get_read_connection() as db:
+                    async with db.execute("SELECT id, content FROM chat_logs WHERE id > ? ORDER BY id LIMIT ?",
+                                          (self._indexed_through, batch_size)) as cursor:
+                        rows = await cursor.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                # Rows without content (tool call placeholders) are skipped.
+                rows = [(log_id, content) for log_id, content in rows if content]
+                if rows:
+                    vectors = await self._embed(embedder, [content for _, content in rows])
+                    if self._model != embedder.name:
+                        # The index was reloaded for another model; the next run indexes for that one.
+                        return
+                    async with get_db_connection() as db:
+                        await db.executemany('INSERT OR REPLACE INTO message_embeddings (model, log_id, vector) VALUES (?, ?, ?)',
+                                             [(embedder.name, log_id, to_blob(v)) for (log_id, _), v in zip(rows, vectors)])
+                        await db.commit()
+                    self._index.add([('message', log_id) for log_id, _ in rows], vectors)
+                self._indexed_through = last_id
+                await asyncio.sleep(0)
+            if not self._stopping:
+                await self._index_events(embedder)
+
+    async def _index_events(self, embedder):
+        pending = {}
+        async with get_read_connection() as db:
+            async with db.execute('SELECT date, key_events FROM daily_summaries ORDER BY date') as cursor:
+                async for date, key_events in cursor:
+                    try:
+                        events = json.loads(key_events or '[]')
+                    except ValueError:
+                        continue
+                    for event in events:
+                        h = event_hash(str(event))
+                        if h not in self._event_hashes and h not in pending:
+                            pending[h] = (date, str(event))
+        if not pending:
+            return
+        items = list(pending.items())
+        vectors = await self._embed(embedder, [event for _, (_, event) in items])
+        if self._model != embedder.name:
+            return
+        async with get_db_connection() as db:
+            await db.executemany('INSERT OR REPLACE INTO event_embeddings (model, event_hash, date, event, vector) VALUES (?, ?, ?, ?, ?)',
+                                 [(embedder.name, h, date, event, to_blob(v)) for (h, (date, event)), v in zip(items, vectors)])
+            await db.commit()
+        self._index.add([('event', date, event) for _, (date, event) in items], vectors)
+        self._event_hashes.update(pending)
+
+    def schedule_indexing(self):
+        """Starts index_pending() in the background unless it is already running."""
+        if self._indexing is None or self._indexing.done():
+            self._indexing = asyncio.create_task(self._index_in_background())
+
+    async def close(self):
+        """
+        Stops background indexing after its current batch. The task is not
+        cancelled, so no connection is left half-opened.
+        """
+        if self._indexing is not None:
+            self._stopping = True
+            try:
+                await self._indexing
+            finally:
+                self._stopping = False
+                self._indexing = None
+
+    async def _index_in_background(self):
+        try:
+            await self.index_pending()
+        except Exception as e:
+            print(f"Error indexing memories: {e}")
+
+    async def recall(self, query, k=RECALL_COUNT, exclude=()):
+        """
+        Returns up to k stored memories most similar to the query as
+        (kind, text, when, similarity), skipping messages whose
+        (role, content, timestamp) is in `exclude`.
+        """
+        embedder = await self.get_embedder(INTERACTIVE)
+        await self._load(embedder)
+        vector = (await embedder.embed([query]))[0]
+        # The query is normally the message just sent; keep its vector for indexing.
+        self._query_vectors[query] = vector
+        while len(self._query_vectors) > EMBED_BATCH:
+            self._query_vectors.pop(next(iter(self._query_vectors)))
+
+        hits = [(key, score) for key, score in self._index.search(vector, 3 * k + len(exclude))
+                if score >= MIN_SIMILARITY]
+        log_ids = [key[1] for key, _ in hits if key[0] == 'message']
+        messages = {}
+        if log_ids:
+            async with get_read_connection() as db:
+                placeholders = ",".join("?" * len(log_ids))
+                async with db.execute(f'SELECT id, role, content, timestamp FROM chat_logs WHERE id IN ({placeholders})',
+                                      log_ids) as cursor:
+                    async for log_id, role, content, timestamp in cursor:
+                        messages[log_id] = (role, content, timestamp)
+
+        exclude = set(exclude)
+        memories = []
+        for key, score in hits:
+            if key[0] == 'event':
+                memories.append(('event', key[2], key[1], score))
+            elif key[1] in messages and messages[key[1]] not in exclude:
+                role, content, timestamp = messages[key[1]]
+                memories.append(('message', f"{role}: {content}", timestamp, score))
+            if len(memories) == k:
+                break
+        return memories
+
+def render_memories(memories):
+    lines = []
+    for kind, text, when, _ in memories:
+        if kind == 'event':
+            lines.append(f"Key Event ({when}): {text}\n")
+        else:
+            lines.append(f"[{when}] {text}\n")
+    return "".join(lines)
@@ -0,0 +1,156 @@
+import asyncio
+import json
+from .context_builder import estimate_tokens
+from .response_cache import cached_completion
+
+# Token budget for the log text sent in one summarization request.
+CHUNK_TOKEN_BUDGET = 3000
+# Maximum number of summarization requests in flight at once.
+MAX_CONCURRENT_REQUESTS = 4
+
+MAP_PROMPT = "You are a helpful assistant. Summarize the following chat logs and extract key events (facts/todos) as a JSON list."
+REDUCE_PROMPT = "You are a helpful assistant. Combine the following partial summaries of one day's chat logs, in order, into a single summary."
+
+def parse_summary(content):
+    """Parses an LLM JSON reply into (summary, key_events)."""
+    data = json.loads(content)
+    summary = data.get('summary', '')
+    key_events = data.get('key_events', [])
+    if isinstance(key_events, str):
+        key_events = [key_events]
+    return summary, [str(event) for event in key_events if event]
+
+def merge_key_events(*event_lists):
+    """Concatenates key event lists, dropping repeats (ignoring case and spacing)."""
+    seen = set()
+    merged = []
+    for events in event_lists:
+        for event in events:
+            key = " ".join(event.split()).casefold()
+            if key and key not in seen:
+                seen.add(key)
+                merged.append(event)
+    return merged
+
+def split_text(text, budget, tokenizer=estimate_tokens):
+    """Splits text that exceeds the budget into consecutive pieces that fit."""
+    pieces = []
+    while True:
+        tokens = tokenizer(text)
+        if tokens <= budget:
+            pieces.append(text)
+            return pieces
+        cut = max(1, len(text) * budget // tokens)
+        while cut > 1 and tokenizer(text[:cut]) > budget:
+            cut = cut * 9 // 10
+        pieces.append(text[:cut])
+        text = text[cut:]
+
+class ChunkedSummarizer:
+    """
+    Summarizes arbitrarily long chat logs with a map-reduce pass: the logs are
+    split into chunks that fit the token budget, each chunk is summarized
+    (several at a time), and the partial summaries are combined until one is
+    left. Key events are taken from every chunk and de-duplicated. With a
+    ResponseCache, re-summarizing the same text is answered from it.
+    """
+    def __init__(self, client, model, chunk_budget=CHUNK_TOKEN_BUDGET,
+                 max_concurrency=MAX_CONCURRENT_REQUESTS, tokenizer=estimate_tokens, cache=None):
+        self.client = client
+        self.model = model
+        self.cache = cache
+        self.chunk_budget = chunk_budget
+        self.tokenizer = tokenizer
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def summarize(self, rows):
+        """
+        Summarizes (role, content) rows from an async iterable, e.g. a cursor.
+        Chunks are sent off as soon as they fill up, so the first requests run
+        while the rest of the rows are still being read. Returns
+        (summary, key_events), or None if there were no rows.
+        """
+        tasks = []
+        try:
+            async for chunk in self._chunks(rows):
+                tasks.append(asyncio.create_task(self._summarize_chunk(chunk)))
+            if not tasks:
+                return None
+            partials = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        key_events = merge_key_events(*(events for _, events in partials))
+        summary = await self._reduce([summary for summary, _ in partials])
+        return summary, key_events
+
+    async def extend(self, summary, key_events, rows):
+        """
+        Folds new rows into an existing running summary. Returns the updated
+        (summary, key_events), or None if there were no rows.
+        """
+        result = await self.summarize(rows)
+        if result is None:
+            return None
+        new_summary, new_events = result
+        if summary:
+            new_summary = await self._combine([summary, new_summary])
+        return new_summary, merge_key_events(key_events, new_events)
+
+    async def _chunks(self, rows):
+        lines = []
+        tokens = 0
+        async for role, content in rows:
+            for line in split_text(f"{role}: {content}", self.chunk_budget, self.tokenizer):
+                line_tokens = self.tokenizer(line) + 1
+                if lines and tokens + line_tokens > self.chunk_budget:
+                    yield "\n".join(lines)
+                    lines, tokens = [], 0
+                lines.append(line)
+                tokens += line_tokens
+        if lines:
+            yield "\n".join(lines)
+
+    async def _complete(self, messages, **kwargs):
+        async with self._semaphore:
+            return await cached_completion(self.client, self.cache, model=self.model, messages=messages, **kwargs)
+
+    async def _summarize_chunk(self, log_text):
+        content = await self._complete([
+            {"role": "system", "content": MAP_PROMPT},
+            {"role": "user", "content": f"Chat Logs:\n{log_text}\n\nProvide response in JSON format: {{'summary': 'text', 'key_events': ['event1', 'event2']}}"}
+        ], response_format={"type": "json_object"})
+        return parse_summary(content)
+
+    async def _reduce(self, summaries):
+        # Combine neighbouring summaries in groups that fit the budget until
+        # one is left; groups of a single summary are passed through as is.
+        while len(summaries) > 1:
+            groups = []
+            tokens = 0
+            for summary in summaries:
+                summary_tokens = self.tokenizer(summary) + 1
+                if groups and tokens + summary_tokens <= self.chunk_budget:
+                    groups[-1].append(summary)
+                    tokens += summary_tokens
+                else:
+                    groups.append([summary])
+                    tokens = summary_tokens
+            if len(groups) == len(summaries):
+                # No two summaries fit together; keep them all rather than loop.
+                return "\n".join(summaries)
+            summaries = await asyncio.gather(*(self._combine(group) for group in groups))
+        return summaries[0] if summaries else ""
+
+    async def _combine(self, group):
+        if len(group) == 1:
+            return group[0]
+        parts = "\n\n".join(f"Part {i}:\n{summary}" for i, summary in enumerate(group, 1))
+        content = await self._complete([
+            {"role": "system", "content": REDUCE_PROMPT},
+            {"role": "user", "content": f"Partial Summaries:\n{parts}\n\nProvide response in JSON format: {{'summary': 'text'}}"}
+        ], response_format={"type": "json_object"})
+        summary, _ = parse_summary(content)
+        return summary
@@ -0,0 +1,108 @@
+import asyncio
+import json
+from .database import get_read_connection, enqueue_write
+from .response_cache import cached_completion
+
+# Seconds to wait for more sessions to join a batch before asking for titles.
+TITLE_BATCH_DELAY = 0.5
+# Sessions titled per request, and the characters of each message included.
+MAX_TITLE_BATCH = 8
+BATCH_MESSAGE_CHARS = 500
+
+TITLE_PROMPT = "Generate a short (3-5 words) title for this conversation based on this message: {message}"
+BATCH_TITLE_PROMPT = ("Generate a short (3-5 words) title for each of the following conversations based on its first message. "
+                      "Reply in JSON format: {{\"titles\": {{\"1\": \"title\", \"2\": \"title\"}}}}\n\n{messages}")
+
+def clean_title(title):
+    return " ".join(str(title).split()).strip('"\'') or None
+
+class TitleGenerator:
+    """
+    Titles new sessions in the background, off the chat turn. request() only
+    queues the session; a worker checks the sessions' `titled` flag, asks
+    the model for the titles of all pending sessions in one request, and
+    stores them. Sessions whose title couldn't be generated stay untitled
+    and are queued again on their next turn.
+    """
+    def __init__(self, get_client, cache=None, batch_delay=TITLE_BATCH_DELAY, max_batch=MAX_TITLE_BATCH):
+        self.get_client = get_client
+        self.cache = cache
+        self.batch_delay = batch_delay
+        self.max_batch = max_batch
+        self._pending = {}
+        # Sessions known to have a title (or no sessions row), so later turns skip the queue.
+        self._done = set()
+        self._worker = None
+        self._stopping = False
+
+    def request(self, session_id, message):
+        """Queues a title for the session, based on its message, unless it already has one."""
+        if session_id in self._done or self._stopping:
+            return
+        self._pending.setdefault(session_id, message)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self._pending and not self._stopping:
+            await asyncio.sleep(self.batch_delay)
+            batch = dict(list(self._pending.items())[:self.max_batch])
+            for session_id in batch:
+                del self._pending[session_id]
+            try:
+                await self.generate(batch)
+            except Exception as e:
+                print(f"Error generating session titles: {e}")
+
+    async def generate(self, batch):
+        """Titles the untitled sessions among {session_id: message}; returns {session_id: title}."""
+        placeholders = ",".join("?" * len(batch))
+        async with get_read_connection() as db:
+            async with db.execute(f'SELECT id, titled FROM sessions WHERE id IN ({placeholders})', list(batch)) as cursor:
+                rows = await cursor.fetchall()
+        self._done.update(set(batch) - {session_id for session_id, titled in rows if not titled})
+        untitled = [session_id for session_id, titled in rows if not titled]
+        if not untitled:
+            return {}
+
+        client, model = await self.get_client()
+        if not client.api_key or client.api_key == "YOUR_API_KEY_HERE":
+            return {}
+        if len(untitled) == 1:
+            content = await cached_completion(client, self.cache, model=model, messages=[
+                {"role": "user", "content": TITLE_PROMPT.format(message=batch[untitled[0]])}
+            ])
+            titles = {untitled[0]: clean_title(content or "")}
+        else:
+            messages = "\n".join(f"{i}. {' '.join(batch[session_id].split())[:BATCH_MESSAGE_CHARS]}"
+                                 for i, session_id in enumerate(untitled, 1))
+            content = await cached_completion(client, self.cache, model=model, messages=[
+                {"role": "user", "content": BATCH_TITLE_PROMPT.format(messages=messages)}
+            ], response_format={"type": "json_object"})
+            try:
+                numbered = json.loads(content).get("titles", {})
+            except (TypeError, ValueError, AttributeError):
+                numbered = {}
+            titles = {session_id: clean_title(numbered.get(str(i)) or "")
+                      for i, session_id in enumerate(untitled, 1)}
+
+        titles = {session_id: title for session_id, title in titles.items() if title}
+        for session_id, title in titles.items():
+            await enqueue_write('UPDATE sessions SET title = ?, titled = 1 WHERE id = ?', (title, session_id))
+        self._done.update(titles)
+        return titles
+
+    async def close(self):
+        """
+        Stops the worker after its current batch, dropping sessions that
+        haven't been titled yet. The task is not cancelled, so no connection
+        is left half-opened.
+        """
+        self._pending.clear()
+        if self._worker is not None:
+            self._stopping = True
+            try:
+                await asyncio.gather(self._worker, return_exceptions=True)
+            finally:
+                self._stopping = False
+                self._worker = None
@@ -0,0 +1,254 @@
+import datetime
+import inspect
+import json
+import re
+import types
+import typing
+
+_JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean", list: "array", dict: "object"}
+_ARGS_HEADER = re.compile(r"^\s*(Args|Arguments|Parameters):\s*$")
+_ARG_LINE = re.compile(r"^\s*(\w+)\s*(?:\([^)]*\))?:\s*(.+)$")
+
+class ToolArgumentError(ValueError):
+    """Raised when tool arguments don't match the schema; `errors` lists each problem."""
+    def __init__(self, errors):
+        super().__init__("; ".join(f"{e['field']}: {e['message']}" for e in errors))
+        self.errors = errors
+
+class _Invalid(Exception):
+    pass
+
+def _parse_docstring(func):
+    """Returns (description, {param: description}) from a Google-style docstring."""
+    doc = inspect.getdoc(func) or ""
+    description_lines, params = [], {}
+    in_args = False
+    for line in doc.splitlines():
+        if _ARGS_HEADER.match(line):
+            in_args = True
+            continue
+        if in_args:
+            match = _ARG_LINE.match(line)
+            if match:
+                params[match.group(1)] = match.group(2).strip()
+            elif line.strip() and not line.startswith((" ", "\t")):
+                in_args = False
+        elif not params:
+            description_lines.append(line)
+    return " ".join(" ".join(description_lines).split()), params
+
+def type_schema(annotation):
+    """JSON schema for a Python type annotation."""
+    if annotation is inspect.Parameter.empty or annotation is typing.Any:
+        return {}
+    if annotation is datetime.datetime:
+        return {"type": "string", "format": "date-time"}
+    if annotation is datetime.date:
+        return {"type": "string", "format": "date"}
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is typing.Union or origin is types.UnionType:
+        options = [type_schema(a) for a in args if a is not type(None)]
+        return options[0] if len(options) == 1 else {"anyOf": options}
+    if origin is typing.Literal:
+        schema = {"enum": list(args)}
+        if args and type(args[0]) in _JSON_TYPES:
+            schema["type"] = _JSON_TYPES[type(args[0])]
+        return schema
+    if origin in (list, tuple, set):
+        return {"type": "array", "items": type_schema(args[0])} if args else {"type": "array"}
+    if origin is dict:
+        return {"type": "object"}
+    if annotation in _JSON_TYPES:
+        return {"type": _JSON_TYPES[annotation]}
+    return {}
+
+def schema_from_function(func, name=None):
+    """
+    Builds an OpenAI function-tool schema from a function's signature, type
+    hints and docstring (summary plus an Args: section).
+    """
+    description, param_docs = _parse_docstring(func)
+    hints = typing.get_type_hints(func)
+    properties, required = {}, []
+    for param in inspect.signature(func).parameters.values():
+        if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+            continue
+        prop = type_schema(hints.get(param.name, param.annotation))
+        if param.name in param_docs:
+            prop["description"] = param_docs[param.name]
+        properties[param.name] = prop
+        if param.default is param.empty:
+            required.append(param.name)
+    return {
+        "type": "function",
+        "function": {
+            "name": name or func.__name__,
+            "description": description,
+            "parameters": {"type": "object", "properties": properties, "required": required,
+                           "additionalProperties": False}
+        }
+    }
+
+def _parse_datetime(value):
+    # fromisoformat() before 3.11 rejects a trailing Z.
+    if value.endswith(("Z", "z")):
+        value = value[:-1] + "+00:00"
+    return datetime.datetime.fromisoformat(value)
+
+def _compile(schema, convert_formats):
+    """Returns a function that checks/coerces one value against the schema node."""
+    if "anyOf" in schema:
+        options = [_compile(option, convert_formats) for option in schema["anyOf"]]
+
+        def check_any(value):
+            for option in options:
+                try:
+                    return option(value)
+                except _Invalid:
+                    pass
+            raise _Invalid("does not match any allowed type")
+        return check_any
+
+    if "enum" in schema:
+        allowed = schema["enum"]
+
+        def check_enum(value):
+            if value not in allowed:
+                raise _Invalid(f"must be one of {allowed}")
+            return value
+        return check_enum
+
+    kind = schema.get("type")
+    if kind == "string":
+        parser = {"date-time": _parse_datetime, "date": datetime.date.fromisoformat}.get(schema.get("format"))
+        label = "an ISO 8601 date-time" if schema.get("format") == "date-time" else "an ISO 8601 date"
+
+        def check_string(value):
+            if not isinstance(value, str):
+                raise _Invalid("expected a string")
+            if parser is None:
+                return value
+            try:
+                parsed = parser(value)
+            except ValueError:
+                raise _Invalid(f"expected {label}, got {value!r}")
+            return parsed if convert_formats else value
+        return check_string
+
+    if kind == "integer":
+        def check_integer(value):
+            if isinstance(value, bool):
+                raise _Invalid("expected an integer")
+            if isinstance(value, int):
+                return value
+            if isinstance(value, float) and value.is_integer():
+                return int(value)
+            if isinstance(value, str):
+                try:
+                    return int(value.strip())
+                except ValueError:
+                    pass
+            raise _Invalid("expected an integer")
+        return check_integer
+
+    if kind == "number":
+        def check_number(value):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return value
+            if isinstance(value, str):
+                try:
+                    return float(value.strip())
+                except ValueError:
+                    pass
+            raise _Invalid("expected a number")
+        return check_number
+
+    if kind == "boolean":
+        def check_boolean(value):
+            if isinstance(value, bool):
+                return value
+            if isinstance(value, str) and value.lower() in ("true", "false"):
+                return value.lower() == "true"
+            raise _Invalid("expected a boolean")
+        return check_boolean
+
+    if kind == "array":
+        item = _compile(schema.get("items", {}), convert_formats)
+
+        def check_array(value):
+            if not isinstance(value, list):
+                raise _Invalid("expected an array")
+            return [item(v) for v in value]
+        return check_array
+
+    if kind == "object":
+        def check_object(value):
+            if not isinstance(value, dict):
+                raise _Invalid("expected an object")
+            return value
+        return check_object
+
+    return lambda value: value
+
+def parse_arguments(arguments):
+    """Parses a tool call's JSON argument string (or passes a dict through)."""
+    if isinstance(arguments, dict):
+        return arguments
+    if not arguments or arguments.strip() in ("", "{}"):
+        return {}
+    try:
+        args = json.loads(arguments)
+    except ValueError as e:
+        raise ToolArgumentError([{"field": "(arguments)", "message": f"invalid JSON: {e}"}])
+    if not isinstance(args, dict):
+        raise ToolArgumentError([{"field": "(arguments)", "message": "expected a JSON object"}])
+    return args
+
+def compile_validator(parameters, convert_formats=False):
+    """
+    Compiles a function-parameters schema into validate(arguments) that
+    parses the JSON argument string (or takes a dict), checks and coerces each
+    value, and returns the keyword arguments or raises ToolArgumentError.
+    With convert_formats, date-time/date strings become datetime/date objects.
+    Keys not in `properties` follow `additionalProperties`: kept when it is
+    missing or true, checked against it when it is a schema, rejected when
+    it is false. Without a schema, arguments are only parsed.
+    """
+    if parameters is None:
+        return parse_arguments
+    properties = parameters.get("properties", {})
+    checks = [(name, _compile(prop, convert_formats)) for name, prop in properties.items()]
+    required = [name for name in parameters.get("required", []) if name in properties]
+    extra = parameters.get("additionalProperties", True)
+    check_extra = _compile(extra, convert_formats) if isinstance(extra, dict) else None
+
+    def validate(arguments):
+        args = parse_arguments(arguments)
+        errors = []
+        kwargs = {}
+        for name, check in checks:
+            if name in args:
+                try:
+                    kwargs[name] = check(args[name])
+                except _Invalid as e:
+                    errors.append({"field": name, "message": str(e)})
+        for name in required:
+            if name not in args:
+                errors.append({"field": name, "message": "missing required argument"})
+        for name, value in args.items():
+            if name in properties:
+                continue
+            if extra is False:
+                errors.append({"field": name, "message": "unexpected argument"})
+            elif check_extra is None:
+                kwargs[name] = value
+            else:
+                try:
+                    kwargs[name] = check_extra(value)
+                except _Invalid as e:
+                    errors.append({"field": name, "message": str(e)})
+        if errors:
+            raise ToolArgumentError(errors)
+        return kwargs
+    return validate
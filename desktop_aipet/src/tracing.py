@@ -0,0 +1,124 @@
+"""
+Lightweight latency tracing. Spans (a name, a duration and a few
+attributes) are kept in an in-memory ring buffer and can also be appended to
+a JSONL file. Spans recorded while a turn runs carry its turn id, so a slow
+turn can be broken down into DB, context, LLM, tool and render time.
+"""
+import collections
+import contextvars
+import itertools
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# Spans kept in memory; older ones are dropped.
+DEFAULT_CAPACITY = 5000
+# Spans buffered before they are appended to the JSONL sink.
+SINK_BATCH = 100
+
+# Relative sink paths are resolved against the app directory (next to data/).
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Id of the turn the current task is working on, if any.
+current_turn = contextvars.ContextVar("current_turn", default=None)
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list, 0 <= q <= 1."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class Tracer:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.enabled = True
+        self.spans = collections.deque(maxlen=capacity)
+        self.sink_path = None
+        self._sink_buffer = []
+        self._turn_ids = itertools.count(1)
+
+    def configure(self, config):
+        """Applies the "tracing" config section: enabled, capacity and jsonl (sink path)."""
+        self.flush()
+        self.enabled = config.get("enabled", True)
+        capacity = config.get("capacity", DEFAULT_CAPACITY)
+        if capacity != self.spans.maxlen:
+            self.spans = collections.deque(self.spans, maxlen=capacity)
+        path = config.get("jsonl")
+        self.sink_path = os.path.join(BASE_DIR, path) if path else None
+
+    def record(self, name, duration, **attrs):
+        """Records a span that has already been timed (duration in seconds)."""
+        if not self.enabled:
+            return
+        span = {"name": name, "at": time.time(), "duration": duration, "turn": current_turn.get(), **attrs}
+        self.spans.append(span)
+        if self.sink_path is not None:
+            self._sink_buffer.append(span)
+            if len(self._sink_buffer) >= SINK_BATCH:
+                self.flush()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """
+        Times the block as a span. The yielded dict holds the span's
+        attributes and may be added to; an exception is recorded as `error`.
+        """
+        start = time.perf_counter()
+        try:
+            yield attrs
+        except BaseException as e:
+            attrs.setdefault("error", type(e).__name__)
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, **attrs)
+
+    @contextmanager
+    def turn(self, **attrs):
+        """Runs the block as a new turn: its spans share a turn id, and the turn itself is a span."""
+        turn_id = next(self._turn_ids)
+        token = current_turn.set(turn_id)
+        try:
+            with self.span("turn", **attrs):
+                yield turn_id
+        finally:
+            current_turn.reset(token)
+
+    def values(self, name, key="duration"):
+        """A numeric attribute (the duration by default) of the buffered spans called `name`."""
+        return [s[key] for s in list(self.spans) if s["name"] == name and s.get(key) is not None]
+
+    def summary(self):
+        """Count, p50, p95 and max duration per span name, over the buffered spans."""
+        durations = collections.defaultdict(list)
+        for span in list(self.spans):
+            durations[span["name"]].append(span["duration"])
+        return {name: {"count": len(values), "p50": percentile(values, 0.5), "p95": percentile(values, 0.95),
+                       "max": max(values)}
+                for name, values in sorted(durations.items())}
+
+    def turn_spans(self, turn_id=None):
+        """The spans of a turn (the most recent finished one by default), in the order they ended."""
+        spans = list(self.spans)
+        if turn_id is None:
+            turn_id = next((s["turn"] for s in reversed(spans) if s["name"] == "turn"), None)
+            if turn_id is None:
+                return []
+        return [s for s in spans if s["turn"] == turn_id]
+
+    def flush(self):
+        """Appends buffered spans to the JSONL sink."""
+        buffer, self._sink_buffer = self._sink_buffer, []
+        if not buffer or self.sink_path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.sink_path), exist_ok=True)
+            with open(self.sink_path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(span) + "\n" for span in buffer)
+        except OSError as e:
+            print(f"Error writing traces to {self.sink_path}: {e}")
+
+    def clear(self):
+        self.spans.clear()
+        self._sink_buffer = []
+
+tracer = Tracer()
@@ -0,0 +1,29 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import desktop_aipet.src.database as database
+from desktop_aipet.src.database import init_db, open_pool, close_pool
+
+class AsyncDBTestCase(unittest.IsolatedAsyncioTestCase):
+    """
+    Runs each test against a fresh database in a temporary directory
+    (self.db_path). The schema is created unless create_schema is False, and
+    the connection pool is opened when pool_readers is set. Everything is
+    undone in cleanups, so subclasses only tear down what they add.
+    """
+    create_schema = True
+    pool_readers = None
+
+    async def asyncSetUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.db_path = os.path.join(tmp_dir.name, 'aipet.db')
+        path_patch = mock.patch.object(database, 'DB_PATH', self.db_path)
+        path_patch.start()
+        self.addCleanup(path_patch.stop)
+        if self.create_schema:
+            await init_db()
+        if self.pool_readers:
+            await open_pool(readers=self.pool_readers)
+            self.addAsyncCleanup(close_pool)
@@ -0,0 +1,261 @@
+import unittest
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from unittest import mock
+import desktop_aipet.src.agent_core as agent_core
+from desktop_aipet.src.agent_core import ChatAgent, ToolRegistry, MAX_TOOL_ITERATIONS, INLINE, THREAD, PROCESS
+from desktop_aipet.src.tracing import tracer
+
+def text_chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text, tool_calls=None))])
+
+def tool_chunk(index, call_id=None, name=None, arguments=None):
+    call = SimpleNamespace(index=index, id=call_id, function=SimpleNamespace(name=name, arguments=arguments))
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None, tool_calls=[call]))])
+
+async def stream_of(chunks):
+    for chunk in chunks:
+        yield chunk
+
+class ScriptedClient:
+    """Streams one scripted list of chunks per request and records the requests."""
+    def __init__(self, *replies):
+        self.api_key = "test-key"
+        self.replies = list(replies)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.requests.append({**kwargs, "messages": list(kwargs["messages"])})
+        return stream_of(self.replies.pop(0) if self.replies else [tool_chunk(0, "again", "slow", "{}")])
+
+def square(n):
+    # Module level so the process pool can pickle it.
+    return n * n
+
+def blocking_sleep(seconds):
+    time.sleep(seconds)
+    return "woke"
+
+class TestToolRegistry(unittest.IsolatedAsyncioTestCase):
+    async def test_calls_run_concurrently_with_timeouts(self):
+        registry = ToolRegistry()
+
+        async def slow(seconds):
+            await asyncio.sleep(seconds)
+            return f"slept {seconds}"
+        registry.register("slow", slow, {})
+        registry.register("stuck", slow, {}, timeout=0.05)
+
+        start = time.perf_counter()
+        results = await registry.execute_all([("slow", '{"seconds": 0.2}'), ("slow", '{"seconds": 0.2}'),
+                                              ("stuck", '{"seconds": 10}'), ("missing", '{}')])
+        self.assertLess(time.perf_counter() - start, 0.35)
+        self.assertEqual(results, ["slept 0.2", "slept 0.2",
+                                   "Error executing tool stuck: timed out after 0.05s", "Tool missing not found."])
+
+    async def test_sync_tools_do_not_block_the_loop(self):
+        registry = ToolRegistry(thread_workers=2)
+        registry.register("sleep", blocking_sleep, {})
+        ticks = 0
+
+        async def heartbeat():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        beat = asyncio.create_task(heartbeat())
+        try:
+            self.assertEqual(await registry.execute("sleep", '{"seconds": 0.2}'), "woke")
+        finally:
+            beat.cancel()
+            registry.shutdown()
+        self.assertGreater(ticks, 5)
+
+    async def test_modes_and_stats(self):
+        registry = ToolRegistry(process_workers=1)
+        registry.register("square", square, {}, mode=PROCESS)
+        registry.register("inline_square", square, {}, mode=INLINE)
+        registry.register("sleep", blocking_sleep, {}, timeout=0.05)
+        try:
+            self.assertEqual(await registry.execute("square", '{"n": 12}'), 144)
+            self.assertEqual(await registry.execute("inline_square", '{"n": 3}'), 9)
+            self.assertIn("timed out", await registry.execute("sleep", '{"seconds": 0.3}'))
+            self.assertIn("Error", await registry.execute("inline_square", '{"m": 3}'))
+        finally:
+            registry.shutdown()
+
+        stats = registry.get_stats()
+        self.assertEqual(stats["square"]["calls"], 1)
+        self.assertEqual(stats["inline_square"]["errors"], 1)
+        self.assertEqual(stats["sleep"]["timeouts"], 1)
+        self.assertGreaterEqual(stats["sleep"]["max_seconds"], 0.05)
+        self.assertEqual(registry.tools["sleep"]["mode"], THREAD)
+        with self.assertRaises(ValueError):
+            registry.register("bad", square, {}, mode="gpu")
+
+class AgentTestCase(unittest.IsolatedAsyncioTestCase):
+    """A ChatAgent in session "s" with storage and titling mocked out."""
+    async def asyncSetUp(self):
+        self.patches = [
+            mock.patch.object(agent_core, 'enqueue_write', mock.AsyncMock()),
+            mock.patch.object(agent_core, 'record_message'),
+            mock.patch.object(agent_core, 'get_context_messages', mock.AsyncMock(
+                side_effect=lambda session_id, prompt: [{"role": "system", "content": prompt},
+                                                        {"role": "user", "content": "hi"}])),
+            mock.patch.object(agent_core, 'title_generator'),
+        ]
+        for p in self.patches:
+            p.start()
+        self.agent = ChatAgent()
+        self.agent.tool_registry = ToolRegistry()
+
+        async def weather(city):
+            await asyncio.sleep(0.1)
+            return f"sunny in {city}"
+        self.agent.tool_registry.register("weather", weather, {"type": "function", "function": {"name": "weather"}})
+
+        async def slow():
+            return "done"
+        self.agent.tool_registry.register("slow", slow, {"type": "function", "function": {"name": "slow"}})
+        await self.agent.start_session("s")
+
+    async def asyncTearDown(self):
+        for p in self.patches:
+            p.stop()
+
+class TestToolLoop(AgentTestCase):
+    async def run_turn(self, client):
+        with mock.patch.object(agent_core, 'get_llm_client', mock.AsyncMock(return_value=(client, "m"))):
+            return "".join([chunk async for chunk in self.agent.chat_stream("hi")])
+
+    async def test_tool_results_are_fed_back(self):
+        client = ScriptedClient(
+            [tool_chunk(0, "a", "weather", '{"city":'), tool_chunk(0, arguments=' "Oslo"}'),
+             tool_chunk(1, "b", "weather", '{"city": "Rome"}')],
+            [text_chunk("Oslo and Rome "), text_chunk("are sunny.")],
+        )
+        start = time.perf_counter()
+        reply = await self.run_turn(client)
+        self.assertLess(time.perf_counter() - start, 0.18)
+
+        self.assertTrue(reply.endswith("Oslo and Rome are sunny."))
+        follow_up = client.requests[1]["messages"]
+        self.assertEqual(follow_up[2]["role"], "assistant")
+        self.assertEqual([c["id"] for c in follow_up[2]["tool_calls"]], ["a", "b"])
+        self.assertEqual(follow_up[3:], [
+            {"role": "tool", "tool_call_id": "a", "content": "sunny in Oslo"},
+            {"role": "tool", "tool_call_id": "b", "content": "sunny in Rome"},
+        ])
+
+        saved = agent_core.enqueue_write.await_args_list[-1].args[1]
+        self.assertEqual(saved[2], reply)
+        self.assertEqual([c["result"] for c in json.loads(saved[4])], ["sunny in Oslo", "sunny in Rome"])
+        # The title is only queued; no extra request before the turn ends.
+        agent_core.title_generator.request.assert_called_once_with("s", "hi")
+        self.assertEqual(len(client.requests), 2)
+
+    async def test_prompt_prefix_reuse_is_traced_per_session(self):
+        tracer.clear()
+        await self.run_turn(ScriptedClient([tool_chunk(0, "a", "slow", "{}")], [text_chunk("ok")]))
+        await self.agent.start_session("other")
+        await self.run_turn(ScriptedClient([text_chunk("ok")]))
+        requests = [span for span in tracer.spans if span["name"] == "llm.request"]
+        self.assertEqual([span["prefix_tokens"] for span in requests][0::2], [0, 0])
+        # The tool round trip resends the whole first prompt.
+        self.assertGreater(requests[1]["prefix_tokens"], 0)
+        self.assertGreater(requests[1]["reuse_ratio"], 0.5)
+        self.assertEqual(set(self.agent.prompt_prefix), {"s", "other"})
+
+    async def test_iterations_are_bounded(self):
+        client = ScriptedClient()
+        await self.run_turn(client)
+        self.assertEqual(len(client.requests), MAX_TOOL_ITERATIONS + 1)
+        self.assertEqual(client.requests[-1]["tool_choice"], "none")
+        self.assertEqual(client.requests[0]["tool_choice"], "auto")
+
+class EndlessStream:
+    """A stream that keeps producing tokens until it is closed."""
+    def __init__(self):
+        self.closed = False
+
+    async def __aiter__(self):
+        while not self.closed:
+            await asyncio.sleep(0.01)
+            yield text_chunk("la ")
+
+    async def close(self):
+        self.closed = True
+
+class TestTurns(AgentTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.streams = []
+
+        async def create(**kwargs):
+            self.streams.append(EndlessStream())
+            return self.streams[-1]
+        client = SimpleNamespace(api_key="test-key", chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        self.client_patch = mock.patch.object(agent_core, 'get_llm_client', mock.AsyncMock(return_value=(client, "m")))
+        self.client_patch.start()
+
+    async def asyncTearDown(self):
+        self.client_patch.stop()
+        await super().asyncTearDown()
+
+    def saved_rows(self):
+        return [call.args[1] for call in agent_core.enqueue_write.await_args_list]
+
+    async def test_cancel_closes_stream_and_keeps_partial_reply(self):
+        chunks = []
+        turn = self.agent.start_turn("sing", on_chunk=chunks.append)
+        await asyncio.sleep(0.05)
+        self.assertTrue(await self.agent.cancel_turn())
+        self.assertTrue(turn.cancelled())
+        self.assertTrue(self.streams[0].closed)
+        self.assertEqual(self.agent.turns, {})
+
+        user, reply = self.saved_rows()
+        self.assertEqual(user[1:3], ("user", "sing"))
+        self.assertEqual(reply[1:3], ("assistant", "".join(chunks)))
+        self.assertTrue(chunks)
+        self.assertEqual(reply[5], 1)
+        agent_core.title_generator.request.assert_not_called()
+        self.assertFalse(await self.agent.cancel_turn())
+
+    async def test_turn_is_traced(self):
+        tracer.clear()
+        self.agent.start_turn("sing")
+        await asyncio.sleep(0.05)
+        await self.agent.cancel_turn()
+        spans = tracer.turn_spans()
+        names = [span["name"] for span in spans]
+        self.assertLess(names.index("llm.request"), names.index("llm.ttft"))
+        self.assertEqual((spans[-1]["name"], spans[-1]["session"], spans[-1]["error"]), ("turn", "s", "CancelledError"))
+
+    async def test_new_message_replaces_running_turn(self):
+        first = self.agent.start_turn("one")
+        await asyncio.sleep(0.03)
+        second = self.agent.start_turn("two")
+        await asyncio.sleep(0.03)
+        self.assertTrue(first.cancelled())
+        self.assertIs(self.agent.turns["s"], second)
+        await self.agent.cancel_turn()
+
+        # Writes stay in turn order: the stopped reply lands before the next message.
+        rows = self.saved_rows()
+        self.assertEqual([row[2] for row in rows][0::2], ["one", "two"])
+        self.assertEqual([row[5] for row in rows[1::2]], [1, 1])
+
+    async def test_switching_sessions_stops_the_turn(self):
+        turn = self.agent.start_turn("one")
+        await asyncio.sleep(0.03)
+        await self.agent.start_session("other")
+        self.assertTrue(turn.cancelled())
+        self.assertTrue(self.streams[0].closed)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+from unittest import mock
+import desktop_aipet.src.context_builder as context_builder_module
+from desktop_aipet.src.database import get_db_connection
+from desktop_aipet.src.context_builder import ContextBuilder, PrefixTracker, estimate_tokens
+from desktop_aipet.tests.helpers import AsyncDBTestCase
+
+class TestEstimateTokens(unittest.TestCase):
+    def test_estimates(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("abcd"), 1)
+        self.assertEqual(estimate_tokens("abcde"), 2)
+        # Non-ASCII characters count as a token each.
+        self.assertEqual(estimate_tokens("你好"), 2)
+
+class TestContextBuilder(AsyncDBTestCase):
+
+    async def insert_log(self, session_id, role, content, timestamp):
+        async with get_db_connection() as db:
+            await db.execute('INSERT INTO chat_logs (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)',
+                             (session_id, role, content, timestamp))
+            await db.commit()
+
+    async def test_cold_load_matches_history(self):
+        await self.insert_log('s', 'user', 'Hello', '2024-01-01T10:00:00')
+        await self.insert_log('s', 'assistant', 'Hi there', '2024-01-01T10:00:01')
+        await self.insert_log('other', 'user', 'Elsewhere', '2024-01-01T10:00:02')
+        async with get_db_connection() as db:
+            await db.execute("INSERT INTO daily_summaries (date, summary_text, key_events) VALUES ('2023-12-31', 'Talked', '[]')")
+            await db.commit()
+
+        context = await ContextBuilder().build('s')
+        self.assertEqual(context,
+                         "=== System Context ===\n"
+                         "--- Previous Days Summaries ---\n"
+                         "Date: 2023-12-31\nSummary: Talked\nKey Events: []\n\n"
+                         "--- Recent Chat History ---\n"
+                         "[2024-01-01T10:00:00] user: Hello\n"
+                         "[2024-01-01T10:00:01] assistant: Hi there\n")
+
+    async def test_history_is_trimmed_to_budget(self):
+        for i in range(10):
+            await self.insert_log('s', 'user', 'x' * 100, f'2024-01-01T10:00:{i:02d}')
+
+        builder = ContextBuilder(history_budget=100)
+        window = await builder.get_window('s')
+        self.assertLessEqual(window.tokens, 100)
+        self.assertEqual(window.messages[-1][2], '2024-01-01T10:00:09')
+
+        builder.add_message('s', 'assistant', 'y' * 300, '2024-01-01T10:00:10')
+        self.assertEqual(len(window.messages), 1)
+
+    async def test_loaded_session_is_not_reread(self):
+        builder = ContextBuilder()
+        await builder.build('s')
+        builder.add_message('s', 'user', 'New turn', '2024-01-01T11:00:00')
+
+        with mock.patch.object(context_builder_module, 'get_read_connection') as connect:
+            context = await builder.build('s')
+        connect.assert_not_called()
+        self.assertIn("user: New turn", context)
+
+    async def test_summaries_cached_until_invalidated(self):
+        builder = ContextBuilder()
+        self.assertNotIn("Summaries", await builder.build('s'))
+
+        async with get_db_connection() as db:
+            await db.execute("INSERT INTO daily_summaries (date, summary_text, key_events) VALUES ('2024-01-01', 'New day', '[]')")
+            await db.commit()
+        self.assertNotIn("New day", await builder.build('s'))
+
+        builder.invalidate_summaries()
+        self.assertIn("New day", await builder.build('s'))
+
+    async def test_messages_have_stable_prefix(self):
+        await self.insert_log('s', 'user', 'Hello', '2024-01-01T10:00:00')
+        builder = ContextBuilder()
+        first = await builder.build_messages('s', "Persona.")
+        self.assertEqual(first, [{"role": "system", "content": "Persona."},
+                                 {"role": "user", "content": "Hello"}])
+
+        builder.add_message('s', 'assistant', 'Hi!', '2024-01-01T10:00:01')
+        builder.add_message('s', 'user', 'How are you?', '2024-01-01T10:00:02')
+        second = await builder.build_messages('s', "Persona.")
+        self.assertEqual(second[:len(first)], first)
+        self.assertEqual(second[-1], {"role": "user", "content": "How are you?"})
+
+class TestPrefixTracker(unittest.TestCase):
+    def test_counts_shared_prefix(self):
+        tracker = PrefixTracker()
+        first = [{"role": "system", "content": "s" * 40}, {"role": "user", "content": "u" * 40}]
+        self.assertEqual(tracker.record(first), (0, 20))
+
+        second = first + [{"role": "assistant", "content": "a" * 40}, {"role": "user", "content": "v" * 40}]
+        self.assertEqual(tracker.record(second), (20, 40))
+
+        # A changed system message invalidates everything after its common prefix.
+        third = [{"role": "system", "content": "s" * 20 + "t" * 20}] + second[1:]
+        self.assertEqual(tracker.record(third), (5, 40))
+        self.assertAlmostEqual(tracker.reuse_ratio, 25 / 100)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import unittest
+import aiosqlite
+from unittest import mock
+import desktop_aipet.src.database as database
+from desktop_aipet.src.database import (init_db, close_pool, get_db_connection, get_read_connection,
+                                        get_schema_version, MIGRATIONS, start_write_queue, stop_write_queue,
+                                        enqueue_write, flush_writes)
+from desktop_aipet.tests.helpers import AsyncDBTestCase
+
+class TestConnectionPool(AsyncDBTestCase):
+    pool_readers = 2
+
+    async def test_writer_is_reused(self):
+        async with get_db_connection() as db1:
+            pass
+        async with get_db_connection() as db2:
+            pass
+        self.assertIs(db1, db2)
+
+    async def test_readers_see_committed_writes(self):
+        async with get_db_connection() as db:
+            await db.execute("INSERT INTO sessions (id, title) VALUES ('s1', 'Pooled')")
+            await db.commit()
+
+        async with get_read_connection() as db:
+            async with db.execute("SELECT title FROM sessions WHERE id = 's1'") as cursor:
+                row = await cursor.fetchone()
+        self.assertEqual(row[0], 'Pooled')
+
+    async def test_uncommitted_writes_are_discarded(self):
+        async with get_db_connection() as db:
+            await db.execute("INSERT INTO sessions (id, title) VALUES ('s2', 'Forgotten')")
+
+        with self.assertRaises(RuntimeError):
+            async with get_db_connection() as db:
+                await db.execute("INSERT INTO sessions (id, title) VALUES ('s3', 'Failed')")
+                raise RuntimeError("boom")
+
+        async with get_read_connection() as db:
+            async with db.execute("SELECT COUNT(*) FROM sessions") as cursor:
+                row = await cursor.fetchone()
+        self.assertEqual(row[0], 0)
+
+    async def test_close_falls_back_to_direct_connections(self):
+        await close_pool()
+        self.assertIsNone(database._pool)
+        async with get_db_connection() as db:
+            async with db.execute("SELECT 1") as cursor:
+                row = await cursor.fetchone()
+        self.assertEqual(row[0], 1)
+
+class TestMigrations(AsyncDBTestCase):
+    create_schema = False
+
+    async def test_fresh_database_is_current_and_wal(self):
+        await init_db()
+        async with aiosqlite.connect(self.db_path) as db:
+            self.assertEqual(await get_schema_version(db), len(MIGRATIONS))
+            async with db.execute('PRAGMA journal_mode') as cursor:
+                row = await cursor.fetchone()
+        self.assertEqual(row[0], 'wal')
+
+    async def test_init_is_idempotent(self):
+        await init_db()
+        async with get_db_connection() as db:
+            await db.execute("INSERT INTO sessions (id, title) VALUES ('keep', 'Kept')")
+            await db.commit()
+        await init_db()
+        async with get_read_connection() as db:
+            async with db.execute("SELECT title FROM sessions WHERE id = 'keep'") as cursor:
+                row = await cursor.fetchone()
+        self.assertEqual(row[0], 'Kept')
+
+    async def test_unversioned_database_is_upgraded(self):
+        # A database created before migrations existed: tables present, user_version 0.
+        async with aiosqlite.connect(self.db_path) as db:
+            for statement in MIGRATIONS[0]:
+                await db.execute(statement)
+            await db.execute("INSERT INTO chat_logs (session_id, role, content, timestamp) VALUES ('old', 'user', 'hi', '2024-01-01T10:00:00')")
+            await db.commit()
+
+        await init_db()
+        async with aiosqlite.connect(self.db_path) as db:
+            self.assertEqual(await get_schema_version(db), len(MIGRATIONS))
+            async with db.execute("SELECT content FROM chat_logs WHERE session_id = 'old'") as cursor:
+                row = await cursor.fetchone()
+        self.assertEqual(row[0], 'hi')
+
+    async def test_failed_migration_rolls_back(self):
+        async def broken(db):
+            await db.execute("CREATE TABLE half_done (id INTEGER)")
+            raise RuntimeError("bad migration")
+
+        await init_db()
+        with mock.patch.object(database, 'MIGRATIONS', MIGRATIONS + [broken]):
+            with self.assertRaises(RuntimeError):
+                await init_db()
+        async with aiosqlite.connect(self.db_path) as db:
+            self.assertEqual(await get_schema_version(db), len(MIGRATIONS))
+            async with db.execute("SELECT name FROM sqlite_master WHERE name = 'half_done'") as cursor:
+                self.assertIsNone(await cursor.fetchone())
+
+class TestQueryPlans(AsyncDBTestCase):
+    # The hot queries, as issued by memory_service, context_builder and scheduler_service.
+    HOT_QUERIES = [
+        ("SELECT role, content, timestamp FROM chat_logs WHERE session_id = ? ORDER BY timestamp DESC LIMIT ?", ('s', 200)),
+        ("SELECT role, content, timestamp FROM chat_logs WHERE session_id = ? ORDER BY timestamp ASC", ('s',)),
+        ("SELECT id, role, content, timestamp FROM chat_logs WHERE session_id = ? AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT ?", ('s', '2024-01-01', 5, 51)),
+        ("SELECT role, content FROM chat_logs WHERE day = ? AND id > ? AND id <= ? ORDER BY id", ('2024-01-01', 0, 100)),
+        ("SELECT id FROM daily_summaries WHERE date = ?", ('2024-01-01',)),
+        ("SELECT date, summary_text, key_events FROM daily_summaries ORDER BY date DESC LIMIT ?", (5,)),
+        ("SELECT id, message, run_date FROM reminders WHERE status = 'pending' ORDER BY run_date", ()),
+        ("SELECT id, message, run_date, status FROM reminders WHERE (run_date, id) > (?, ?) ORDER BY run_date, id LIMIT ?", ('2024-01-01', 1, 101)),
+        ("SELECT id, message, run_date, status FROM reminders WHERE status = ? AND (run_date, id) > (?, ?) ORDER BY run_date, id LIMIT ?", ('pending', '2024-01-01', 1, 101)),
+        ("SELECT id, title, created_at FROM sessions WHERE (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?", ('2024-01-01', 's', 101)),
+    ]
+
+    async def test_hot_queries_avoid_full_scans(self):
+        async with get_read_connection() as db:
+            for query, params in self.HOT_QUERIES:
+                async with db.execute('EXPLAIN QUERY PLAN ' + query, params) as cursor:
+                    plan = [row[3] for row in await cursor.fetchall()]
+                for step in plan:
+                    # "SCAN t USING INDEX" on a partial index only walks matching rows.
+                    self.assertFalse(step.startswith('SCAN') and 'INDEX' not in step, f"{query!r} scans: {plan}")
+                    self.assertNotIn('TEMP B-TREE', step, f"{query!r} sorts: {plan}")
+
+    async def test_day_column_matches_timestamp_date(self):
+        async with get_db_connection() as db:
+            await db.execute("INSERT INTO chat_logs (session_id, role, content, timestamp) VALUES ('s', 'user', 'hi', '2024-03-05T23:59:59.123456')")
+            await db.commit()
+            async with db.execute("SELECT day FROM chat_logs") as cursor:
+                row = await cursor.fetchone()
+        self.assertEqual(row[0], '2024-03-05')
+
+class TestWriteBehindQueue(AsyncDBTestCase):
+    pool_readers = 2
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        await start_write_queue(max_size=10, max_batch=4)
+
+    async def asyncTearDown(self):
+        await stop_write_queue()
+
+    async def count_logs(self):
+        async with get_read_connection() as db:
+            async with db.execute("SELECT COUNT(*) FROM chat_logs") as cursor:
+                row = await cursor.fetchone()
+        return row[0]
+
+    async def insert_logs(self, n):
+        for i in range(n):
+            await enqueue_write('INSERT INTO chat_logs (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)',
+                                ('s', 'user', f'msg {i}', f'2024-01-01T10:00:{i:02d}'))
+
+    async def test_flush_makes_writes_visible(self):
+        # More rows than the queue holds, so producers have to wait on the writer.
+        await self.insert_logs(25)
+        await flush_writes()
+        self.assertEqual(await self.count_logs(), 25)
+
+    async def test_stop_flushes_pending_writes(self):
+        await self.insert_logs(3)
+        await stop_write_queue()
+        self.assertEqual(await self.count_logs(), 3)
+
+    async def test_bad_statement_does_not_drop_batch(self):
+        await self.insert_logs(2)
+        await enqueue_write('INSERT INTO no_such_table VALUES (?)', (1,))
+        await self.insert_logs(2)
+        await flush_writes()
+        self.assertEqual(await self.count_logs(), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import asyncio
+import time
+from unittest import mock
+from openai import AsyncOpenAI, BadRequestError
+import desktop_aipet.src.llm_gateway as llm_gateway
+from desktop_aipet.src.llm_gateway import (LLMGateway, Admission, TokenBucket, DeadlineExceeded, GatewayStream,
+                                           INTERACTIVE, BACKGROUND)
+from desktop_aipet.src.fake_llm_server import FakeLLMServer
+
+class TestAdmission(unittest.IsolatedAsyncioTestCase):
+    async def test_interactive_requests_go_first(self):
+        admission = Admission(max_concurrency=1)
+        await admission.acquire(BACKGROUND)
+        order = []
+
+        async def request(name, priority):
+            await admission.acquire(priority)
+            order.append(name)
+            admission.release()
+
+        tasks = [asyncio.create_task(request("background", BACKGROUND))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request("interactive", INTERACTIVE)))
+        await asyncio.sleep(0)
+        admission.release()
+        await asyncio.gather(*tasks)
+        self.assertEqual(order, ["interactive", "background"])
+
+    async def test_reserved_slot_and_cancelled_waiters(self):
+        admission = Admission(max_concurrency=2, reserved=1)
+        await admission.acquire(BACKGROUND)
+        waiting = asyncio.create_task(admission.acquire(BACKGROUND))
+        await asyncio.sleep(0)
+        self.assertFalse(waiting.done())
+        # The reserved slot is still free for interactive work.
+        await asyncio.wait_for(admission.acquire(INTERACTIVE), 1)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        admission.release()
+        admission.release()
+        self.assertEqual(admission.active, 0)
+
+    async def test_token_bucket_paces_requests(self):
+        admission = Admission(max_concurrency=10, bucket=TokenBucket(rate=20, capacity=2))
+        start = time.perf_counter()
+        for _ in range(6):
+            await admission.acquire(BACKGROUND)
+            admission.release()
+        # Two from the burst, then one every 50ms.
+        self.assertGreater(time.perf_counter() - start, 0.15)
+
+class TestGateway(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = await FakeLLMServer().start()
+        self.client = AsyncOpenAI(api_key="test-key", base_url=self.server.base_url, max_retries=0)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.close()
+
+    def messages(self, text="hello"):
+        return [{"role": "user", "content": text}]
+
+    async def test_retries_rate_limits_and_server_errors(self):
+        gateway = LLMGateway(self.client, requests_per_minute=None)
+        self.server.fail_next(429, retry_after=0)
+        self.server.fail_next(503, retry_after=0)
+        response = await gateway.view(BACKGROUND).chat.completions.create(model="m", messages=self.messages())
+        self.assertEqual(response.choices[0].message.content, "echo: hello")
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(gateway.stats["retries"], 2)
+
+        # Client errors aren't retried.
+        self.server.fail_next(400)
+        with self.assertRaises(BadRequestError):
+            await gateway.view().chat.completions.create(model="m", messages=self.messages())
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(gateway.admission.active, 0)
+
+    async def test_backoff_grows_with_jitter(self):
+        gateway = LLMGateway(self.client, max_retries=3)
+        error = mock.Mock(spec=[])
+        with mock.patch.object(llm_gateway, 'random') as rand:
+            rand.uniform.side_effect = lambda low, high: high
+            connection_error = llm_gateway.openai.APIConnectionError(request=mock.Mock())
+            self.assertEqual([gateway.retry_delay(connection_error, a) for a in range(4)], [0.5, 1.0, 2.0, None])
+        self.assertIsNone(gateway.retry_delay(error, 0))
+
+    async def test_deadline_covers_retries(self):
+        gateway = LLMGateway(self.client, requests_per_minute=None)
+        self.server.delays = [0.5]
+        start = time.perf_counter()
+        with self.assertRaises(DeadlineExceeded):
+            await gateway.view().chat.completions.create(model="m", messages=self.messages(), deadline=0.1)
+        self.assertLess(time.perf_counter() - start, 0.4)
+        self.assertEqual(gateway.admission.active, 0)
+        self.assertEqual(gateway.stats["failures"], 1)
+
+    async def test_slow_interactive_request_is_hedged(self):
+        gateway = LLMGateway(self.client, requests_per_minute=None, hedge_after=0.1)
+        self.server.delays = [1.0, 0]
+        start = time.perf_counter()
+        stream = await gateway.view(INTERACTIVE).chat.completions.create(model="m", messages=self.messages("hi there"), stream=True)
+        self.assertIsInstance(stream, GatewayStream)
+        text = "".join([chunk.choices[0].delta.content or "" async for chunk in stream])
+        self.assertLess(time.perf_counter() - start, 0.8)
+        self.assertEqual(text, "echo: hi there")
+        self.assertEqual(gateway.stats["hedges"], 1)
+        self.assertEqual(len(self.server.requests), 2)
+        # The stream and the abandoned request both gave their slots back.
+        self.assertEqual(gateway.admission.active, 0)
+
+        # Background requests are never hedged.
+        self.server.delays = [0.3]
+        await gateway.view(BACKGROUND).chat.completions.create(model="m", messages=self.messages())
+        self.assertEqual(len(self.server.requests), 3)
+
+    async def test_streams_hold_a_slot_until_closed(self):
+        gateway = LLMGateway(self.client, max_concurrency=1, reserved_interactive=0, requests_per_minute=None)
+        stream = await gateway.view().chat.completions.create(model="m", messages=self.messages(), stream=True)
+        self.assertEqual(gateway.admission.active, 1)
+        second = asyncio.create_task(gateway.view().embeddings.create(model="e", input=["x"]))
+        await asyncio.sleep(0.05)
+        self.assertFalse(second.done())
+        await stream.close()
+        response = await asyncio.wait_for(second, 1)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(gateway.admission.active, 0)
+
+if __name__ == '__main__':
+    unittest.main()
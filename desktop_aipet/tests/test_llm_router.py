@@ -0,0 +1,101 @@
+import unittest
+from desktop_aipet.src.llm_gateway import INTERACTIVE, BACKGROUND
+from desktop_aipet.src.llm_router import LLMRouter, endpoint_configs, CONTINUE_PROMPT
+from desktop_aipet.src.fake_llm_server import FakeLLMServer
+
+class TestEndpointConfigs(unittest.TestCase):
+    def test_single_and_listed_endpoints(self):
+        single = endpoint_configs({"api_key": "k", "base_url": "http://a/v1", "model": "big", "cheap_model": "small"})
+        self.assertEqual(single, [{"api_key": "k", "base_url": "http://a/v1", "model": "big", "cheap_model": "small",
+                                   "name": "http://a/v1"}])
+
+        listed = endpoint_configs({"api_key": "k", "model": "big", "endpoints": [
+            {"name": "local", "base_url": "http://localhost/v1", "model": "llama", "api_key": "none"},
+            {"name": "hosted", "base_url": "http://hosted/v1", "cheap_model": "mini"},
+        ]})
+        self.assertEqual([(c["name"], c["api_key"], c["model"], c["cheap_model"]) for c in listed],
+                         [("local", "none", "llama", None), ("hosted", "k", "big", "mini")])
+
+class TestRouter(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.slow = await FakeLLMServer(first_token_delay=0.2).start()
+        self.fast = await FakeLLMServer().start()
+        self.router = LLMRouter.from_configs([
+            {"name": "slow", "base_url": self.slow.base_url, "api_key": "k", "model": "slow-model"},
+            {"name": "fast", "base_url": self.fast.base_url, "api_key": "k", "model": "fast-model", "cheap_model": "mini"},
+        ], {"requests_per_minute": None})
+
+    async def asyncTearDown(self):
+        await self.router.close()
+        await self.slow.close()
+        await self.fast.close()
+
+    async def chat(self, client, text="hello"):
+        stream = await client.chat.completions.create(model="ignored", messages=[{"role": "user", "content": text}], stream=True)
+        return "".join([chunk.choices[0].delta.content or "" async for chunk in stream if chunk.choices])
+
+    async def test_interactive_traffic_moves_to_fastest_endpoint(self):
+        client = self.router.view(INTERACTIVE)
+        for _ in range(4):
+            self.assertEqual(await self.chat(client), "echo: hello")
+        # Each endpoint is measured once, then the faster one is used.
+        self.assertEqual((len(self.slow.requests), len(self.fast.requests)), (1, 3))
+        self.assertEqual(self.fast.requests[-1][1]["model"], "fast-model")
+        stats = self.router.stats()
+        self.assertGreater(stats["slow"]["p50_ttft"], stats["fast"]["p95_ttft"])
+
+    async def test_cheap_tasks_use_the_small_model(self):
+        self.assertEqual(self.router.model_for(cheap=True), "mini")
+        response = await self.router.view(BACKGROUND, cheap=True).chat.completions.create(
+            model="ignored", messages=[{"role": "user", "content": "title this"}])
+        self.assertEqual(response.choices[0].message.content, "echo: title this")
+        self.assertEqual(self.fast.requests[0][1]["model"], "mini")
+        self.assertEqual(self.slow.requests, [])
+
+    async def test_failed_endpoint_is_skipped(self):
+        self.slow.fail_next(503, count=4)
+        client = self.router.view(INTERACTIVE)
+        self.assertEqual(await self.chat(client), "echo: hello")
+        self.assertEqual(len(self.fast.requests), 1)
+
+        # A second failure ejects it; traffic stays on the healthy endpoint.
+        self.router.endpoints[1].ttft.extend([10.0] * 3)
+        self.assertEqual(await self.chat(client), "echo: hello")
+        self.assertFalse(self.router.endpoints[0].healthy)
+        self.assertEqual([e.name for e in self.router.ranked()], ["fast", "slow"])
+
+    async def test_endpoints_without_a_key_are_ranked_last(self):
+        self.router.endpoints[1].client.api_key = "YOUR_API_KEY_HERE"
+        self.router.endpoints[0].ejected_until = float("inf")
+        # Still reachable as a last resort, but after the ejected endpoint that has a key.
+        self.assertEqual([e.name for e in self.router.ranked()], ["slow", "fast"])
+        self.assertEqual([e.name for e in self.router.ranked(cheap=True)], ["slow", "fast"])
+        self.assertEqual(self.router.api_key, "k")
+
+    async def test_embeddings_go_to_the_endpoint_with_a_key(self):
+        self.router.endpoints[0].client.api_key = "YOUR_API_KEY_HERE"
+        client = self.router.view(BACKGROUND)
+        self.assertEqual(client.embedding_api_key, "k")
+        await client.embeddings.create(model="embed", input=["hello"])
+        self.assertEqual((len(self.slow.requests), len(self.fast.requests)), (0, 1))
+
+        self.router.embedding_name = "slow"
+        self.assertEqual(client.embedding_api_key, "YOUR_API_KEY_HERE")
+
+    async def test_turn_continues_on_next_endpoint_after_drop(self):
+        self.slow.cuts = [2]
+        self.fast.reply = " world!"
+        text = await self.chat(self.router.view(INTERACTIVE), "hello big")
+        self.assertEqual(text, "echo: hello world!")
+        continuation = self.fast.requests[0][1]["messages"]
+        self.assertEqual(continuation[-2:], [{"role": "assistant", "content": "echo: hello"},
+                                             {"role": "user", "content": CONTINUE_PROMPT}])
+
+    async def test_embeddings_stay_on_first_endpoint(self):
+        self.router.endpoints[0].ttft.append(10.0)
+        response = await self.router.view(BACKGROUND).embeddings.create(model="e", input=["a"])
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(self.slow.requests), 1)
+
+if __name__ == '__main__':
+    unittest.main()
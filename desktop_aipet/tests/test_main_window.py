@@ -0,0 +1,255 @@
+import unittest
+import asyncio
+import os
+from types import SimpleNamespace
+from unittest import mock
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from PyQt6.QtWidgets import QApplication
+from desktop_aipet.src.database import get_db_connection
+from desktop_aipet.src.memory_service import get_session_messages_page
+import desktop_aipet.src.main_window as main_window
+from desktop_aipet.src.tracing import Tracer
+from desktop_aipet.src.main_window import ChatMessageModel, ChatView, StreamingMessageRenderer, MessageRole, PagedTableModel
+from desktop_aipet.tests.helpers import AsyncDBTestCase
+
+class QtTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication([])
+
+class TestStreamingMessageRenderer(QtTestCase):
+    def setUp(self):
+        self.model = ChatMessageModel()
+        self.model.append_message('user', 'Hi ...')
+        self.view = ChatView()
+        self.view.setModel(self.model)
+        self.renderer = StreamingMessageRenderer(self.model, self.view)
+
+    def last_text(self):
+        return self.model.index(self.model.rowCount() - 1).data()
+
+    def test_chunks_are_coalesced_until_flush(self):
+        self.renderer.start()
+        changes = []
+        self.model.dataChanged.connect(lambda *args: changes.append(args))
+        self.renderer.append("Hello")
+        self.renderer.append(", world")
+        self.assertEqual(self.last_text(), "...")
+        self.assertEqual(changes, [])
+
+        self.renderer.flush()
+        self.assertEqual(self.last_text(), "Hello, world")
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(self.model.index(self.model.rowCount() - 1).data(MessageRole).role, 'assistant')
+        self.assertEqual(self.model.index(0).data(), 'Hi ...')
+
+    def test_finish_applies_pending_chunks(self):
+        self.renderer.start()
+        for chunk in ["a", "b", "c"]:
+            self.renderer.append(chunk)
+        self.renderer.finish()
+        self.assertEqual(self.renderer.text, "abc")
+        self.assertEqual(self.last_text(), "abc")
+
+    def test_empty_reply_keeps_placeholder(self):
+        self.renderer.start()
+        self.renderer.finish()
+        self.assertEqual(self.last_text(), "...")
+
+    def test_older_page_loaded_mid_stream_keeps_the_reply_in_its_row(self):
+        self.renderer.start()
+        self.renderer.append("partial")
+        self.renderer.flush()
+        self.model.prepend_page([(1, 'user', 'older question', '2024-01-01T09:00'),
+                                 (2, 'assistant', 'older answer', '2024-01-01T09:01')], False)
+        self.renderer.append(" more")
+        self.renderer.finish()
+        self.assertEqual([self.model.index(i).data() for i in range(self.model.rowCount())],
+                         ['older question', 'older answer', 'Hi ...', 'partial more'])
+
+    def test_clearing_the_model_detaches_the_renderer(self):
+        # A turn stopped by a session switch must not write into the new session's rows.
+        self.renderer.start()
+        self.renderer.append("late")
+        self.model.clear()
+        self.model.append_message('user', 'new session')
+        self.assertFalse(self.renderer.active)
+        self.renderer.finish()
+        self.assertEqual(self.last_text(), "new session")
+
+class TestChatHistoryPaging(AsyncDBTestCase):
+    async def asyncSetUp(self):
+        self.app = QApplication.instance() or QApplication([])
+        await super().asyncSetUp()
+
+    async def test_pages_walk_back_through_session(self):
+        async with get_db_connection() as db:
+            # Pairs of messages share a timestamp, so the id has to break ties.
+            await db.executemany('INSERT INTO chat_logs (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)',
+                                 [('s', 'user' if i % 2 == 0 else 'assistant', f'msg {i}', f'2024-01-01T10:{i // 2:04d}')
+                                  for i in range(25)])
+            await db.commit()
+
+        model = ChatMessageModel()
+        rows, has_more = await get_session_messages_page('s', limit=10)
+        model.prepend_page(rows, has_more)
+        self.assertEqual(model.rowCount(), 10)
+        while model.has_more:
+            rows, has_more = await get_session_messages_page('s', before=model.oldest_key, limit=10)
+            model.prepend_page(rows, has_more)
+
+        self.assertEqual([model.index(i).data() for i in range(model.rowCount())],
+                         [f'msg {i}' for i in range(25)])
+
+class TestPagedTableModel(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.app = QApplication.instance() or QApplication([])
+        self.rows = [(i, f'row {i}') for i in range(25)]
+        self.requests = []
+
+        async def fetch_page(after):
+            self.requests.append(after)
+            start = 0 if after is None else after + 1
+            return self.rows[start:start + 10], start + 10 < len(self.rows)
+
+        async def count():
+            return len(self.rows)
+
+        self.model = PagedTableModel(["Id", "Name"], [lambda r: str(r[0]), lambda r: r[1]],
+                                     fetch_page, lambda r: r[0], count=count)
+
+    async def settle(self):
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+    async def test_fetches_pages_on_demand(self):
+        self.model.reload()
+        await self.settle()
+        self.assertEqual(self.model.rowCount(), 10)
+        self.assertEqual(self.model.status_text(), "Showing 10 of 25")
+
+        while self.model.canFetchMore():
+            self.model.fetchMore()
+            await self.settle()
+        self.assertEqual(self.requests, [None, 9, 19])
+        self.assertEqual(self.model.rowCount(), 25)
+        self.assertEqual(self.model.index(24, 1).data(), 'row 24')
+
+    async def test_reload_drops_stale_page(self):
+        self.model.reload()
+        self.model.reload()
+        await self.settle()
+        self.assertEqual(self.model.rowCount(), 10)
+
+    async def test_failed_count_keeps_the_model_usable(self):
+        self.model.reload()
+        await self.settle()
+        self.model.count = mock.AsyncMock(side_effect=RuntimeError("database is locked"))
+        loaded = []
+        self.model.loaded.connect(lambda: loaded.append(self.model.total))
+        with mock.patch('builtins.print') as printed:
+            self.model.reload()
+            await self.settle()
+        printed.assert_any_call("Error counting rows: database is locked")
+        self.assertIn(None, loaded)
+        self.assertEqual(self.model.rowCount(), 10)
+        self.assertEqual(self.model.status_text(), "Showing 10")
+
+class TestSessionSearch(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.app = QApplication.instance() or QApplication([])
+        self.patches = [
+            mock.patch.object(main_window, 'get_sessions_page',
+                              mock.AsyncMock(return_value=([('s1', 'Garden', '2024-01-01 10:00:00')], False))),
+            mock.patch.object(main_window, 'count_sessions', mock.AsyncMock(return_value=1)),
+            mock.patch.object(main_window, 'search_messages', mock.AsyncMock(
+                return_value=[(7, 's2', 'Cooking', 'user', '[tomato] soup', '2024-01-02T10:00:00')])),
+        ]
+        for p in self.patches:
+            p.start()
+        self.dialog = main_window.SessionManagerDialog()
+
+    async def asyncTearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    async def settle(self):
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+    async def test_search_results_open_their_session(self):
+        await self.settle()
+        self.assertEqual(self.dialog.count_label.text(), "Showing 1 of 1")
+
+        self.dialog.search_input.setText("tomato")
+        self.dialog.run_search()
+        await self.settle()
+        main_window.search_messages.assert_awaited_with("tomato")
+        self.assertIs(self.dialog.table.model(), self.dialog.search_model)
+        self.assertEqual(self.dialog.search_model.index(0, 1).data(), "user: [tomato] soup")
+        self.assertEqual(self.dialog.count_label.text(), "1 matching messages")
+
+        self.dialog.table.selectRow(0)
+        self.dialog.open_session()
+        self.assertEqual(self.dialog.selected_session_id, 's2')
+
+        self.dialog.search_input.clear()
+        self.assertIs(self.dialog.table.model(), self.dialog.model)
+
+class TestSettingsDialog(QtTestCase):
+    def open_dialog(self, llm_config):
+        with mock.patch.object(main_window, 'load_config', return_value={"llm": llm_config}):
+            return main_window.SettingsDialog()
+
+    def save(self, dialog):
+        with mock.patch.object(main_window, 'save_config') as save, mock.patch.object(main_window, 'QMessageBox'):
+            dialog.save_settings()
+        return save.call_args.args[0]["llm"]
+
+    def test_saves_top_level_settings(self):
+        dialog = self.open_dialog({"api_key": "k", "base_url": "", "model": "m"})
+        dialog.model_edit.setText("bigger")
+        self.assertEqual(self.save(dialog), {"api_key": "k", "base_url": "", "model": "bigger"})
+
+    def test_fields_every_endpoint_overrides_are_disabled(self):
+        endpoints = [{"name": "a", "api_key": "ka", "model": "ma"}, {"name": "b", "api_key": "kb"}]
+        dialog = self.open_dialog({"api_key": "k", "model": "m", "endpoints": endpoints})
+        self.assertFalse(dialog.api_key_edit.isEnabled())
+        self.assertTrue(dialog.model_edit.isEnabled())
+        dialog.api_key_edit.setText("ignored")
+        dialog.model_edit.setText("fallback")
+        saved = self.save(dialog)
+        self.assertEqual((saved["api_key"], saved["model"], saved["endpoints"]), ("k", "fallback", endpoints))
+
+class TestDiagnosticsPanel(QtTestCase):
+    def test_shows_percentiles_and_last_turn(self):
+        tracer = Tracer()
+        for duration in [0.010, 0.020, 0.030]:
+            tracer.record("db.read", duration)
+        with tracer.turn(session="s"):
+            tracer.record("llm.request", 0.1, model="m", prefix_tokens=0, reuse_ratio=0.0)
+            tracer.record("llm.request", 0.1, model="m", prefix_tokens=900, reuse_ratio=0.9)
+            tracer.record("llm.ttft", 0.5, model="m")
+            tracer.record("llm.stream", 1.0, chunks=40, tokens_per_second=40.0)
+        agent = SimpleNamespace(tool_registry=SimpleNamespace(get_stats=lambda: {"weather": {"calls": 2}}))
+
+        with mock.patch.object(main_window, 'tracer', tracer), \
+                mock.patch.object(main_window, 'get_llm_stats', return_value={"local": {"p50_ttft": 0.4}}):
+            panel = main_window.DiagnosticsPanel(agent)
+            panel.refresh()
+
+        table = panel.spans_table
+        rows = {table.item(r, 0).text(): [table.item(r, c).text() for c in range(1, 5)] for r in range(table.rowCount())}
+        self.assertEqual(rows["db.read"], ["3", "20.0", "30.0", "30.0"])
+        self.assertEqual(set(rows), {"db.read", "llm.request", "llm.ttft", "llm.stream", "turn"})
+        self.assertIn("40.0 tokens/s", panel.rate_label.text())
+        self.assertEqual(panel.prefix_label.text(), "Prompt prefix reuse: p50 90%, last request 90% (900 tokens)")
+        self.assertEqual(panel.last_turn_label.text(), f"Last turn: {rows['turn'][3]} ms")
+        self.assertEqual([panel.turn_table.item(r, 0).text() for r in range(panel.turn_table.rowCount())],
+                         ["llm.request", "llm.request", "llm.ttft", "llm.stream"])
+        self.assertEqual(panel.turn_table.item(1, 2).text(), "model=m, prefix_tokens=900, reuse_ratio=0.9")
+        self.assertEqual(panel.turn_table.item(2, 2).text(), "model=m")
+        self.assertEqual([panel.counters_table.item(r, 0).text() for r in range(2)], ["llm local", "tool weather"])
+
+if __name__ == '__main__':
+    unittest.main()
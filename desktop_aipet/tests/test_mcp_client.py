@@ -0,0 +1,111 @@
+import unittest
+import asyncio
+import json
+import time
+from desktop_aipet.src.agent_core import ToolRegistry
+from desktop_aipet.src.mcp_client import MCPClient, MCPServerConnection, MCPError
+
+ECHO_SERVER = {"command": "python", "args": ["-m", "desktop_aipet.src.mcp_echo_server"]}
+
+class TestMCPServerConnection(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        client = MCPClient()
+        client.load_servers({"echo": ECHO_SERVER})
+        self.server = client.servers[0]
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def test_concurrent_calls_share_one_process(self):
+        await self.server.start()
+        pid = self.server.server_info["pid"]
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            self.server.call_tool("sleep_echo", {"text": "slow", "seconds": 0.5}),
+            *(self.server.call_tool("sleep_echo", {"text": str(i), "seconds": 0.5}) for i in range(9))
+        )
+        # Ten half-second calls overlap instead of running back to back.
+        self.assertLess(time.perf_counter() - start, 2.5)
+        self.assertEqual(results, ["slow"] + [str(i) for i in range(9)])
+        self.assertEqual(self.server.process.pid, pid)
+
+    async def test_tool_listing_is_cached(self):
+        tools = await self.server.list_tools()
+        self.assertEqual([t["name"] for t in tools], ["echo", "sleep_echo", "fail", "add_tool", "remove_tool"])
+        self.assertIs(await self.server.list_tools(), tools)
+
+    async def test_errors_and_restart(self):
+        with self.assertRaisesRegex(MCPError, "always fails"):
+            await self.server.call_tool("fail", {})
+        with self.assertRaisesRegex(MCPError, "Unknown tool"):
+            await self.server.call_tool("missing", {})
+
+        # A server that died is relaunched on the next call.
+        self.server.process.kill()
+        await self.server.process.wait()
+        self.assertEqual(await self.server.call_tool("echo", {"text": "back"}), "back")
+
+    async def test_pending_calls_fail_when_server_exits(self):
+        await self.server.start()
+        call = asyncio.create_task(self.server.call_tool("sleep_echo", {"text": "x", "seconds": 5}))
+        await asyncio.sleep(0.2)
+        self.server.process.kill()
+        with self.assertRaisesRegex(MCPError, "exited"):
+            await call
+
+class TestMCPClient(unittest.IsolatedAsyncioTestCase):
+    async def test_tools_are_registered_and_callable(self):
+        client = MCPClient()
+        client.load_servers({"echo": ECHO_SERVER, "broken": {"command": "/nonexistent/mcp-server"}, "empty": {}})
+        registry = ToolRegistry()
+        try:
+            self.assertEqual(await client.start(registry), 5)
+            self.assertEqual(set(registry.tools), {"echo__echo", "echo__sleep_echo", "echo__fail",
+                                                   "echo__add_tool", "echo__remove_tool"})
+            schema = next(s for s in registry.get_schemas() if s["function"]["name"] == "echo__echo")
+            self.assertEqual(schema["function"]["parameters"]["required"], ["text"])
+
+            results = await registry.execute_all([("echo__echo", '{"text": "hi"}'),
+                                                  ("echo__sleep_echo", '{"text": "later", "seconds": "0.1"}'),
+                                                  ("echo__fail", '{}')])
+            self.assertEqual(results[:2], ["hi", "later"])
+            self.assertEqual(results[2], "Error executing tool echo__fail: this tool always fails")
+
+            # Arguments are checked against the server's input schema before any request is sent.
+            error = json.loads(await registry.execute("echo__echo", '{}'))
+            self.assertEqual(error["details"], [{"field": "text", "message": "missing required argument"}])
+        finally:
+            await client.close()
+        self.assertIsNone(client.servers[0].process)
+
+    async def _wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "registry was not refreshed")
+            await asyncio.sleep(0.02)
+
+    async def test_list_changed_refreshes_the_registry(self):
+        client = MCPClient()
+        client.load_servers({"echo": ECHO_SERVER})
+        registry = ToolRegistry()
+        try:
+            await client.start(registry)
+            version = registry.schema_version
+
+            self.assertEqual(await registry.execute("echo__add_tool", '{"name": "shout"}'), "added")
+            await self._wait_for(lambda: "echo__shout" in registry.tools)
+            self.assertGreater(registry.schema_version, version)
+            self.assertIn("echo__shout", [s["function"]["name"] for s in registry.get_schemas()])
+            self.assertEqual(await registry.execute("echo__shout", '{"text": "hey"}'), "hey")
+
+            version = registry.schema_version
+            self.assertEqual(await registry.execute("echo__remove_tool", '{"name": "shout"}'), "removed")
+            await self._wait_for(lambda: "echo__shout" not in registry.tools)
+            self.assertGreater(registry.schema_version, version)
+            self.assertNotIn("echo__shout", registry.get_stats())
+            self.assertIn("echo__echo", registry.tools)
+        finally:
+            await client.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import unittest
+import json
+import time
+import os
+import tempfile
+from unittest import mock
+import desktop_aipet.src.memory_service as memory_service
+import desktop_aipet.src.database as database
+from desktop_aipet.src.database import init_db, get_db_connection
+from desktop_aipet.src.memory_service import (create_session, get_config, load_config, save_config, get_llm_client, get_sessions_page,
+                                              count_sessions, search_messages, backfill_search_index, make_fts_query)
+from desktop_aipet.tests.helpers import AsyncDBTestCase
+
+class TestConfigCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.tmp_dir.name, 'config.json')
+        self.write_config({"llm": {"api_key": "key-1", "base_url": "http://localhost:1/v1", "model": "small"}})
+        self.patches = [
+            mock.patch.object(memory_service, 'CONFIG_PATH', self.config_path),
+            mock.patch.object(memory_service, '_config_cache', None),
+            mock.patch.object(memory_service, '_config_mtime', None),
+            mock.patch.object(memory_service, '_llm_router', None),
+            mock.patch.object(memory_service, '_llm_router_key', None),
+            mock.patch.object(memory_service, '_embedders', {}),
+        ]
+        for p in self.patches:
+            p.start()
+
+    async def asyncTearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmp_dir.cleanup()
+
+    def write_config(self, config, mtime_ns=None):
+        with open(self.config_path, 'w') as f:
+            json.dump(config, f)
+        if mtime_ns is not None:
+            os.utime(self.config_path, ns=(mtime_ns, mtime_ns))
+
+    async def test_config_is_parsed_once(self):
+        with mock.patch('json.load', wraps=json.load) as parse:
+            get_config()
+            get_config()
+            load_config()
+        self.assertEqual(parse.call_count, 1)
+
+    async def test_external_edit_is_picked_up(self):
+        self.assertEqual(get_config()['llm']['model'], 'small')
+        mtime = os.stat(self.config_path).st_mtime_ns
+        self.write_config({"llm": {"api_key": "key-1", "model": "large"}}, mtime_ns=mtime + 1_000_000_000)
+        self.assertEqual(get_config()['llm']['model'], 'large')
+
+    async def test_load_config_returns_editable_copy(self):
+        config = load_config()
+        config['llm']['model'] = 'edited'
+        self.assertEqual(get_config()['llm']['model'], 'small')
+
+    async def test_client_is_shared_until_credentials_change(self):
+        client1, _ = await get_llm_client()
+        client2, _ = await get_llm_client()
+        self.assertIs(client1, client2)
+
+        config = load_config()
+        config['llm']['model'] = 'other-model'
+        save_config(config)
+        client3, model = await get_llm_client()
+        self.assertIs(client1, client3)
+        self.assertEqual(model, 'other-model')
+
+        config['llm']['api_key'] = 'key-2'
+        save_config(config)
+        client4, _ = await get_llm_client()
+        self.assertIsNot(client1, client4)
+        self.assertEqual(client4.api_key, 'key-2')
+
+    async def test_embeddings_use_an_endpoint_with_a_key(self):
+        endpoints = [{"name": "local", "base_url": "http://localhost:1/v1", "api_key": "YOUR_API_KEY_HERE"},
+                     {"name": "hosted", "base_url": "http://localhost:2/v1", "api_key": "key-1"}]
+        self.write_config({"llm": {"model": "small", "embedding_model": "embed", "endpoints": endpoints}})
+        embedder = await memory_service.get_embedder()
+        self.assertIsInstance(embedder, memory_service.ApiEmbedder)
+        self.assertEqual(memory_service._llm_router.embedding_endpoint.name, "hosted")
+
+        # Naming the keyless endpoint explicitly falls back to local embeddings rather than failing every call.
+        self.write_config({"llm": {"model": "small", "embedding_model": "embed", "endpoints": endpoints,
+                                   "embedding_endpoint": "local"}}, mtime_ns=time.time_ns() + 1_000_000_000)
+        self.assertIsInstance(await memory_service.get_embedder(), memory_service.LocalEmbedder)
+
+class TestSessionPages(AsyncDBTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        async with get_db_connection() as db:
+            # Several sessions per second, as created_at has one-second resolution.
+            await db.executemany('INSERT INTO sessions (id, title, created_at) VALUES (?, ?, ?)',
+                                 [(f's{i:02d}', f'Chat {i}', f'2024-01-0{1 + i // 10} 10:00:{i // 3:02d}') for i in range(25)])
+            await db.commit()
+
+    async def test_pages_cover_all_sessions_newest_first(self):
+        seen = []
+        after = None
+        while True:
+            rows, has_more = await get_sessions_page(after, limit=7)
+            seen.extend(rows)
+            if not has_more:
+                break
+            after = (rows[-1][2], rows[-1][0])
+        self.assertEqual([r[0] for r in seen], [f's{i:02d}' for i in reversed(range(25))])
+        self.assertEqual(await count_sessions(), 25)
+
+    async def test_date_range(self):
+        rows, has_more = await get_sessions_page(since='2024-01-02', until='2024-01-03')
+        self.assertEqual(len(rows), 10)
+        self.assertFalse(has_more)
+        self.assertEqual(await count_sessions(since='2024-01-02', until='2024-01-03'), 10)
+
+class TestSearch(AsyncDBTestCase):
+    create_schema = False
+
+    async def log(self, *rows):
+        async with get_db_connection() as db:
+            await db.executemany('INSERT INTO chat_logs (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)',
+                                 [(session_id, 'user', content, '2024-01-01T10:00:00') for session_id, content in rows])
+            await db.commit()
+
+    async def test_search_ranks_and_filters(self):
+        await init_db()
+        await create_session('a', 'Garden')
+        await self.log(('a', 'The tomato plants need water'),
+                       ('a', 'Tomato tomato tomato soup recipe'),
+                       ('b', 'Buy tomatoes and basil'),
+                       ('b', 'Nothing relevant here'))
+
+        results = await search_messages('tomato')
+        self.assertEqual([r[4] for r in results][0], '[Tomato] [tomato] [tomato] soup recipe')
+        self.assertEqual(len(results), 3)  # prefix match includes "tomatoes"
+        self.assertEqual(results[0][1:4], ('a', 'Garden', 'user'))
+
+        self.assertEqual([r[1] for r in await search_messages('tomato', session_id='b')], ['b'])
+        self.assertEqual(len(await search_messages('tomato', limit=1)), 1)
+        self.assertEqual(await search_messages('   '), [])
+        # FTS5 syntax in user input is treated as text.
+        self.assertEqual(await search_messages('basil" OR -"x:'), [])
+
+    async def test_index_follows_updates_and_deletes(self):
+        await init_db()
+        await self.log(('a', 'first draft'))
+        async with get_db_connection() as db:
+            await db.execute("UPDATE chat_logs SET content = 'final version'")
+            await db.commit()
+        self.assertEqual(await search_messages('draft'), [])
+        self.assertEqual(len(await search_messages('final')), 1)
+
+        async with get_db_connection() as db:
+            await db.execute("DELETE FROM chat_logs")
+            await db.commit()
+        self.assertEqual(await search_messages('final'), [])
+
+    async def test_existing_messages_are_backfilled(self):
+        # An existing database from before full-text search.
+        with mock.patch.object(database, 'MIGRATIONS', database.MIGRATIONS[:4]):
+            await init_db()
+        await self.log(*[('a', f'old message {i}') for i in range(25)])
+        await init_db()
+        await self.log(('a', 'new message'))
+
+        self.assertEqual([r[4] for r in await search_messages('message')], ['new [message]'])
+        # Deleting a row that has not been indexed yet must not touch the index.
+        async with get_db_connection() as db:
+            await db.execute("DELETE FROM chat_logs WHERE content = 'old message 20'")
+            await db.commit()
+
+        await backfill_search_index(batch_size=10)
+        self.assertEqual(len(await search_messages('message')), 25)
+        async with get_db_connection() as db:
+            async with db.execute("INSERT INTO chat_logs_fts (chat_logs_fts) VALUES ('integrity-check')"):
+                pass
+            async with db.execute('SELECT COUNT(*) FROM search_backfill') as cursor:
+                self.assertEqual((await cursor.fetchone())[0], 0)
+
+    def test_make_fts_query(self):
+        self.assertEqual(make_fts_query('hello  world'), '"hello" "world"*')
+        self.assertEqual(make_fts_query('say "hi"'), '"say" """hi"""*')
+        self.assertIsNone(make_fts_query(''))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,10 @@
 import unittest
 import asyncio
-import os
 from desktop_aipet.src.database import init_db, get_db_connection
-from desktop_aipet.src.scheduler_service import schedule_reminder, get_all_reminders, delete_reminder, update_reminder, init_scheduler
+from desktop_aipet.src.scheduler_service import (schedule_reminder, get_all_reminders, delete_reminder, update_reminder, init_scheduler,
+                                                get_reminders_page, count_reminders)
 from datetime import datetime, timedelta
+from desktop_aipet.tests.helpers import AsyncDBTestCase
 
 class TestReminders(unittest.TestCase):
     def setUp(self):
@@ -53,5 +54,38 @@ class TestReminders(unittest.TestCase):
     def test_crud(self):
         self.loop.run_until_complete(self.async_test_crud())
 
+class TestReminderPages(AsyncDBTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        async with get_db_connection() as db:
+            await db.executemany("INSERT INTO reminders (message, run_date, status) VALUES (?, ?, ?)",
+                                 [(f'r{i}', f'2024-01-{1 + i // 4:02d}T09:00:00', 'pending' if i % 2 else 'completed')
+                                  for i in range(20)])
+            await db.commit()
+
+    async def collect(self, **filters):
+        seen = []
+        after = None
+        while True:
+            page, has_more = await get_reminders_page(after, limit=3, **filters)
+            seen.extend(page)
+            if not has_more:
+                return seen
+            after = (page[-1]['run_date'], page[-1]['id'])
+
+    async def test_pages_follow_run_date_order(self):
+        reminders = await self.collect()
+        self.assertEqual([r['message'] for r in reminders], [f'r{i}' for i in range(20)])
+        self.assertEqual(await count_reminders(), 20)
+
+    async def test_filters(self):
+        pending = await self.collect(status='pending')
+        self.assertEqual([r['message'] for r in pending], [f'r{i}' for i in range(1, 20, 2)])
+        self.assertEqual(await count_reminders(status='pending'), 10)
+
+        ranged = await self.collect(since='2024-01-02', until='2024-01-04')
+        self.assertEqual([r['message'] for r in ranged], [f'r{i}' for i in range(4, 12)])
+        self.assertEqual(await count_reminders(status='completed', since='2024-01-02', until='2024-01-04'), 4)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+import json
+from types import SimpleNamespace
+from unittest import mock
+import numpy as np
+import desktop_aipet.src.response_cache as response_cache
+from desktop_aipet.src.database import get_db_connection
+from desktop_aipet.src.response_cache import ResponseCache, cache_key, cached_completion
+from desktop_aipet.src.semantic_memory import ApiEmbedder
+from desktop_aipet.src.summarizer import ChunkedSummarizer
+from desktop_aipet.tests.helpers import AsyncDBTestCase
+
+class CountingClient:
+    """Answers with a numbered reply per chat request and counts what was sent."""
+    def __init__(self):
+        self.chat_requests = 0
+        self.embedded = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.embeddings = SimpleNamespace(create=self.embed)
+
+    async def create(self, model, messages, **kwargs):
+        self.chat_requests += 1
+        content = json.dumps({"summary": f"#{self.chat_requests}", "key_events": []})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    async def embed(self, model, input):
+        self.embedded.extend(input)
+        return SimpleNamespace(data=[SimpleNamespace(index=i, embedding=[len(text), 1.0]) for i, text in enumerate(input)])
+
+async def rows_of(rows):
+    for row in rows:
+        yield row
+
+class TestResponseCache(AsyncDBTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.client = CountingClient()
+
+    async def test_key_covers_model_messages_and_params(self):
+        messages = [{"role": "user", "content": "hi"}]
+        key = cache_key("chat", "m", {"model": "m", "messages": messages})
+        self.assertEqual(key, cache_key("chat", "m", {"messages": messages, "model": "m"}))
+        self.assertNotEqual(key, cache_key("chat", "other", {"model": "other", "messages": messages}))
+        self.assertNotEqual(key, cache_key("chat", "m", {"model": "m", "messages": messages, "temperature": 0}))
+
+    async def test_repeated_completion_is_served_from_cache(self):
+        cache = ResponseCache()
+        params = {"model": "m", "messages": [{"role": "user", "content": "title please"}]}
+        first = await cached_completion(self.client, cache, **params)
+        self.assertEqual(await cached_completion(self.client, cache, **params), first)
+        self.assertEqual(self.client.chat_requests, 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # Uncached call sites always go to the model.
+        await cached_completion(self.client, None, **params)
+        self.assertEqual(self.client.chat_requests, 2)
+
+    async def test_entries_expire_after_ttl(self):
+        cache = ResponseCache(ttl=60)
+        with mock.patch.object(response_cache.time, 'time', return_value=1000.0):
+            await cache.put("k", "v")
+            self.assertEqual(await cache.get("k"), "v")
+        with mock.patch.object(response_cache.time, 'time', return_value=1061.0):
+            self.assertIsNone(await cache.get("k"))
+            await cache.evict()
+        async with get_db_connection() as db:
+            async with db.execute('SELECT COUNT(*) FROM llm_cache') as cursor:
+                self.assertEqual((await cursor.fetchone())[0], 0)
+
+    async def test_least_recently_used_entries_are_evicted(self):
+        cache = ResponseCache(max_bytes=25)
+        for i, key in enumerate(["a", "b", "c"]):
+            with mock.patch.object(response_cache.time, 'time', return_value=1000.0 + i):
+                await cache.put(key, "x" * 10)
+        with mock.patch.object(response_cache.time, 'time', return_value=1010.0):
+            await cache.get("a")
+            await cache.evict()
+            self.assertEqual(set(await cache.get_many(["a", "b", "c"])), {"a", "c"})
+
+    async def test_summaries_and_embeddings_use_cache(self):
+        cache = ResponseCache()
+        rows = [("user", "I adopted a cat"), ("assistant", "Congratulations!")]
+        first = await ChunkedSummarizer(self.client, "m", cache=cache).summarize(rows_of(rows))
+        second = await ChunkedSummarizer(self.client, "m", cache=cache).summarize(rows_of(rows))
+        self.assertEqual(first, second)
+        self.assertEqual(self.client.chat_requests, 1)
+
+        embedder = ApiEmbedder(self.client, "e", cache=cache)
+        first = await embedder.embed(["cat", "tuna"])
+        second = await embedder.embed(["tuna", "dog", "cat"])
+        self.assertEqual(self.client.embedded, ["cat", "tuna", "dog"])
+        np.testing.assert_allclose(second[[2, 0]], first)
+        self.assertEqual(second.dtype, np.float32)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+import asyncio
+from unittest import mock
+import numpy as np
+import desktop_aipet.src.memory_service as memory_service
+from desktop_aipet.src.database import get_db_connection
+from desktop_aipet.src.llm_gateway import INTERACTIVE, BACKGROUND
+from desktop_aipet.src.semantic_memory import LocalEmbedder, SemanticMemory, VectorIndex, from_blob
+from desktop_aipet.tests.helpers import AsyncDBTestCase
+
+class CountingEmbedder(LocalEmbedder):
+    def __init__(self):
+        super().__init__()
+        self.embedded = []
+
+    async def embed(self, texts):
+        self.embedded.extend(texts)
+        return await super().embed(texts)
+
+class TestVectorIndex(unittest.TestCase):
+    def test_top_k_by_similarity(self):
+        index = VectorIndex()
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(3000, 16)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        # Added in uneven batches to exercise growth.
+        index.add(list(range(1000)), vectors[:1000])
+        index.add(list(range(1000, 3000)), vectors[1000:])
+
+        query = vectors[1234]
+        results = index.search(query, 5)
+        self.assertEqual(results[0][0], 1234)
+        self.assertAlmostEqual(results[0][1], 1.0, places=5)
+        expected = np.argsort(-(vectors @ query))[:5]
+        self.assertEqual([key for key, _ in results], list(expected))
+        self.assertEqual(VectorIndex().search(query, 5), [])
+
+class TestLocalEmbedder(unittest.IsolatedAsyncioTestCase):
+    async def test_related_texts_are_closer(self):
+        a, b, c = await LocalEmbedder().embed(["my cat likes tuna", "does the cat like tuna?", "quarterly tax report"])
+        self.assertEqual(a.dtype, np.float32)
+        self.assertGreater(float(a @ b), float(a @ c))
+        x, y = await LocalEmbedder().embed(["我喜欢猫", "猫很可爱"])
+        self.assertGreater(float(x @ y), 0)
+
+class TestSemanticMemory(AsyncDBTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.embedder = CountingEmbedder()
+        self.memory = SemanticMemory(mock.AsyncMock(return_value=self.embedder))
+
+    async def log(self, *contents, session_id='s'):
+        async with get_db_connection() as db:
+            await db.executemany('INSERT INTO chat_logs (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)',
+                                 [(session_id, 'user', c, f'2024-01-01T10:00:{i:02d}') for i, c in enumerate(contents)])
+            await db.commit()
+
+    async def test_each_message_is_embedded_once(self):
+        await self.log('my cat likes tuna', None, 'the weather is nice')
+        await self.memory.index_pending(batch_size=2)
+        await self.memory.index_pending()
+        self.assertEqual(self.embedder.embedded, ['my cat likes tuna', 'the weather is nice'])
+
+        async with get_db_connection() as db:
+            async with db.execute('SELECT log_id, vector FROM message_embeddings ORDER BY log_id') as cursor:
+                rows = await cursor.fetchall()
+        self.assertEqual([r[0] for r in rows], [1, 3])
+        self.assertEqual(from_blob(rows[0][1]).shape, (self.embedder.dim,))
+
+        # A fresh instance loads the stored vectors instead of re-embedding.
+        other = SemanticMemory(mock.AsyncMock(return_value=self.embedder))
+        await other.index_pending()
+        self.assertEqual(len(self.embedder.embedded), 2)
+        self.assertEqual(len(other._index), 2)
+
+    async def test_recall_reuses_query_embedding(self):
+        await self.log('my cat likes tuna', 'the weather is nice')
+        await self.memory.index_pending()
+
+        memories = await self.memory.recall('what does my cat like')
+        self.assertEqual(memories[0][:3], ('message', 'user: my cat likes tuna', '2024-01-01T10:00:00'))
+        self.assertNotIn('user: the weather is nice', [m[1] for m in memories])
+
+        await self.log('what does my cat like')
+        await self.memory.index_pending()
+        self.assertEqual(self.embedder.embedded.count('what does my cat like'), 1)
+
+    async def test_recall_skips_excluded_and_includes_key_events(self):
+        await self.log('my cat likes tuna')
+        async with get_db_connection() as db:
+            await db.execute("INSERT INTO daily_summaries (date, summary_text, key_events) VALUES ('2024-01-01', 's', ?)",
+                             ('["Buy tuna for the cat"]',))
+            await db.commit()
+        await self.memory.index_pending()
+
+        memories = await self.memory.recall('cat tuna', exclude={('user', 'my cat likes tuna', '2024-01-01T10:00:00')})
+        self.assertEqual([m[:3] for m in memories], [('event', 'Buy tuna for the cat', '2024-01-01')])
+
+    async def test_recall_is_interactive_and_indexing_background(self):
+        await self.memory.index_pending()
+        await self.memory.recall('cat')
+        self.assertEqual([c.args for c in self.memory.get_embedder.await_args_list], [(BACKGROUND,), (INTERACTIVE,)])
+
+    async def test_concurrent_first_use_loads_once(self):
+        await self.log('my cat likes tuna', 'the weather is nice')
+        await self.memory.index_pending()
+        # A fresh instance: recall and indexing both find the index unloaded.
+        memory = SemanticMemory(mock.AsyncMock(return_value=self.embedder))
+        await self.log('cats sleep a lot')
+        with mock.patch.object(memory, '_load_vectors', wraps=memory._load_vectors) as load:
+            await asyncio.gather(memory.index_pending(), memory.recall('cat'))
+        load.assert_awaited_once()
+        self.assertEqual(sorted(memory._index.keys), [('message', 1), ('message', 2), ('message', 3)])
+
+class TestContextMemories(AsyncDBTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.patches = [
+            mock.patch.object(memory_service, 'context_builder', memory_service.ContextBuilder(history_budget=30)),
+            mock.patch.object(memory_service, 'semantic_memory', SemanticMemory(mock.AsyncMock(return_value=LocalEmbedder()))),
+        ]
+        for p in self.patches:
+            p.start()
+
+    async def asyncTearDown(self):
+        await memory_service.semantic_memory.close()
+        for p in self.patches:
+            p.stop()
+
+    async def test_old_messages_are_recalled_before_latest_turn(self):
+        async with get_db_connection() as db:
+            await db.executemany('INSERT INTO chat_logs (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)',
+                                 [('old', 'user', 'my cat is called Miso', '2023-01-01T10:00:00'),
+                                  ('s', 'user', 'what is my cat called', '2024-01-01T10:00:00')])
+            await db.commit()
+        await memory_service.semantic_memory.index_pending()
+
+        messages = await memory_service.get_context_messages('s', "Persona.")
+        self.assertEqual(messages[0], {"role": "system", "content": "Persona."})
+        self.assertEqual(messages[1]["role"], "system")
+        self.assertIn("[2023-01-01T10:00:00] user: my cat is called Miso", messages[1]["content"])
+        self.assertEqual(messages[-1], {"role": "user", "content": "what is my cat called"})
+
+        context = await memory_service.get_context('s')
+        self.assertIn("--- Relevant Memories ---\n[2023-01-01T10:00:00] user: my cat is called Miso", context)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+import unittest
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest import mock
+import desktop_aipet.src.memory_service as memory_service
+from desktop_aipet.src.database import get_db_connection
+from desktop_aipet.src.summarizer import ChunkedSummarizer, merge_key_events, split_text
+from desktop_aipet.src.context_builder import estimate_tokens
+from desktop_aipet.tests.helpers import AsyncDBTestCase
+
+class FakeClient:
+    """Answers summarization requests locally and records what was asked."""
+    def __init__(self):
+        self.api_key = "test-key"
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, **kwargs):
+        self.requests.append(messages)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+
+        text = messages[-1]["content"]
+        if text.startswith("Chat Logs:"):
+            lines = text.split("\n\n")[0].splitlines()[1:]
+            reply = {"summary": f"chunk of {len(lines)}",
+                     "key_events": [l.split(": ", 1)[1] for l in lines if "EVENT" in l]}
+        else:
+            reply = {"summary": f"combined {text.count('Part ')}"}
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(reply)))])
+
+async def rows_of(rows):
+    for row in rows:
+        yield row
+
+class TestHelpers(unittest.TestCase):
+    def test_merge_key_events(self):
+        self.assertEqual(merge_key_events(["Buy milk", "Call Bob"], ["buy  MILK", "Dentist"], []),
+                         ["Buy milk", "Call Bob", "Dentist"])
+
+    def test_split_text(self):
+        pieces = split_text("x" * 1000, 50)
+        self.assertEqual("".join(pieces), "x" * 1000)
+        self.assertTrue(all(estimate_tokens(p) <= 50 for p in pieces))
+        self.assertEqual(split_text("short", 50), ["short"])
+
+class TestChunkedSummarizer(unittest.IsolatedAsyncioTestCase):
+    async def test_single_chunk_needs_no_reduce(self):
+        client = FakeClient()
+        result = await ChunkedSummarizer(client, "m").summarize(rows_of([("user", "Hi"), ("assistant", "Hello")]))
+        self.assertEqual(result, ("chunk of 2", []))
+        self.assertEqual(len(client.requests), 1)
+
+    async def test_no_rows(self):
+        client = FakeClient()
+        self.assertIsNone(await ChunkedSummarizer(client, "m").summarize(rows_of([])))
+        self.assertEqual(client.requests, [])
+
+    async def test_long_day_is_mapped_and_reduced(self):
+        client = FakeClient()
+        rows = [("user", f"message {i} " + "x" * 80) for i in range(100)]
+        rows[10] = ("user", "EVENT dentist at 3pm")
+        rows[90] = ("user", "event  Dentist at 3PM")
+        summarizer = ChunkedSummarizer(client, "m", chunk_budget=300, max_concurrency=3)
+        summary, key_events = await summarizer.summarize(rows_of(rows))
+
+        map_requests = [r for r in client.requests if r[-1]["content"].startswith("Chat Logs:")]
+        self.assertGreater(len(map_requests), 1)
+        for request in map_requests:
+            self.assertLessEqual(estimate_tokens(request[-1]["content"]), 400)
+        self.assertTrue(summary.startswith("combined"))
+        self.assertEqual(key_events, ["EVENT dentist at 3pm"])
+        self.assertLessEqual(client.max_in_flight, 3)
+
+    async def test_failure_cancels_pending_chunks(self):
+        client = FakeClient()
+        original = client.create
+
+        async def create(model, messages, **kwargs):
+            if "fail" in messages[-1]["content"]:
+                raise RuntimeError("boom")
+            return await original(model, messages, **kwargs)
+        client.chat.completions.create = create
+
+        rows = [("user", "fail")] + [("user", "x" * 400) for _ in range(10)]
+        with self.assertRaises(RuntimeError):
+            await ChunkedSummarizer(client, "m", chunk_budget=150, max_concurrency=1).summarize(rows_of(rows))
+
+class TestUpdateSummaries(AsyncDBTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.client = FakeClient()
+        self.client_patch = mock.patch.object(memory_service, 'get_llm_client',
+                                              mock.AsyncMock(return_value=(self.client, "m")))
+        self.client_patch.start()
+
+    async def asyncTearDown(self):
+        self.client_patch.stop()
+
+    async def test_summary_is_stored(self):
+        now = memory_service.datetime.datetime.now().isoformat()
+        async with get_db_connection() as db:
+            await db.executemany('INSERT INTO chat_logs (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)',
+                                 [('s', 'user', 'EVENT buy milk', now), ('s', 'assistant', 'Noted', now)])
+            await db.commit()
+
+        self.assertEqual(await memory_service.update_summaries(min_new_messages=1), 1)
+        async with get_db_connection() as db:
+            async with db.execute('SELECT summary_text, key_events FROM daily_summaries') as cursor:
+                rows = await cursor.fetchall()
+        self.assertEqual(rows, [("chunk of 2", '["EVENT buy milk"]')])
+
+class TestRollingSummaries(AsyncDBTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.client = FakeClient()
+        self.client_patch = mock.patch.object(memory_service, 'get_llm_client',
+                                              mock.AsyncMock(return_value=(self.client, "m")))
+        self.client_patch.start()
+        self.today = memory_service.datetime.date.today()
+
+    async def asyncTearDown(self):
+        self.client_patch.stop()
+
+    async def log(self, day, *contents):
+        async with get_db_connection() as db:
+            await db.executemany('INSERT INTO chat_logs (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)',
+                                 [('s', 'user', c, f'{day.isoformat()}T12:00:00') for c in contents])
+            await db.commit()
+
+    async def summaries(self):
+        async with get_db_connection() as db:
+            async with db.execute('SELECT date, summary_text, key_events, last_log_id FROM daily_summaries ORDER BY date') as cursor:
+                return await cursor.fetchall()
+
+    async def test_missed_days_are_caught_up(self):
+        yesterday = self.today - memory_service.datetime.timedelta(days=1)
+        await self.log(yesterday, 'EVENT old', 'b')
+        await self.log(self.today, 'c')
+
+        self.assertEqual(await memory_service.update_summaries(min_new_messages=5), 1)
+        self.assertEqual(await self.summaries(), [(yesterday.isoformat(), 'chunk of 2', '["EVENT old"]', 2)])
+
+        # Nothing new past the high-water mark: no requests.
+        self.client.requests.clear()
+        self.assertEqual(await memory_service.update_summaries(min_new_messages=5), 0)
+        self.assertEqual(self.client.requests, [])
+
+    async def test_today_is_folded_incrementally(self):
+        await self.log(self.today, 'EVENT first', 'b')
+        self.assertEqual(await memory_service.update_summaries(min_new_messages=2), 1)
+        await self.log(self.today, 'c')
+        self.assertEqual(await memory_service.update_summaries(min_new_messages=2), 0)
+        await self.log(self.today, 'EVENT  FIRST', 'EVENT second')
+
+        self.client.requests.clear()
+        self.assertEqual(await memory_service.update_summaries(min_new_messages=2), 1)
+        # Only the three new rows are read, then merged into the stored summary.
+        self.assertEqual(len(self.client.requests), 2)
+        self.assertEqual(self.client.requests[0][-1]["content"].count("user: "), 3)
+        self.assertEqual(await self.summaries(),
+                         [(self.today.isoformat(), 'combined 2', '["EVENT first", "EVENT second"]', 5)])
+
+    async def test_summaries_refresh_context(self):
+        await self.log(self.today, 'hello')
+        memory_service.context_builder.invalidate_summaries()
+        self.assertNotIn("Summary:", await memory_service.get_context('other'))
+        await memory_service.update_summaries(min_new_messages=1)
+        self.assertIn("Summary: chunk of 1", await memory_service.get_context('other'))
+
+    async def test_missing_key_is_reported_once(self):
+        await self.log(self.today, 'hello')
+        self.client.api_key = ""
+        with mock.patch.object(memory_service, '_summary_key_warned', False), \
+                mock.patch('builtins.print') as printed:
+            for _ in range(3):
+                self.assertIsNone(await memory_service.update_summaries(min_new_messages=1))
+            self.assertEqual([call.args[0] for call in printed.call_args_list],
+                             ["Skipping LLM summary due to missing API Key."])
+            self.assertEqual(self.client.requests, [])
+
+            # Once a key is set summaries resume, and a later loss of it is reported again.
+            self.client.api_key = "test-key"
+            self.assertEqual(await memory_service.update_summaries(min_new_messages=1), 1)
+            self.client.api_key = ""
+            await memory_service.update_summaries(min_new_messages=1)
+            self.assertEqual([call.args[0] for call in printed.call_args_list].count(
+                "Skipping LLM summary due to missing API Key."), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest import mock
+from desktop_aipet.src.database import get_db_connection
+from desktop_aipet.src.memory_service import create_session
+from desktop_aipet.src.title_generator import TitleGenerator
+from desktop_aipet.tests.helpers import AsyncDBTestCase
+
+class TitleClient:
+    """Titles each numbered message "Title <n>" (or "Solo" for single requests) and records requests."""
+    def __init__(self):
+        self.api_key = "test-key"
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, **kwargs):
+        self.requests.append(messages[-1]["content"])
+        if "response_format" in kwargs:
+            count = messages[-1]["content"].count("\n") - 1
+            content = json.dumps({"titles": {str(i): f'"Title {i}"' for i in range(1, count + 1)}})
+        else:
+            content = ' "Solo" '
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+class TestTitleGenerator(AsyncDBTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.client = TitleClient()
+        self.generator = TitleGenerator(mock.AsyncMock(return_value=(self.client, "m")), batch_delay=0.05)
+
+    async def asyncTearDown(self):
+        await self.generator.close()
+
+    async def titles(self):
+        async with get_db_connection() as db:
+            async with db.execute('SELECT id, title, titled FROM sessions ORDER BY id') as cursor:
+                return await cursor.fetchall()
+
+    async def test_pending_sessions_are_titled_in_one_request(self):
+        for session_id in ("a", "b", "c"):
+            await create_session(session_id, None)
+        await create_session("named", "Named by hand")
+
+        for session_id in ("a", "b", "named", "c"):
+            self.generator.request(session_id, f"hello from {session_id}")
+        self.generator.request("a", "second message")
+        await self.generator._worker
+
+        self.assertEqual(len(self.client.requests), 1)
+        self.assertIn("1. hello from a\n2. hello from b\n3. hello from c", self.client.requests[0])
+        self.assertEqual(await self.titles(), [("a", "Title 1", 1), ("b", "Title 2", 1), ("c", "Title 3", 1),
+                                               ("named", "Named by hand", 1)])
+
+        # Titled sessions are remembered and never queued again.
+        self.generator.request("a", "another turn")
+        self.assertFalse(self.generator._pending)
+
+    async def test_single_session_and_retry_after_failure(self):
+        await create_session("s", None)
+        self.generator.request("s", "what's the weather")
+        with mock.patch.object(self.client.chat.completions, 'create', mock.AsyncMock(side_effect=RuntimeError("rate limited"))):
+            await self.generator._worker
+        self.assertEqual(await self.titles(), [("s", None, 0)])
+
+        self.generator.request("s", "what's the weather")
+        await self.generator._worker
+        self.assertEqual(await self.titles(), [("s", "Solo", 1)])
+        self.assertEqual(self.client.requests,
+                         ["Generate a short (3-5 words) title for this conversation based on this message: what's the weather"])
+
+    async def test_close_drops_pending_work(self):
+        await create_session("s", None)
+        self.generator.request("s", "hi")
+        await self.generator.close()
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.client.requests, [])
+        self.assertFalse(self.generator._pending)
+        self.assertIsNone(self.generator._worker)
+
+    async def test_usable_again_after_close(self):
+        await create_session("s", None)
+        self.generator.request("s", "hi")
+        await self.generator.close()
+        self.generator.request("s", "hi again")
+        await self.generator._worker
+        self.assertEqual(await self.titles(), [("s", "Solo", 1)])
+        self.assertEqual(len(self.client.requests), 1)
+
+if __name__ == '__main__':
+    unittest.main()
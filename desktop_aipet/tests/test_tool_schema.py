@@ -0,0 +1,133 @@
+import unittest
+import datetime
+import json
+import timeit
+from typing import Literal, Optional
+from unittest import mock
+import desktop_aipet.src.agent_core as agent_core
+from desktop_aipet.src.agent_core import ToolRegistry, set_reminder
+from desktop_aipet.src.tool_schema import ToolArgumentError, compile_validator, schema_from_function
+
+def plan_trip(city: str, start: datetime.datetime, nights: int = 1, tags: list[str] = None,
+              mode: Literal["car", "train"] = "train", budget: Optional[float] = None):
+    """
+    Plan a trip.
+
+    Args:
+        city: Destination city.
+        start: When to leave.
+    """
+    return city, start, nights, tags, mode, budget
+
+class TestSchemaFromFunction(unittest.TestCase):
+    def test_set_reminder_schema(self):
+        self.assertEqual(schema_from_function(set_reminder), {
+            "type": "function",
+            "function": {
+                "name": "set_reminder",
+                "description": "Set a reminder for a specific time.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "message": {"type": "string", "description": "The reminder message."},
+                        "time_iso": {"type": "string", "format": "date-time",
+                                     "description": "ISO 8601 format time (e.g., 2023-10-27T14:30:00)."}
+                    },
+                    "required": ["message", "time_iso"],
+                    "additionalProperties": False
+                }
+            }
+        })
+
+    def test_types(self):
+        properties = schema_from_function(plan_trip)["function"]["parameters"]["properties"]
+        self.assertEqual(properties["nights"], {"type": "integer"})
+        self.assertEqual(properties["tags"], {"type": "array", "items": {"type": "string"}})
+        self.assertEqual(properties["mode"], {"enum": ["car", "train"], "type": "string"})
+        self.assertEqual(properties["budget"], {"type": "number"})
+
+class TestValidator(unittest.TestCase):
+    def setUp(self):
+        self.validate = compile_validator(schema_from_function(plan_trip)["function"]["parameters"], convert_formats=True)
+
+    def test_coercion(self):
+        args = self.validate('{"city": "Oslo", "start": "2024-05-01T08:30:00Z", "nights": "3", "budget": 120}')
+        self.assertEqual(args["start"], datetime.datetime(2024, 5, 1, 8, 30, tzinfo=datetime.timezone.utc))
+        self.assertEqual(args["nights"], 3)
+        self.assertNotIn("mode", args)
+
+    def test_errors_are_collected(self):
+        with self.assertRaises(ToolArgumentError) as ctx:
+            self.validate('{"start": "next tuesday", "nights": true, "mode": "plane", "color": "red"}')
+        self.assertEqual(ctx.exception.errors, [
+            {"field": "start", "message": "expected an ISO 8601 date-time, got 'next tuesday'"},
+            {"field": "nights", "message": "expected an integer"},
+            {"field": "mode", "message": "must be one of ['car', 'train']"},
+            {"field": "city", "message": "missing required argument"},
+            {"field": "color", "message": "unexpected argument"},
+        ])
+        with self.assertRaises(ToolArgumentError):
+            self.validate('{"city": ')
+        with self.assertRaises(ToolArgumentError):
+            self.validate('["Oslo"]')
+
+    def test_explicit_schema_keeps_strings(self):
+        validate = compile_validator({"properties": {"when": {"type": "string", "format": "date-time"}}})
+        self.assertEqual(validate('{"when": "2024-05-01T08:30:00"}'), {"when": "2024-05-01T08:30:00"})
+
+    def test_extra_keys_allowed_by_default(self):
+        for schema in ({"properties": {"q": {"type": "string"}}},
+                       {"properties": {"q": {"type": "string"}}, "additionalProperties": True}):
+            validate = compile_validator(schema)
+            self.assertEqual(validate('{"q": "cats", "limit": 5}'), {"q": "cats", "limit": 5})
+
+    def test_extra_keys_checked_against_schema(self):
+        validate = compile_validator({"properties": {"q": {"type": "string"}},
+                                      "additionalProperties": {"type": "integer"}})
+        self.assertEqual(validate('{"q": "cats", "limit": "5"}'), {"q": "cats", "limit": 5})
+        with self.assertRaises(ToolArgumentError) as ctx:
+            validate('{"q": "cats", "limit": "many"}')
+        self.assertEqual(ctx.exception.errors, [{"field": "limit", "message": "expected an integer"}])
+
+    def test_extra_keys_rejected_when_false(self):
+        validate = compile_validator({"properties": {"q": {"type": "string"}}, "additionalProperties": False})
+        with self.assertRaises(ToolArgumentError) as ctx:
+            validate('{"q": "cats", "limit": 5}')
+        self.assertEqual(ctx.exception.errors, [{"field": "limit", "message": "unexpected argument"}])
+
+    def test_validation_is_cheap(self):
+        payload = '{"city": "Oslo", "start": "2024-05-01T08:30:00", "nights": 2}'
+        seconds = min(timeit.repeat(lambda: self.validate(payload), number=1000, repeat=3)) / 1000
+        self.assertLess(seconds, 100e-6)
+
+class TestRegistryValidation(unittest.IsolatedAsyncioTestCase):
+    async def test_schemas_are_cached_per_version(self):
+        registry = ToolRegistry()
+        registry.register("plan_trip", plan_trip, mode="inline")
+        first = registry.get_schemas()
+        self.assertIs(registry.get_schemas(), first)
+        registry.register("set_reminder", set_reminder)
+        self.assertIsNot(registry.get_schemas(), first)
+        self.assertEqual(registry.schema_version, 2)
+
+    async def test_invalid_arguments_return_structured_error(self):
+        registry = ToolRegistry()
+        registry.register("plan_trip", plan_trip, mode="inline")
+        result = json.loads(await registry.execute("plan_trip", '{"city": 5}'))
+        self.assertEqual(result["error"], "invalid_arguments")
+        self.assertEqual([d["field"] for d in result["details"]], ["city", "start"])
+        self.assertEqual(registry.get_stats()["plan_trip"]["errors"], 1)
+
+        city, start, *_ = await registry.execute("plan_trip", '{"city": "Oslo", "start": "2024-05-01"}')
+        self.assertEqual(start, datetime.datetime(2024, 5, 1))
+
+    async def test_set_reminder_receives_local_time(self):
+        with mock.patch.object(agent_core, 'schedule_reminder', mock.AsyncMock(return_value=True)) as schedule:
+            registry = ToolRegistry()
+            registry.register("set_reminder", set_reminder)
+            utc = datetime.datetime(2030, 1, 1, 12, 0, tzinfo=datetime.timezone.utc)
+            self.assertTrue(await registry.execute("set_reminder", json.dumps({"message": "x", "time_iso": utc.isoformat()})))
+        schedule.assert_awaited_once_with("x", utc.astimezone().replace(tzinfo=None).isoformat())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import asyncio
+import json
+import os
+import tempfile
+from desktop_aipet.src.tracing import Tracer, percentile, SINK_BATCH
+
+class TestTracer(unittest.IsolatedAsyncioTestCase):
+    def test_ring_buffer_and_summary(self):
+        tracer = Tracer(capacity=3)
+        for duration in [0.4, 0.1, 0.2, 0.3]:
+            tracer.record("db.read", duration)
+        self.assertEqual(tracer.values("db.read"), [0.1, 0.2, 0.3])
+        self.assertEqual(tracer.summary(), {"db.read": {"count": 3, "p50": 0.2, "p95": 0.3, "max": 0.3}})
+        self.assertEqual(percentile([5, 1, 3, 2, 4], 0.5), 3)
+
+    def test_span_records_errors(self):
+        tracer = Tracer()
+        with self.assertRaises(ValueError):
+            with tracer.span("tool", tool="x") as attrs:
+                attrs["rows"] = 2
+                raise ValueError
+        span = tracer.spans[0]
+        self.assertEqual((span["name"], span["tool"], span["rows"], span["error"]), ("tool", "x", 2, "ValueError"))
+
+    async def test_spans_are_grouped_by_turn(self):
+        tracer = Tracer()
+
+        async def turn(label, delay):
+            with tracer.turn(label=label):
+                await asyncio.sleep(delay)
+                tracer.record("llm.ttft", delay, label=label)
+
+        await asyncio.gather(turn("a", 0.02), turn("b", 0.01))
+        tracer.record("db.commit", 0.001)
+        self.assertIsNone(tracer.spans[-1]["turn"])
+        # The most recently finished turn, its own span last.
+        last = tracer.turn_spans()
+        self.assertEqual([(s["name"], s["label"]) for s in last], [("llm.ttft", "a"), ("turn", "a")])
+        first = tracer.turn_spans(tracer.spans[0]["turn"])
+        self.assertEqual([(s["name"], s["label"]) for s in first], [("llm.ttft", "b"), ("turn", "b")])
+
+    def test_jsonl_sink(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "traces", "spans.jsonl")
+            tracer = Tracer()
+            tracer.configure({"jsonl": path, "capacity": 10})
+            for i in range(SINK_BATCH + 1):
+                tracer.record("ui.render", 0.001, i=i)
+            with open(path) as f:
+                self.assertEqual(len(f.readlines()), SINK_BATCH)
+            tracer.flush()
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+            self.assertEqual(lines[-1]["i"], SINK_BATCH)
+            self.assertEqual(len(tracer.spans), 10)
+
+            tracer.configure({"enabled": False})
+            tracer.record("ui.render", 0.001)
+            self.assertEqual(len(tracer.spans), 10)
+
+if __name__ == '__main__':
+    unittest.main()
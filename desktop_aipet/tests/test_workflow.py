@@ -5,16 +5,19 @@ import shutil
 from desktop_aipet.src.database import init_db, get_db_path, get_db_connection
 import desktop_aipet.src.scheduler_service as scheduler_service
 from desktop_aipet.src.agent_core import ChatAgent
+from desktop_aipet.src.memory_service import title_generator
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 class TestWorkflow(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self):
         # Ensure DB is clean.
-        if os.path.exists(get_db_path()):
-            try:
-                os.remove(get_db_path())
-            except:
-                pass
+        # Also drop the WAL side files so a stale log isn't replayed into the new DB.
+        for path in (get_db_path(), get_db_path() + '-wal', get_db_path() + '-shm'):
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except:
+                    pass
         await init_db()
 
         # Reset scheduler for the new loop
@@ -22,6 +25,8 @@ class TestWorkflow(unittest.IsolatedAsyncioTestCase):
         scheduler_service.start_scheduler()
 
     async def asyncTearDown(self):
+        # Don't leave the background title worker running into a closed loop.
+        await title_generator.close()
         if scheduler_service.scheduler.running:
             try:
                 scheduler_service.scheduler.shutdown()
@@ -64,8 +69,8 @@ class TestWorkflow(unittest.IsolatedAsyncioTestCase):
         jobs = scheduler_service.scheduler.get_jobs()
         reminder_jobs = [j for j in jobs if "reminder" in str(j.id) or "reminder" in str(j.name)]
         # Our reminder ID is "1" (auto increment), function is trigger_alert.
-        # Check if any job exists that is not daily_summary
-        other_jobs = [j for j in jobs if j.id != 'daily_summary']
+        # Check if any job exists that is not a summary job
+        other_jobs = [j for j in jobs if j.id not in ('daily_summary', 'summary_catch_up')]
         self.assertTrue(len(other_jobs) > 0)
 
 if __name__ == '__main__':